@@ -10,15 +10,35 @@ class BidAdmin(admin.ModelAdmin):
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ("id", "category")
 
+class CategoryStatsAdmin(admin.ModelAdmin):
+    list_display = ("id", "category", "closed", "sold", "bids", "closing_total", "seconds_open")
+
 class CommentAdmin(admin.ModelAdmin):
     list_display = ("id", "listing", "user", "comment", "timestamp")
 
 class ListingAdmin(admin.ModelAdmin):
-    list_display = ("id", "owner", "title", "starting_bid", "category", "timestamp", "active")
+    list_display = ("id", "owner", "title", "starting_bid", "current_price", "bid_count", "category", "timestamp", "ends_at", "active")
+
+class ListingImageAdmin(admin.ModelAdmin):
+    list_display = ("id", "listing", "state", "attempts", "source", "digest", "updated")
+
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "listing", "kind", "bid", "created", "claimed_at", "cursor")
+
+class ProxyBidAdmin(admin.ModelAdmin):
+    list_display = ("id", "listing", "user", "max_amount", "timestamp")
+
+class RollupStateAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "closed_at", "listing_id", "updated")
 
 # Register your models here.
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Bid, BidAdmin)
 admin.site.register(models.Category, CategoryAdmin)
+admin.site.register(models.CategoryStats, CategoryStatsAdmin)
 admin.site.register(models.Comment, CommentAdmin)
-admin.site.register(models.Listing, ListingAdmin)
\ No newline at end of file
+admin.site.register(models.Listing, ListingAdmin)
+admin.site.register(models.ListingImage, ListingImageAdmin)
+admin.site.register(models.OutboxEvent, OutboxEventAdmin)
+admin.site.register(models.ProxyBid, ProxyBidAdmin)
+admin.site.register(models.RollupState, RollupStateAdmin)
\ No newline at end of file
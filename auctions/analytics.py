@@ -0,0 +1,76 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import CategoryStats, Listing, RollupState
+
+
+CATEGORY_STATS = "category_stats"
+
+
+def update_category_stats(batch_size=1000, now=None):
+    # Folds listings closed since the high-water mark into CategoryStats, returning how many were added
+    # Note: closures newer than AUCTIONS_ROLLUP_LAG seconds wait for the next run, so a closure
+    # committed late with an earlier closed_at is not skipped past
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.AUCTIONS_ROLLUP_LAG)
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Locking the mark keeps concurrent runs from folding the same listings twice
+            RollupState.objects.get_or_create(name=CATEGORY_STATS)
+            state = RollupState.objects.select_for_update().get(name=CATEGORY_STATS)
+
+            closed = Listing.objects.filter(closed_at__isnull=False, closed_at__lte=cutoff)
+            if state.closed_at is not None:
+                closed = closed.filter(
+                    Q(closed_at__gt=state.closed_at) | Q(closed_at=state.closed_at, id__gt=state.listing_id)
+                )
+            batch = list(
+                closed.order_by("closed_at", "id")
+                .values("id", "category_id", "timestamp", "closed_at", "current_price", "bid_count")[:batch_size]
+            )
+            if not batch:
+                return total
+
+            for category_id, totals in _totals(batch).items():
+                updated = CategoryStats.objects.filter(category_id=category_id).update(
+                    **{field: F(field) + value for field, value in totals.items()}
+                )
+                if not updated:
+                    CategoryStats.objects.create(category_id=category_id, **totals)
+
+            state.closed_at = batch[-1]["closed_at"]
+            state.listing_id = batch[-1]["id"]
+            state.save()
+            total += len(batch)
+
+def _totals(rows):
+    # Sums a batch of closed listings per category
+    totals = defaultdict(lambda: {"closed": 0, "sold": 0, "bids": 0, "closing_total": Decimal(0), "seconds_open": 0})
+    for row in rows:
+        category = totals[row["category_id"]]
+        category["closed"] += 1
+        category["bids"] += row["bid_count"]
+        category["seconds_open"] += max(0, round((row["closed_at"] - row["timestamp"]).total_seconds()))
+        if row["bid_count"]:
+            category["sold"] += 1
+            category["closing_total"] += row["current_price"]
+    return totals
+
+@transaction.atomic
+def rebuild_category_stats(batch_size=1000, now=None):
+    # Clears the rollup and its mark, then folds in every closed listing again
+    CategoryStats.objects.all().delete()
+    RollupState.objects.filter(name=CATEGORY_STATS).delete()
+    return update_category_stats(batch_size, now)
+
+def category_report():
+    # Rollup rows for the analytics page, plus when they were last brought up to date
+    stats = list(CategoryStats.objects.select_related("category").order_by(F("category__category").asc(nulls_last=True)))
+    state = RollupState.objects.filter(name=CATEGORY_STATS).first()
+    return stats, state.updated if state else None
@@ -0,0 +1,157 @@
+import hashlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import caching
+from .models import Bid, Listing
+from .pagination import KeysetPaginator
+
+
+# Compact output, no whitespace between tokens
+JSON_PARAMS = {"separators": (",", ":")}
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params=JSON_PARAMS)
+
+def _etag(*parts):
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+def _serialize_listing(listing):
+    return {
+        "id": listing.id,
+        "title": listing.title,
+        "description": listing.description,
+        "image_url": listing.image_URL or None,
+        "category": listing.category_id,
+        "starting_bid": listing.starting_bid,
+        "current_price": listing.current_price,
+        "bid_count": listing.bid_count,
+        "active": listing.active,
+        "created": listing.timestamp,
+        "ends_at": listing.ends_at,
+    }
+
+def _listing_state(request, listing_id):
+    # Returns (etag seed, last modified) for a listing, memoised for the request
+    # Note: the newest bid is always the leading bid, so its timestamp is the latest bid
+    states = request.__dict__.setdefault("_listing_states", {})
+    if listing_id not in states:
+        row = (
+            Listing.objects.filter(id=listing_id)
+            .annotate(last_comment=Max("comments__timestamp"))
+            .values("timestamp", "closed_at", "leading_bid__timestamp", "last_comment", "bid_count", "active")
+            .first()
+        )
+        if row is None:
+            states[listing_id] = None
+        else:
+            moments = [row["timestamp"], row["closed_at"], row["leading_bid__timestamp"], row["last_comment"]]
+            last_modified = max(moment for moment in moments if moment is not None)
+            # Cached listing version also covers edits that leave no timestamp
+            seed = _etag(
+                listing_id,
+                last_modified.isoformat(),
+                row["bid_count"],
+                row["active"],
+                caching.listing_version(listing_id)
+            )
+            states[listing_id] = (seed, last_modified)
+    return states[listing_id]
+
+def _listing_etag(request, listing_id, **kwargs):
+    state = _listing_state(request, listing_id)
+    return state and _etag(state[0], request.GET.urlencode())
+
+def _listing_last_modified(request, listing_id, **kwargs):
+    state = _listing_state(request, listing_id)
+    return state and state[1]
+
+def _feed_etag(request, **kwargs):
+    return _etag(caching.feed_state()[0], request.GET.urlencode())
+
+def _feed_last_modified(request, **kwargs):
+    return caching.feed_state()[1]
+
+def _categories_etag(request, **kwargs):
+    return _etag(*[f"{c.id}={c.category}:{c.active_count}" for c in caching.get_category_counts()])
+
+def _page_links(request, page):
+    # Builds next/previous URLs, keeping any filters from the current request
+    def link(name, cursor):
+        query = request.GET.copy()
+        query.pop("after", None)
+        query.pop("before", None)
+        query[name] = cursor
+        return f"{request.path}?{query.urlencode()}"
+
+    return {
+        "next": link("after", page.next_cursor) if page.has_next else None,
+        "previous": link("before", page.previous_cursor) if page.has_previous else None,
+    }
+
+@require_GET
+@condition(etag_func=_feed_etag, last_modified_func=_feed_last_modified)
+def listings(request):
+    # Active listings ordered by title, keyset paginated
+    listings = Listing.objects.filter(active=True)
+    category_id = request.GET.get("category")
+    if category_id:
+        # Only database ids reach the query, anything else is the client's error
+        if not category_id.isdigit() or len(category_id) > 18:
+            return _json({"error": "category must be a category id"}, status=400)
+        listings = listings.filter(category_id=category_id)
+    paginator = KeysetPaginator(listings, ("title", "id"), settings.AUCTIONS_LISTINGS_PER_PAGE)
+    page = paginator.page(after=request.GET.get("after"), before=request.GET.get("before"))
+
+    return _json({
+        "results": [_serialize_listing(listing) for listing in page],
+        "links": _page_links(request, page),
+    })
+
+@require_GET
+@condition(etag_func=_listing_etag, last_modified_func=_listing_last_modified)
+def listing(request, listing_id):
+    listing = Listing.objects.filter(id=listing_id).first()
+    if listing is None:
+        raise Http404("Listing does not exist")
+
+    data = _serialize_listing(listing)
+    data["closed_at"] = listing.closed_at
+    data["winner"] = listing.winner_id
+    return _json(data)
+
+@require_GET
+@condition(etag_func=_listing_etag, last_modified_func=_listing_last_modified)
+def bids(request, listing_id):
+    # Bid history, newest first, keyset paginated
+    if _listing_state(request, listing_id) is None:
+        raise Http404("Listing does not exist")
+    paginator = KeysetPaginator(
+        Bid.objects.filter(listing_id=listing_id),
+        ("-bid_amount", "-id"),
+        settings.AUCTIONS_LISTINGS_PER_PAGE
+    )
+    page = paginator.page(after=request.GET.get("after"), before=request.GET.get("before"))
+
+    return _json({
+        "results": [
+            {"id": bid.id, "bidder": bid.user_id, "amount": bid.bid_amount, "timestamp": bid.timestamp}
+            for bid in page
+        ],
+        "links": _page_links(request, page),
+    })
+
+@require_GET
+@condition(etag_func=_categories_etag)
+def categories(request):
+    return _json({
+        "results": [
+            {"id": category.id, "name": category.category, "active_listings": category.active_count}
+            for category in caching.get_category_counts()
+        ]
+    })
@@ -0,0 +1,167 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+
+from . import caching, views
+from .models import Category, Listing, Watchlist
+from .pagination import KeysetPaginator
+
+
+# Async GET paths for index, categories, listing and watchlist, routed when AUCTIONS_ASYNC_VIEWS is set
+# Note: Django 3.1 has no async ORM, so each independent read runs on a pool thread and they are awaited together
+# Other methods fall through to the sync views in views.py
+
+
+def _read(function):
+    # Runs a blocking ORM or cache call on a pool thread, so independent reads overlap
+    # Note: pool threads hold their own connections, close_old_connections applies CONN_MAX_AGE to them
+    def run(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+# Pages render on the pool too, _visitor has already loaded the session, user and messages
+_render = _read(render)
+
+# Session, user and message loading stay on the request's own thread, as do the sync fallbacks
+@sync_to_async
+def _visitor(request):
+    # Loads the session and user once, later reads of request.user are then free
+    return request.user.is_authenticated, request.user.id, bool(messages.get_messages(request))
+
+@_read
+def _index_page(category_id, after, before):
+    listings = Listing.objects.filter(active=True).select_related('image')
+    if category_id:
+        listings = listings.filter(category_id=category_id)
+    paginator = KeysetPaginator(listings, ("title", "id"), settings.AUCTIONS_LISTINGS_PER_PAGE)
+    return paginator.page(after=after, before=before)
+
+@_read
+def _category(category_id):
+    return get_object_or_404(Category, id=category_id)
+
+async def index(request):
+    if request.method != "GET":
+        return await sync_to_async(views.index)(request)
+
+    # The category and the page of listings do not depend on each other
+    category_id = request.GET.get('category')
+    if category_id:
+        category_id = views._category_id(category_id)
+    # Note: the session is loaded alongside them, rendering would otherwise load it afterwards
+    category, page, _ = await asyncio.gather(
+        _category(category_id) if category_id else asyncio.sleep(0),
+        _index_page(category_id, request.GET.get('after'), request.GET.get('before')),
+        _visitor(request)
+    )
+    return await _render(request, "auctions/index.html", {
+        "listings": page,
+        "category": category
+    })
+
+async def categories(request):
+    categories, _ = await asyncio.gather(_read(caching.get_category_counts)(), _visitor(request))
+    return await _render(request, "auctions/categories.html", {
+        "categories": categories
+    })
+
+@_read
+def _watched(user_id):
+    return list(Listing.objects.filter(watchlist__user_id=user_id).select_related('image').order_by('title'))
+
+async def watchlist(request):
+    if request.method != "GET":
+        return await sync_to_async(views.watchlist)(request)
+
+    authenticated, user_id, has_messages = await _visitor(request)
+    if not authenticated:
+        return redirect_to_login(request.get_full_path(), login_url="/login")
+    return await _render(request, "auctions/watchlist.html", {
+        "watchlist": await _watched(user_id)
+    })
+
+@_read
+def _listing(listing_id):
+    # The current price and leading bid come with the listing, they are denormalised onto it
+    return Listing.objects.select_related('leading_bid', 'image').filter(id=listing_id).first()
+
+@_read
+def _is_watched(user_id, listing_id):
+    if user_id is None:
+        return False
+    return Watchlist.objects.filter(user_id=user_id, listing_id=listing_id).exists()
+
+@_read
+def _detail(listing):
+    return caching.get_listing_fragment(
+        listing.id,
+        caching.listing_cache_key(listing.id, "detail"),
+        lambda: render_to_string("auctions/listing_detail.html", {"listing": listing})
+    )
+
+@_read
+def _comments(request, listing):
+    query = urlencode({
+        "after": request.GET.get('comments_after', ''),
+        "before": request.GET.get('comments_before', '')
+    })
+    return caching.get_listing_fragment(
+        listing.id,
+        caching.listing_cache_key(listing.id, "comments", query),
+        lambda: views._render_comments(request, listing)
+    )
+
+@_read
+def _cached_page(listing_id, query):
+    key = caching.listing_cache_key(listing_id, "page", query)
+    return key, caching.get_listing_page(key)
+
+async def listing(request, listing_id):
+    if request.method != "GET":
+        return await sync_to_async(views.listing)(request, listing_id)
+
+    # Anonymous GETs are served whole from the page cache when possible, as in views.listing
+    authenticated, user_id, has_messages = await _visitor(request)
+    page_key = None
+    if not authenticated and not has_messages:
+        page_key, content = await _cached_page(listing_id, caching.listing_page_query(request.GET))
+        if content is not None:
+            return HttpResponse(content)
+
+    # The listing and the watchlist flag are read together, then both fragments
+    listing, watchlist = await asyncio.gather(
+        _listing(listing_id),
+        _is_watched(user_id, listing_id)
+    )
+    if listing is None:
+        messages.error(request, "Error: Listing does not exist", extra_tags="alert alert-danger")
+        return HttpResponseRedirect(reverse("auctions:index"))
+    listing_detail, listing_comments = await asyncio.gather(_detail(listing), _comments(request, listing))
+
+    response = await _render(request, "auctions/listing.html", {
+        "bid": listing.current_price,
+        "bid_item": listing.leading_bid,
+        "listing": listing,
+        "listing_detail": mark_safe(listing_detail),
+        "listing_comments": mark_safe(listing_comments),
+        "watchlist": watchlist,
+        "form_bid": views.BidForm(),
+        "form_proxy": views.ProxyBidForm(),
+        "form_comment": views.CommentForm(initial={"listing_id": listing.id, "user_id": user_id})
+    })
+    if page_key:
+        await _read(caching.set_listing_page)(listing.id, page_key, response.content)
+    return response
@@ -0,0 +1,480 @@
+import http.client
+import json
+import math
+import platform
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.db import OperationalError, connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.template import Context, Engine, engines
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from . import caching, search
+from .services import BidRejected, accept_bid
+from .models import Bid, Category, Comment, Listing, User, Watchlist
+
+
+VIEWS = ("index", "categories", "listing", "watchlist", "bid")
+
+# Listing counts render_benchmark renders the feed at
+RENDER_SIZES = (1000, 2500, 5000, 10000)
+
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
+# Session engines session_benchmark compares, the first is the baseline
+SESSION_ENGINES = ("db", "cached_db", "signed_cookies")
+SESSION_VIEWS = ("index", "categories", "listing")
+
+# Default volumes for seed_data and benchmark
+SCALE = {
+    "users": 200,
+    "categories": 12,
+    "listings": 2000,
+    "bids": 5,
+    "comments": 3,
+    "watchers": 4,
+}
+
+
+class QueryCounter:
+    # Counts statements through connection.execute_wrapper, cheaper than capturing them
+
+    def __init__(self):
+        self.count = 0
+        self.sessions = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if "django_session" in sql:
+            self.sessions += 1
+        return execute(sql, params, many, context)
+
+@contextmanager
+def test_database():
+    # Runs the block against a throwaway test database, so benchmarks never touch real data
+    database = connection.settings_dict["NAME"]
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        cache.clear()
+        yield
+    finally:
+        connection.creation.destroy_test_db(database, verbosity=0)
+        teardown_test_environment()
+
+def seed(users, categories, listings, bids, comments, watchers, seed=0, batch_size=1000):
+    # Bulk inserts a synthetic marketplace, bids, comments and watchers are per listing
+    # Note: bid state is written directly and the search index rebuilt once at the end
+    generator = random.Random(seed)
+    password = make_password("password")
+
+    with transaction.atomic():
+        first_user = User.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        User.objects.bulk_create(
+            (User(username=f"seed{first_user + i}", email=f"seed{first_user + i}@example.com", password=password)
+             for i in range(users)),
+            batch_size=batch_size
+        )
+        user_ids = list(User.objects.filter(id__gt=first_user).values_list("id", flat=True))
+
+        first_category = Category.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        Category.objects.bulk_create(Category(category=f"Category {first_category + i}") for i in range(categories))
+        category_ids = list(Category.objects.filter(id__gt=first_category).values_list("id", flat=True))
+
+        # Prices are drawn up front so each listing's bid ladder is known before insert
+        first_listing = Listing.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        starting = [Decimal(generator.randint(100, 50000)) / 100 for i in range(listings)]
+        Listing.objects.bulk_create(
+            (Listing(
+                owner_id=generator.choice(user_ids),
+                title=f"{generator.choice(WORDS).title()} {generator.choice(WORDS)} {i}",
+                description=" ".join(generator.choices(WORDS, k=24)),
+                starting_bid=starting[i],
+                current_price=starting[i] + bids,
+                bid_count=bids,
+                category_id=generator.choice(category_ids) if category_ids else None,
+            ) for i in range(listings)),
+            batch_size=batch_size
+        )
+        listing_rows = list(Listing.objects.filter(id__gt=first_listing).values_list("id", "owner_id", "starting_bid"))
+
+        Bid.objects.bulk_create(
+            (Bid(listing_id=id, user_id=_other_user(generator, user_ids, owner), bid_amount=price + step)
+             for id, owner, price in listing_rows for step in range(1, bids + 1)),
+            batch_size=batch_size
+        )
+        Comment.objects.bulk_create(
+            (Comment(listing_id=id, user_id=generator.choice(user_ids), comment=" ".join(generator.choices(WORDS, k=12)))
+             for id, owner, price in listing_rows for i in range(comments)),
+            batch_size=batch_size
+        )
+        Watchlist.objects.bulk_create(
+            (Watchlist(listing_id=id, user_id=user)
+             for id, owner, price in listing_rows
+             for user in generator.sample(user_ids, min(watchers, len(user_ids)))),
+            batch_size=batch_size
+        )
+
+        # The highest bid on each seeded listing is its leading bid
+        top_bid = Bid.objects.filter(listing=OuterRef("pk")).order_by("-bid_amount", "timestamp").values("id")[:1]
+        Listing.objects.filter(id__gt=first_listing, bid_count__gt=0).update(leading_bid_id=Subquery(top_bid))
+
+    search.get_backend().rebuild()
+    caching.invalidate_category_counts()
+    caching.invalidate_category_choices()
+    caching.bump_feed_state()
+    return {"users": len(user_ids), "categories": len(category_ids), "listings": len(listing_rows)}
+
+def _other_user(generator, user_ids, owner):
+    user = generator.choice(user_ids)
+    while user == owner and len(user_ids) > 1:
+        user = generator.choice(user_ids)
+    return user
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+def benchmark(views=VIEWS, requests=200, warmup=20, seed=0):
+    # Drives each view through the test client, returning per-view latency, throughput and query counts
+    # Note: bid POSTs write, so run against a seeded copy rather than live data
+    generator = random.Random(seed)
+    listings = list(Listing.objects.filter(active=True).values_list("id", "owner_id"))
+    # Only the benchmark bids, so prices are tracked here rather than read back per request
+    prices = dict(Listing.objects.filter(active=True).values_list("id", "current_price"))
+    watcher = Watchlist.objects.values_list("user_id", flat=True).first()
+    if not listings or watcher is None:
+        raise ValueError("Seed data first, the benchmark needs listings and watchers")
+    bidders = list(User.objects.order_by("id").values_list("id", flat=True)[:20])
+
+    anonymous = Client()
+    member = Client()
+    member.force_login(User.objects.get(id=watcher))
+    bidding = {}
+    for user in bidders:
+        bidding[user] = Client()
+        bidding[user].force_login(User.objects.get(id=user))
+
+    def bid():
+        listing_id, owner = generator.choice(listings)
+        user = generator.choice([user for user in bidders if user != owner] or bidders)
+        prices[listing_id] += 1
+        return bidding[user].post(
+            reverse("auctions:listing", args=[listing_id]),
+            {"bid_amount": prices[listing_id], "submit_bid": ""}
+        )
+
+    scenarios = {
+        "index": lambda: anonymous.get(reverse("auctions:index")),
+        "categories": lambda: anonymous.get(reverse("auctions:categories")),
+        "listing": lambda: anonymous.get(reverse("auctions:listing", args=[generator.choice(listings)[0]])),
+        "watchlist": lambda: member.get(reverse("auctions:watchlist")),
+        "bid": bid,
+    }
+
+    results = {}
+    for name in views:
+        scenario = scenarios[name]
+        for i in range(warmup):
+            scenario()
+
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(requests):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                begin = time.perf_counter()
+                response = scenario()
+                latencies.append((time.perf_counter() - begin) * 1000)
+            queries.append(counter.count)
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        results[name] = {
+            "requests": requests,
+            "errors": errors,
+            "throughput": requests / elapsed if elapsed else None,
+            "latency_ms": {
+                "mean": statistics.fmean(latencies),
+                "p50": percentile(latencies, 0.50),
+                "p90": percentile(latencies, 0.90),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1],
+            },
+            "queries": {"mean": statistics.fmean(queries), "max": max(queries)},
+        }
+    return results
+
+def write_benchmark(threads=8, bids=100, listings=4):
+    # Concurrent bidders racing accept_bid on a few hot listings, each outbidding the price it last read
+    # Returns throughput, latency percentiles, and counts of accepted, outbid and lock-failed bids
+    owner = User.objects.create_user("write_owner", "owner@example.com", "password")
+    bidders = [User.objects.create_user(f"write_bidder{i}", f"bidder{i}@example.com", "password") for i in range(threads)]
+    listing_ids = [
+        Listing.objects.create(owner=owner, title=f"Hot {i}", description="Contested", starting_bid=Decimal("1.00")).id
+        for i in range(listings)
+    ]
+    outcomes = {"accepted": 0, "outbid": 0, "locked": 0}
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def bid(bidder, seed):
+        generator = random.Random(seed)
+        barrier.wait()
+        try:
+            for i in range(bids):
+                listing_id = generator.choice(listing_ids)
+                begin = time.perf_counter()
+                try:
+                    price = Listing.objects.values_list("current_price", flat=True).get(id=listing_id)
+                    accept_bid(listing_id, bidder.id, price + 1)
+                    outcome = "accepted"
+                except BidRejected:
+                    outcome = "outbid"
+                except OperationalError:
+                    outcome = "locked"
+                elapsed = (time.perf_counter() - begin) * 1000
+                with lock:
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=bid, args=(bidder, i)) for i, bidder in enumerate(bidders)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "threads": threads,
+        "attempted": threads * bids,
+        **outcomes,
+        "accepted_per_second": outcomes["accepted"] / elapsed,
+        "attempts_per_second": threads * bids / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1],
+        },
+    }
+
+def render_benchmark(sizes=RENDER_SIZES, repeat=3, template="auctions/index.html"):
+    # Renders the feed template over growing lists of listings, returning the fastest of repeat runs per size
+    # Modes: "parse" reloads the template and fills no fragments, "cold" uses the cached loader with
+    # an empty fragment cache, "warm" renders every card from the fragment cache
+    # Note: no queries run while timing, listings and their images are fetched up front
+    listings = list(Listing.objects.select_related("image").order_by("id")[:max(sizes)])
+    if len(listings) < max(sizes):
+        raise ValueError(f"Seed at least {max(sizes)} listings first")
+    libraries = engines.all()[0].engine.libraries
+    uncached = Engine(loaders=TEMPLATE_LOADERS, libraries=libraries)
+    cached = Engine(loaders=[("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)], libraries=libraries)
+    cached.get_template(template)
+
+    def render(engine, size, clear):
+        if clear:
+            cache.clear()
+        begin = time.perf_counter()
+        engine.get_template(template).render(Context({"listings": listings[:size]}))
+        return (time.perf_counter() - begin) * 1000
+
+    results = {}
+    for size in sizes:
+        timings = {
+            "parse": min(render(uncached, size, True) for i in range(repeat)),
+            "cold": min(render(cached, size, True) for i in range(repeat)),
+        }
+        render(cached, size, False)
+        timings["warm"] = min(render(cached, size, False) for i in range(repeat))
+        results[size] = {
+            mode: {"ms": ms, "us_per_listing": ms * 1000 / size}
+            for mode, ms in timings.items()
+        }
+    return results
+
+def format_render_report(results):
+    # Per-listing cost staying flat as the size grows means rendering is linear
+    lines = [f"{'listings':>10}" + "".join(f"{mode + ' ms':>12}{'us/listing':>12}" for mode in ("parse", "cold", "warm"))]
+    for size, modes in results.items():
+        lines.append(
+            f"{size:>10}" + "".join(f"{modes[mode]['ms']:>12.1f}{modes[mode]['us_per_listing']:>12.1f}" for mode in ("parse", "cold", "warm"))
+        )
+    return "\n".join(lines)
+
+def session_benchmark(engines=SESSION_ENGINES, views=SESSION_VIEWS, requests=50):
+    # Counts database round trips per GET under each session engine, and how many of them touched django_session
+    # Visitors: "anonymous" sends no cookie, "expired" a session cookie the server no longer knows,
+    # "member" is signed in
+    listing = Listing.objects.filter(active=True).values_list("id", flat=True).first()
+    member = User.objects.order_by("id").first()
+    if listing is None or member is None:
+        raise ValueError("Seed data first, the benchmark needs listings and users")
+    paths = {
+        "index": reverse("auctions:index"),
+        "categories": reverse("auctions:categories"),
+        "listing": reverse("auctions:listing", args=[listing]),
+    }
+
+    results = {}
+    for engine in engines:
+        with override_settings(SESSION_ENGINE=f"django.contrib.sessions.backends.{engine}"):
+            caches[settings.SESSION_CACHE_ALIAS].clear()
+            clients = {"anonymous": Client(), "expired": Client(), "member": Client()}
+            clients["member"].force_login(member)
+            results[engine] = {}
+            for visitor, client in clients.items():
+                results[engine][visitor] = {}
+                for name in views:
+                    # Warms the page and session caches, so each run measures the steady state
+                    client.get(paths[name])
+                    queries = sessions = 0
+                    latencies = []
+                    for i in range(requests):
+                        if visitor == "expired":
+                            client.cookies[settings.SESSION_COOKIE_NAME] = "0" * 32
+                        counter = QueryCounter()
+                        with connection.execute_wrapper(counter):
+                            begin = time.perf_counter()
+                            client.get(paths[name])
+                            latencies.append((time.perf_counter() - begin) * 1000)
+                        queries += counter.count
+                        sessions += counter.sessions
+                    results[engine][visitor][name] = {
+                        "queries": queries / requests,
+                        "session_queries": sessions / requests,
+                        "latency_ms": statistics.fmean(latencies),
+                    }
+    return results
+
+def format_session_report(results):
+    # Queries per request under each engine, with the round trips saved against the first engine
+    engines = list(results)
+    baseline = results[engines[0]]
+    lines = [f"{'visitor':<12}{'view':<12}" + "".join(f"{engine + ' queries':>24}{'saved':>8}" for engine in engines)]
+    for visitor, views in baseline.items():
+        for name in views:
+            row = f"{visitor:<12}{name:<12}"
+            for engine in engines:
+                result = results[engine][visitor][name]
+                queries = f"{result['queries']:.1f} ({result['session_queries']:.1f} session)"
+                row += f"{queries:>24}{baseline[visitor][name]['queries'] - result['queries']:>8.1f}"
+            lines.append(row)
+    return "\n".join(lines)
+
+def http_benchmark(host, port, paths, requests=200, concurrency=8, headers=None, seed=0):
+    # Drives a running server over HTTP from concurrent client threads, a fresh connection per request
+    # paths maps a view name to a function taking a random.Random and returning the path to request
+    results = {}
+    for name, path in paths.items():
+        generator = random.Random(seed)
+        queue = [path(generator) for i in range(requests)]
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def client():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    target = queue.pop()
+                begin = time.perf_counter()
+                try:
+                    connection = http.client.HTTPConnection(host, port, timeout=60)
+                    connection.request("GET", target, headers=headers or {})
+                    response = connection.getresponse()
+                    response.read()
+                    connection.close()
+                    failed = response.status >= 400
+                except OSError:
+                    failed = True
+                elapsed = (time.perf_counter() - begin) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    errors.append(failed)
+
+        workers = [threading.Thread(target=client) for i in range(concurrency)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        results[name] = {
+            "requests": requests,
+            "concurrency": concurrency,
+            "errors": sum(errors),
+            "throughput": requests / elapsed,
+            "latency_ms": {
+                "mean": statistics.fmean(latencies),
+                "p50": percentile(latencies, 0.50),
+                "p90": percentile(latencies, 0.90),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1],
+            },
+        }
+    return results
+
+def environment():
+    settings_dict = connection.settings_dict
+    profile = {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "conn_max_age": settings_dict["CONN_MAX_AGE"],
+    }
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            profile["journal_mode"] = cursor.fetchone()[0]
+            cursor.execute("PRAGMA synchronous")
+            profile["synchronous"] = cursor.fetchone()[0]
+    return profile
+
+def format_report(results):
+    # Plain text table, one row per view
+    lines = [f"{'view':<12}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'queries':>10}{'errors':>8}"]
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        lines.append(
+            f"{name:<12}{result['throughput']:>10.1f}{latency['p50']:>10.2f}{latency['p90']:>10.2f}"
+            f"{latency['p99']:>10.2f}{result['queries']['mean']:>10.1f}{result['errors']:>8}"
+        )
+    return "\n".join(lines)
+
+def dump(report, path):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+WORDS = (
+    "antique vintage oak walnut brass silver leather wool cotton linen ceramic glass clock lamp chair "
+    "table desk shelf mirror rug print painting camera guitar piano violin record radio watch ring "
+    "necklace bracelet book atlas map globe kettle teapot vase bowl plate jug stool bench cabinet"
+).split()
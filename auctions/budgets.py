@@ -0,0 +1,183 @@
+import io
+import json
+import os
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import images, urls
+from .benchmarking import seed
+from .models import Listing, ListingImage, User, Watchlist
+
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), "query_budgets.json")
+
+# Milliseconds allowed for a cold request when a budget does not set its own
+DEFAULT_MS = 500
+
+# Data volumes each URL is measured at, smallest first
+SCALES = [
+    {"users": 6, "categories": 2, "listings": 10, "bids": 2, "comments": 2, "watchers": 2},
+    {"users": 12, "categories": 8, "listings": 80, "bids": 8, "comments": 8, "watchers": 4},
+]
+
+# Every URL in auctions/urls.py, as (case, URL name, role, args, query string)
+# Note: args are names of fixtures picked after seeding, role is None for anonymous requests
+CASES = [
+    ("index", "index", None, [], ""),
+    ("index:category", "index", None, [], "category={category}"),
+    ("login", "login", None, [], ""),
+    ("logout", "logout", "member", [], ""),
+    ("register", "register", None, [], ""),
+    ("user", "user", "member", [], ""),
+    ("categories", "categories", None, [], ""),
+    ("analytics", "analytics", None, [], ""),
+    ("search", "search", None, [], "q=antique"),
+    ("metrics", "metrics", None, [], ""),
+    ("create", "create", "member", [], ""),
+    ("import", "import", "member", [], ""),
+    ("export:listings", "export", "staff", ["listings"], ""),
+    ("export:bids", "export", "staff", ["bids"], ""),
+    ("export:comments", "export", "staff", ["comments"], ""),
+    ("watchlist", "watchlist", "member", [], ""),
+    ("listing", "listing", None, ["{listing}"], ""),
+    ("listing:member", "listing", "member", ["{listing}"], ""),
+    ("bid_history", "bid_history", None, ["{listing}"], ""),
+    ("thumbnail", "thumbnail", None, ["{digest}", "card", "jpg"], ""),
+    ("api_listings", "api_listings", None, [], ""),
+    ("api_listing", "api_listing", None, ["{listing}"], ""),
+    ("api_bids", "api_bids", None, ["{listing}"], ""),
+    ("api_categories", "api_categories", None, [], ""),
+]
+
+
+def uncovered_urls():
+    # URL names with no case, so new views cannot skip the guard
+    covered = {name for case, name, role, args, query in CASES}
+    return sorted(pattern.name for pattern in urls.urlpatterns if pattern.name not in covered)
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as file:
+        return json.load(file)
+
+def write_budgets(measurements, path=BUDGETS_PATH):
+    # Records query counts at the largest scale, keeping any hand-tuned time budgets
+    previous = load_budgets(path) if os.path.exists(path) else {}
+    budgets = {
+        case: {"queries": result["queries"], "ms": previous.get(case, {}).get("ms", DEFAULT_MS)}
+        for case, result in measurements[-1].items()
+    }
+    with open(path, "w") as file:
+        json.dump(budgets, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+def measure_scales(scales=SCALES):
+    # Measures every case at each scale, rolling the seeded data back in between
+    measurements = []
+    for scale in scales:
+        with transaction.atomic():
+            seed(**scale)
+            measurements.append(measure())
+            transaction.set_rollback(True)
+    return measurements
+
+def measure():
+    # Thumbnails are written to a scratch media directory
+    with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+        return _measure()
+
+def _thumbnail(listing):
+    # Uploads an image and runs the worker over it, returning its digest
+    # Note: without Pillow the worker cannot run, so the thumbnail is stored as it would have written it
+    if not images.available():
+        digest = images.store_original(b"budget image")
+        images.store_thumbnail(digest, "card", "jpg", b"budget thumbnail")
+        ListingImage.objects.create(listing=listing, digest=digest, state=ListingImage.READY)
+        return digest
+    buffer = io.BytesIO()
+    images.Image.new("RGB", (640, 480), "white").save(buffer, "JPEG")
+    images.queue_upload(listing, buffer.getvalue())
+    images.process_pending()
+    image = ListingImage.objects.get(listing=listing)
+    if image.state != ListingImage.READY:
+        raise images.ImageError(f"Budget image was not processed: {image.error}")
+    return image.digest
+
+def _measure():
+    # Cold requests, with the cache cleared first so counts never depend on earlier requests
+    member = User.objects.create_user("budget_member", "member@example.com", "password")
+    staff = User.objects.create_user("budget_staff", "staff@example.com", "password", is_staff=True)
+    listing = Listing.objects.order_by("id").first()
+    # The member owns a listing and watches every listing, so their pages grow with the data
+    Listing.objects.filter(id=listing.id).update(owner=member)
+    Watchlist.objects.bulk_create(Watchlist(listing_id=id, user=member) for id in Listing.objects.values_list("id", flat=True))
+    # Every listing shows a thumbnail, so feeds render the image path
+    digest = _thumbnail(listing)
+    ListingImage.objects.bulk_create(
+        ListingImage(listing_id=id, digest=digest, state=ListingImage.READY)
+        for id in Listing.objects.exclude(id=listing.id).values_list("id", flat=True)
+    )
+    fixtures = {"listing": listing.id, "category": listing.category_id, "digest": digest}
+    users = {"member": member, "staff": staff}
+
+    results = {}
+    for case, name, role, args, query in CASES:
+        client = Client()
+        if role:
+            client.force_login(users[role])
+        url = reverse(f"auctions:{name}", args=[arg.format(**fixtures) for arg in args])
+        if query:
+            url = f"{url}?{query.format(**fixtures)}"
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            begin = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = (time.perf_counter() - begin) * 1000
+        results[case] = {
+            "url": url,
+            "status": response.status_code,
+            "queries": len(queries),
+            "ms": elapsed,
+            "sql": [query["sql"] for query in queries],
+        }
+    return results
+
+def check(measurements, budgets, timing=False):
+    # Returns a failure message per case that grows with the data or exceeds its budget
+    # Note: time budgets depend on machine load, so they are only checked when timing is asked for
+    failures = []
+    smallest, largest = measurements[0], measurements[-1]
+    for case, result in largest.items():
+        problems = []
+        if result["status"] >= 400:
+            problems.append(f"returned {result['status']}")
+        if result["queries"] > smallest[case]["queries"]:
+            problems.append(f"queries grew with data from {smallest[case]['queries']} to {result['queries']}")
+        budget = budgets.get(case)
+        if budget is None:
+            problems.append("has no budget in query_budgets.json")
+        else:
+            if result["queries"] > budget["queries"]:
+                problems.append(f"ran {result['queries']} queries, budget is {budget['queries']}")
+            if timing and result["ms"] > budget["ms"]:
+                problems.append(f"took {result['ms']:.0f}ms, budget is {budget['ms']}ms")
+        if problems:
+            sql = "\n".join(f"    {statement}" for statement in result["sql"])
+            failures.append(f"{case} ({result['url']}) {', '.join(problems)}\n{sql}")
+    return failures
+
+def format_table(measurements):
+    header = f"{'case':<20}" + "".join(f"{'scale ' + str(i + 1):>12}" for i in range(len(measurements))) + f"{'ms':>10}"
+    lines = [header]
+    for case in measurements[-1]:
+        counts = "".join(f"{scale[case]['queries']:>12}" for scale in measurements)
+        lines.append(f"{case:<20}{counts}{measurements[-1][case]['ms']:>10.1f}")
+    return "\n".join(lines)
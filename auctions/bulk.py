@@ -0,0 +1,159 @@
+import csv
+import json
+
+from django import forms
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Bid, Category, Comment, Listing
+from .signals import listings_created
+
+
+FORMATS = ("csv", "jsonl")
+
+# Exported columns as (column, lookup), listing exports can be imported again
+EXPORTS = {
+    "listings": (Listing, [
+        ("id", "id"), ("owner", "owner__username"), ("title", "title"), ("description", "description"),
+        ("starting_bid", "starting_bid"), ("current_price", "current_price"), ("bid_count", "bid_count"),
+        ("image_URL", "image_URL"), ("category", "category__category"), ("timestamp", "timestamp"),
+        ("ends_at", "ends_at"), ("active", "active"),
+    ]),
+    "bids": (Bid, [
+        ("id", "id"), ("listing", "listing_id"), ("bidder", "user__username"),
+        ("bid_amount", "bid_amount"), ("timestamp", "timestamp"),
+    ]),
+    "comments": (Comment, [
+        ("id", "id"), ("listing", "listing_id"), ("user", "user__username"),
+        ("comment", "comment"), ("timestamp", "timestamp"),
+    ]),
+}
+
+
+class ListingRowForm(forms.Form):
+    # Validates one imported row, category is given by name
+    title = forms.CharField(max_length=100)
+    description = forms.CharField()
+    starting_bid = forms.DecimalField(min_value=0.01, max_digits=8, decimal_places=2)
+    image_URL = forms.URLField(required=False)
+    category = forms.CharField(required=False)
+    ends_at = forms.DateTimeField(required=False)
+
+class ImportReport:
+    # Running totals for an import, errors are passed on rather than kept
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+
+def detect_format(filename, default="csv"):
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return extension if extension in FORMATS else default
+
+def read_rows(lines, format):
+    # Yields (line number, row dict) from an iterable of text lines
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == "jsonl":
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = error
+            yield number, row
+    else:
+        raise ValueError(f"Unknown format: {format}")
+
+def import_listings(rows, owner, on_error, chunk_size=None):
+    # Streams rows into Listing with chunked bulk inserts
+    # Calls on_error(line, message) for each rejected row and returns an ImportReport
+    # Note: only one chunk is held in memory, so large files import in flat memory
+    chunk_size = chunk_size or settings.AUCTIONS_IMPORT_CHUNK_SIZE
+    report = ImportReport()
+    categories = {name.lower(): id for id, name in Category.objects.values_list("id", "category")}
+    chunk = []
+
+    for line, row in rows:
+        listing, error = _build_listing(row, owner, categories)
+        if error:
+            report.failed += 1
+            on_error(line, error)
+            continue
+        chunk.append(listing)
+        if len(chunk) >= chunk_size:
+            report.created += _insert(chunk, owner)
+            chunk = []
+    report.created += _insert(chunk, owner)
+    return report
+
+def _build_listing(row, owner, categories):
+    # Returns (unsaved listing, None) or (None, error message)
+    if not isinstance(row, dict):
+        return None, f"Invalid row: {row}"
+    form = ListingRowForm(row)
+    if not form.is_valid():
+        errors = "; ".join(f"{field}: {' '.join(messages)}" for field, messages in form.errors.items())
+        return None, errors
+
+    data = form.cleaned_data
+    category_id = None
+    if data["category"]:
+        category_id = categories.get(data["category"].lower())
+        if category_id is None:
+            return None, f"category: Unknown category {data['category']}"
+
+    # bulk_create skips save(), so the denormalised price is set here
+    return Listing(
+        owner_id=owner.id,
+        title=data["title"],
+        description=data["description"],
+        starting_bid=data["starting_bid"],
+        current_price=data["starting_bid"],
+        image_URL=data["image_URL"],
+        category_id=category_id,
+        ends_at=data["ends_at"],
+    ), None
+
+def _insert(chunk, owner):
+    # Inserts one chunk and announces it, as bulk_create sends no post_save
+    if not chunk:
+        return 0
+    with transaction.atomic():
+        high_water = Listing.objects.filter(owner_id=owner.id).order_by("-id").values_list("id", flat=True).first() or 0
+        created = Listing.objects.bulk_create(chunk)
+        ids = [listing.id for listing in created if listing.id is not None]
+        if len(ids) != len(created):
+            # Backends that cannot return ids from bulk inserts, e.g. SQLite
+            ids = list(Listing.objects.filter(owner_id=owner.id, id__gt=high_water).values_list("id", flat=True))
+        listings_created.send(sender=Listing, listing_ids=ids)
+    return len(created)
+
+class Echo:
+    # Pseudo-buffer so csv.writer hands each formatted line straight back
+
+    def write(self, value):
+        return value
+
+def export_rows(kind, format, chunk_size=2000):
+    # Yields the export one line at a time, reading the table in chunks
+    model, columns = EXPORTS[kind]
+    names = [name for name, lookup in columns]
+    rows = model.objects.order_by("id").values_list(*[lookup for name, lookup in columns])
+    rows = rows.iterator(chunk_size=chunk_size)
+
+    if format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow(row)
+    elif format == "jsonl":
+        encoder = DjangoJSONEncoder(separators=(",", ":"))
+        for row in rows:
+            yield encoder.encode(dict(zip(names, row))) + "\n"
+    else:
+        raise ValueError(f"Unknown format: {format}")
@@ -0,0 +1,147 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.db.models import Count, Q
+
+from .models import Category
+
+
+CATEGORY_COUNTS_KEY = "auctions:category_counts"
+FEED_STATE_KEY = "auctions:feed_state"
+
+# Query parameters that change a listing page, others are left out of its cache key
+LISTING_PAGE_PARAMS = ("comments_after", "comments_before")
+
+# Process-local category choices, shared by every form in this worker
+_category_choices = {"choices": None, "expires": 0}
+_category_choices_lock = threading.Lock()
+
+
+def get_category_counts():
+    # Returns categories annotated with their active listing count
+    # Note: cleared when a listing or category changes, and at most AUCTIONS_CATEGORY_COUNTS_TTL seconds old
+    # if an invalidation is missed
+    categories = cache.get(CATEGORY_COUNTS_KEY)
+    if categories is None:
+        categories = list(
+            Category.objects.annotate(
+                active_count=Count("listings", filter=Q(listings__active=True))
+            ).order_by("category")
+        )
+        cache.set(CATEGORY_COUNTS_KEY, categories, settings.AUCTIONS_CATEGORY_COUNTS_TTL)
+    return categories
+
+def invalidate_category_counts():
+    cache.delete(CATEGORY_COUNTS_KEY)
+
+def get_category_choices():
+    # Returns (id, name) choices for category select fields
+    # Note: held per process for AUCTIONS_CATEGORY_CHOICES_TTL seconds, signals clear it sooner
+    with _category_choices_lock:
+        if _category_choices["choices"] is None or _category_choices["expires"] <= time.monotonic():
+            _category_choices["choices"] = list(
+                Category.objects.order_by("category").values_list("id", "category")
+            )
+            _category_choices["expires"] = time.monotonic() + settings.AUCTIONS_CATEGORY_CHOICES_TTL
+        return [(None, "Please select...")] + _category_choices["choices"]
+
+def invalidate_category_choices():
+    with _category_choices_lock:
+        _category_choices["choices"] = None
+
+def process_local():
+    # True when the default cache is this process's own, so bumps made here never reach the web workers
+    return isinstance(caches["default"], LocMemCache)
+
+def process_local_warning():
+    return (
+        "The default cache is local to this process, so web workers keep serving cached listing pages "
+        f"for up to {settings.AUCTIONS_LISTING_CACHE_TIMEOUT}s after changes made here. "
+        "Set AUCTIONS_CACHE_BACKEND to a shared cache."
+    )
+
+def listing_version(listing_id):
+    # Current cache version for a listing, replaced whenever it changes
+    # Note: versions are random tokens rather than counters, so a version key evicted and recreated
+    # can never match pages still cached under an earlier version
+    key = f"auctions:listing:{listing_id}:version"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+def bump_listing_version(listing_id):
+    # Orphans every cached page and fragment for the listing
+    cache.set(f"auctions:listing:{listing_id}:version", uuid.uuid4().hex, None)
+    # Marks the listing unsettled until replicas have had time to catch up
+    if settings.AUCTIONS_DB_REPLICAS:
+        cache.set(f"auctions:listing:{listing_id}:changed", True, settings.AUCTIONS_REPLICA_PIN_SECONDS)
+
+def listing_settled(listing_id):
+    # False shortly after a change, while a replica read could still return the old rows
+    # Note: content read then is served but not cached, or it would outlive the lag under the new version
+    return not settings.AUCTIONS_DB_REPLICAS or cache.get(f"auctions:listing:{listing_id}:changed") is None
+
+def listing_cache_key(listing_id, name, query=""):
+    # Builds a versioned key, query strings are hashed to bound key length
+    digest = hashlib.md5(query.encode()).hexdigest()
+    return f"auctions:listing:{listing_id}:v{listing_version(listing_id)}:{name}:{digest}"
+
+def listing_page_query(params):
+    # Only the parameters that change the page, so junk query strings cannot fill the cache
+    return urlencode([(name, params[name]) for name in LISTING_PAGE_PARAMS if params.get(name)])
+
+def get_listing_page(key):
+    # Returns cached anonymous page content, counting the hit or miss
+    content = cache.get(key)
+    record_lookup("listing_page", content is not None)
+    return content
+
+def set_listing_page(listing_id, key, content):
+    if listing_settled(listing_id):
+        cache.set(key, content, settings.AUCTIONS_LISTING_CACHE_TIMEOUT)
+
+def get_listing_fragment(listing_id, key, render):
+    # Returns a cached fragment, rendering and storing it on a miss
+    content = cache.get(key)
+    record_lookup("listing_fragment", content is not None)
+    if content is None:
+        content = render()
+        if listing_settled(listing_id):
+            cache.set(key, content, settings.AUCTIONS_LISTING_CACHE_TIMEOUT)
+    return content
+
+def record_lookup(name, hit):
+    key = f"auctions:stats:{name}:{'hits' if hit else 'misses'}"
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+def cache_stats(name):
+    # Returns hit and miss counters for a cache, e.g. "listing_page"
+    return {
+        "hits": cache.get(f"auctions:stats:{name}:hits", 0),
+        "misses": cache.get(f"auctions:stats:{name}:misses", 0),
+    }
+
+def feed_state():
+    # Returns (version, last modified) for the active listing feed
+    # Note: a lost entry is recreated as new, so clients revalidate rather than go stale
+    state = cache.get(FEED_STATE_KEY)
+    if state is None:
+        cache.add(FEED_STATE_KEY, (uuid.uuid4().hex, timezone.now()), None)
+        state = cache.get(FEED_STATE_KEY)
+    return state
+
+def bump_feed_state():
+    cache.set(FEED_STATE_KEY, (uuid.uuid4().hex, timezone.now()), None)
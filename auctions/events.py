@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = re.compile(r"^/listing/(?P<listing_id>\d+)/events$")
+
+
+class Subscription:
+    # A single subscriber's queue, bound to the event loop that reads it
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop, slow subscribers drop messages rather than grow
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.warning("Dropped event for slow subscriber on %s", self.channel)
+
+    async def get(self):
+        return await self.queue.get()
+
+class InProcessBackend:
+    # Fans messages out to subscribers within this process
+    # Note: publish is thread safe, so sync views and workers can call it directly
+    # Single process only, events published by another worker or a management command never arrive
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel, self.maxsize)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # Subscriber's loop has closed
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    # Returns the configured AUCTIONS_EVENT_BACKEND, created once per process
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.AUCTIONS_EVENT_BACKEND)()
+        return _backend
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+def publish(listing_id, event, data):
+    # Publishes an event to everyone watching the listing
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return get_backend().publish(listing_channel(listing_id), message)
+
+async def listing_events(scope, receive, send, listing_id):
+    # Streams a listing's events as Server-Sent Events until the client disconnects
+    backend = get_backend()
+    subscription = backend.subscribe(listing_channel(listing_id))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            while True:
+                message = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {message, disconnect},
+                    timeout=settings.AUCTIONS_EVENT_KEEPALIVE,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnect in done:
+                    message.cancel()
+                    break
+                if message in done:
+                    body = message.result().encode()
+                else:
+                    # Comment lines keep idle connections open through proxies
+                    message.cancel()
+                    body = b": keepalive\n\n"
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        finally:
+            disconnect.cancel()
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        backend.unsubscribe(subscription)
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+def event_stream_router(application):
+    # Wraps the Django ASGI application, serving listing event streams directly
+    # Note: streams bypass Django so an idle watcher holds no worker thread
+    async def router(scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            match = EVENTS_PATH.match(scope["path"])
+            if match:
+                return await listing_events(scope, receive, send, int(match.group("listing_id")))
+        return await application(scope, receive, send)
+    return router
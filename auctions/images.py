@@ -0,0 +1,206 @@
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching
+from .models import Listing, ListingImage
+
+
+logger = logging.getLogger(__name__)
+
+# Pillow is optional, without it images are queued but never processed
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+
+# Claimed images not finished in this time are assumed abandoned by a crashed worker
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class ImageError(Exception):
+    pass
+
+def available():
+    return Image is not None
+
+def original_path(digest):
+    return os.path.join(settings.MEDIA_ROOT, "originals", digest[:2], digest)
+
+def thumbnail_path(digest, size, format):
+    return os.path.join(settings.MEDIA_ROOT, "thumbnails", digest[:2], f"{digest}-{size}.{format}")
+
+def _write(path, data):
+    # Writes through a temporary file, so readers never see a partial image
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+def store_original(data):
+    # Stores image bytes by content, returning their digest
+    digest = hashlib.sha256(data).hexdigest()
+    path = original_path(digest)
+    if not os.path.exists(path):
+        _write(path, data)
+    return digest
+
+def store_thumbnail(digest, size, format, data):
+    # Stores encoded thumbnail bytes where the thumbnail view serves them
+    _write(thumbnail_path(digest, size, format), data)
+
+def _check_url(url):
+    # Only public http(s) hosts, so listing URLs cannot reach internal services
+    # Note: AUCTIONS_IMAGE_ALLOW_PRIVATE_HOSTS lifts the address check for local testing
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ImageError(f"Unsupported image URL {url}")
+    if settings.AUCTIONS_IMAGE_ALLOW_PRIVATE_HOSTS:
+        return
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or 80)
+    except (socket.gaierror, UnicodeError) as error:
+        raise ImageError(f"Unknown host {parts.hostname}") from error
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0].split("%")[0]).is_global:
+            raise ImageError(f"Host {parts.hostname} is not public")
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    # Applies the same URL check to every redirect
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+_opener = urllib.request.build_opener(_CheckedRedirects)
+
+def fetch(url):
+    _check_url(url)
+    request = urllib.request.Request(url, headers={"User-Agent": "commerce-thumbnailer"})
+    limit = settings.AUCTIONS_IMAGE_MAX_BYTES
+    try:
+        with _opener.open(request, timeout=settings.AUCTIONS_IMAGE_FETCH_TIMEOUT) as response:
+            data = response.read(limit + 1)
+    except (urllib.error.URLError, OSError, ValueError) as error:
+        raise ImageError(f"Could not fetch {url}: {error}") from error
+    if len(data) > limit:
+        raise ImageError(f"Image is larger than {limit} bytes")
+    return data
+
+def make_thumbnails(digest):
+    # Writes each configured size in every format, skipping files that already exist
+    wanted = [
+        (size, format)
+        for size in settings.AUCTIONS_THUMBNAIL_SIZES
+        for format in FORMATS
+        if not os.path.exists(thumbnail_path(digest, size, format))
+    ]
+    if not wanted:
+        return
+    try:
+        with Image.open(original_path(digest)) as original:
+            if original.width * original.height > settings.AUCTIONS_IMAGE_MAX_PIXELS:
+                raise ImageError(f"Image is larger than {settings.AUCTIONS_IMAGE_MAX_PIXELS} pixels")
+            image = ImageOps.exif_transpose(original).convert("RGB")
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ImageError(f"Not a readable image: {error}") from error
+
+    for size, format in wanted:
+        thumbnail = image.copy()
+        thumbnail.thumbnail(settings.AUCTIONS_THUMBNAIL_SIZES[size], Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, FORMATS[format][0], quality=settings.AUCTIONS_THUMBNAIL_QUALITY, optimize=True)
+        store_thumbnail(digest, size, format, buffer.getvalue())
+
+def _original_for(image):
+    # Reuses an original already fetched from the same URL, fetching only when none exists
+    if image.digest:
+        return image.digest
+    known = (
+        ListingImage.objects.filter(source=image.source, state=ListingImage.READY)
+        .exclude(digest="")
+        .values_list("digest", flat=True)
+        .first()
+    )
+    if known and os.path.exists(original_path(known)):
+        return known
+    return store_original(fetch(image.source))
+
+def process_pending(batch_size=20):
+    # Fetches and thumbnails queued images, returning how many were processed
+    # Note: each image is claimed with a conditional update, so workers can run side by side
+    if not available():
+        raise ImageError("Pillow is required to process images")
+    now = timezone.now()
+    claimable = Q(state=ListingImage.PENDING) | Q(state=ListingImage.PROCESSING, updated__lt=now - CLAIM_TIMEOUT)
+    ids = list(ListingImage.objects.filter(claimable).order_by("updated").values_list("id", flat=True)[:batch_size])
+
+    processed = 0
+    for id in ids:
+        if not ListingImage.objects.filter(claimable, id=id).update(state=ListingImage.PROCESSING, updated=now):
+            continue
+        image = ListingImage.objects.get(id=id)
+        try:
+            digest = _original_for(image)
+            make_thumbnails(digest)
+        except Exception as error:
+            # Anything unexpected fails this image alone, so one bad file cannot stall the queue
+            if not isinstance(error, ImageError):
+                logger.exception("Could not process image %s", id)
+            attempts = image.attempts + 1
+            ListingImage.objects.filter(id=id).update(
+                state=ListingImage.FAILED if attempts >= settings.AUCTIONS_IMAGE_MAX_ATTEMPTS else ListingImage.PENDING,
+                attempts=attempts,
+                error=str(error)[:200],
+                updated=timezone.now()
+            )
+        else:
+            ListingImage.objects.filter(id=id).update(
+                state=ListingImage.READY,
+                digest=digest,
+                error="",
+                updated=timezone.now()
+            )
+            # Cached listing pages still show the placeholder
+            caching.bump_listing_version(image.listing_id)
+        processed += 1
+    return processed
+
+def queue_image(listing):
+    # Queues the listing's image URL unless it is already queued or processed
+    if listing.image_URL and not ListingImage.objects.filter(listing_id=listing.id, source=listing.image_URL).exists():
+        ListingImage.objects.update_or_create(
+            listing_id=listing.id,
+            defaults={"source": listing.image_URL, "digest": "", "state": ListingImage.PENDING, "attempts": 0, "error": ""}
+        )
+
+def queue_created(listing_ids):
+    # Bulk form of queue_image for newly inserted listings
+    ListingImage.objects.bulk_create(
+        ListingImage(listing_id=id, source=url)
+        for id, url in Listing.objects.filter(id__in=listing_ids).exclude(image_URL="").values_list("id", "image_URL")
+    )
+
+def queue_upload(listing, data):
+    # Stores an uploaded original straight away, the worker only needs to resize it
+    digest = store_original(data)
+    ListingImage.objects.update_or_create(
+        listing_id=listing.id,
+        defaults={"source": "", "digest": digest, "state": ListingImage.PENDING, "attempts": 0, "error": ""}
+    )
@@ -0,0 +1,146 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+
+# Bucket upper bounds, in seconds, queries and bytes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+
+
+class RequestStats:
+    # Timings gathered while one request is handled
+
+    __slots__ = ("queries", "db_time", "template_time", "rendering")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+_current = ContextVar("auctions_request_stats", default=None)
+
+def current_stats():
+    return _current.get()
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection, counting toward the request bound in this context if any
+    # Note: context variables follow sync_to_async, so queries async views run on other threads count too
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.record_query(execute, sql, params, many, context)
+
+def bind(stats):
+    return _current.set(stats)
+
+def unbind(token):
+    _current.reset(token)
+
+def _format_labels(pairs):
+    # Prometheus label syntax, escaping backslashes, quotes and newlines
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}" if escaped else ""
+
+class Histogram:
+    # Cumulative histogram keyed by label values, safe to observe from any thread
+
+    def __init__(self, name, help, buckets, labels=("view",)):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, amount):
+        index = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += amount
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((values, [list(counts), total, count]) for values, (counts, total, count) in self._series.items())
+        for values, (counts, total, count) in series:
+            pairs = list(zip(self.labels, values))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+class Counter:
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.labels, labels)))} {value}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+# Note: metrics are held per process, so each worker is scraped separately
+REQUESTS = Counter("auctions_requests_total", "Requests handled, by view and status code", ("view", "status"))
+REQUEST_DURATION = Histogram("auctions_request_duration_seconds", "Time spent handling each request", DURATION_BUCKETS)
+DB_DURATION = Histogram("auctions_db_duration_seconds", "Time spent in SQL queries per request", DURATION_BUCKETS)
+DB_QUERIES = Histogram("auctions_db_queries", "SQL queries run per request", QUERY_BUCKETS)
+TEMPLATE_DURATION = Histogram("auctions_template_duration_seconds", "Time spent rendering templates per request", DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram("auctions_response_size_bytes", "Size of each response body", SIZE_BUCKETS)
+METRICS = (REQUESTS, REQUEST_DURATION, DB_DURATION, DB_QUERIES, TEMPLATE_DURATION, RESPONSE_SIZE)
+
+def record(view, status, duration, stats, size):
+    REQUESTS.inc((view, str(status)))
+    REQUEST_DURATION.observe((view,), duration)
+    DB_DURATION.observe((view,), stats.db_time)
+    DB_QUERIES.observe((view,), stats.queries)
+    TEMPLATE_DURATION.observe((view,), stats.template_time)
+    if size is not None:
+        RESPONSE_SIZE.observe((view,), size)
+
+def render():
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+def reset():
+    for metric in METRICS:
+        metric.reset()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarking import SCALE, VIEWS, benchmark, dump, environment, format_report, seed, test_database
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the main views against a freshly seeded test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--views", nargs="+", choices=VIEWS, default=list(VIEWS))
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per view")
+        parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per view")
+        parser.add_argument("--users", type=int, default=SCALE["users"])
+        parser.add_argument("--categories", type=int, default=SCALE["categories"])
+        parser.add_argument("--listings", type=int, default=SCALE["listings"])
+        parser.add_argument("--bids", type=int, default=SCALE["bids"], help="Bids per listing")
+        parser.add_argument("--comments", type=int, default=SCALE["comments"], help="Comments per listing")
+        parser.add_argument("--watchers", type=int, default=SCALE["watchers"], help="Watchers per listing")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        # Bid POSTs write, so the run gets its own seeded test database
+        scale = {name: options[name] for name in SCALE}
+        with test_database():
+            seed(seed=options["seed"], **scale)
+            results = benchmark(options["views"], options["requests"], options["warmup"], options["seed"])
+
+        report = {"environment": environment(), "scale": scale, "views": results}
+        self.stdout.write(format_report(results))
+        if options["json"]:
+            dump(report, options["json"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json']}"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarking import RENDER_SIZES, dump, environment, format_render_report, render_benchmark, seed, test_database
+from auctions.models import Listing, ListingImage
+
+
+class Command(BaseCommand):
+    help = "Times the listing feed template at growing listing counts against a freshly seeded test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=list(RENDER_SIZES), help="Listing counts to render")
+        parser.add_argument("--repeat", type=int, default=3, help="Renders per size and mode, the fastest is kept")
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        with test_database():
+            seed(users=50, categories=12, listings=max(options["sizes"]), bids=2, comments=0, watchers=0)
+            # Every card shows a thumbnail, the costlier path
+            ListingImage.objects.bulk_create(
+                (ListingImage(listing_id=id, digest=f"{id:064x}", state=ListingImage.READY)
+                 for id in Listing.objects.values_list("id", flat=True)),
+                batch_size=1000
+            )
+            results = render_benchmark(options["sizes"], options["repeat"])
+            report = {"environment": environment(), "render": results}
+
+        self.stdout.write(format_render_report(results))
+        if options["json"]:
+            dump(report, options["json"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json']}"))
@@ -0,0 +1,195 @@
+import http.client
+import importlib.util
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.benchmarking import dump, environment, http_benchmark
+
+
+# Each server runs in its own process against the same seeded database
+SERVERS = {
+    "wsgi": ("runserver", False),
+    "asgi": ("uvicorn", False),
+    "asgi-async": ("uvicorn", True),
+}
+
+READ_VIEWS = ("index", "categories", "listing", "watchlist")
+
+# Starts a server with a fixed delay added to every query, standing in for a database across a network
+# Note: installed in the server process only, the application itself has no such hook
+# Arguments: delay in milliseconds, then the server command, "manage.py" or a module run as __main__
+DELAYED_SERVER = """
+import runpy, sys, time
+from django.db.backends.signals import connection_created
+
+delay = float(sys.argv[1]) / 1000
+target, sys.argv = sys.argv[2], sys.argv[2:]
+
+def delay_query(execute, sql, params, many, context):
+    time.sleep(delay)
+    return execute(sql, params, many, context)
+
+def install_delay(sender, connection, **kwargs):
+    connection.execute_wrappers.append(delay_query)
+
+connection_created.connect(install_delay, weak=False)
+if target == "manage.py":
+    runpy.run_path(target, run_name="__main__")
+else:
+    runpy.run_module(target, run_name="__main__", alter_sys=True)
+"""
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the read views under the WSGI development server and under uvicorn, with sync and async views"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", nargs="+", choices=SERVERS, default=list(SERVERS))
+        parser.add_argument("--views", nargs="+", choices=READ_VIEWS, default=list(READ_VIEWS))
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent clients")
+        parser.add_argument("--requests", type=int, default=400, help="Requests per view at each concurrency")
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument("--query-delay-ms", type=float, default=0, help="Latency added to every query, as from a remote database")
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        # Note: the servers need a database they can all open, so this runs against a scratch SQLite file
+        if settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("benchmark_servers seeds a scratch SQLite database, unset AUCTIONS_DB_ENGINE")
+        if importlib.util.find_spec("uvicorn") is None and any(SERVERS[name][0] == "uvicorn" for name in options["servers"]):
+            raise CommandError("uvicorn is required for the ASGI runs, pip install uvicorn")
+
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "benchmark.sqlite3")
+            env = {
+                **os.environ,
+                "AUCTIONS_DB_NAME": database,
+                "AUCTIONS_DB_REPLICAS": "",
+                "AUCTIONS_DEBUG": "0",
+                "AUCTIONS_ALLOWED_HOSTS": "127.0.0.1",
+            }
+            self.manage(env, "migrate", "--verbosity", "0")
+            self.manage(env, "seed_data", "--listings", str(options["listings"]), "--users", str(max(options["listings"] // 10, 10)))
+            listings, member = self.fixtures(database)
+            paths = {
+                "index": lambda generator: "/",
+                "categories": lambda generator: "/categories",
+                "listing": lambda generator: f"/listing/{generator.choice(listings)}",
+                "watchlist": lambda generator: "/watchlist",
+            }
+            paths = {name: paths[name] for name in options["views"]}
+
+            results = {}
+            for name in options["servers"]:
+                server, async_views = SERVERS[name]
+                port = self.free_port()
+                process = self.start(server, port, {**env, "AUCTIONS_ASYNC_VIEWS": "1" if async_views else "0"}, options["query_delay_ms"])
+                try:
+                    self.wait_until_ready(port, process)
+                    headers = {"Cookie": self.login(port, member)}
+                    results[name] = {
+                        concurrency: http_benchmark("127.0.0.1", port, paths, options["requests"], concurrency, headers)
+                        for concurrency in options["concurrency"]
+                    }
+                finally:
+                    process.terminate()
+                    process.wait()
+
+        report = {
+            "environment": environment(),
+            "listings": options["listings"],
+            "query_delay_ms": options["query_delay_ms"],
+            "servers": results,
+        }
+        self.stdout.write(self.format_report(results, options["views"], options["concurrency"]))
+        if options["json"]:
+            dump(report, options["json"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json']}"))
+
+    def manage(self, env, *args):
+        subprocess.run([sys.executable, "manage.py", *args], cwd=settings.BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    def fixtures(self, database):
+        # Read straight from the scratch file, this process is connected to its own database
+        with sqlite3.connect(database) as connection:
+            listings = [row[0] for row in connection.execute("SELECT id FROM auctions_listing WHERE active")]
+            member = connection.execute(
+                "SELECT username FROM auctions_user JOIN auctions_watchlist ON auctions_watchlist.user_id = auctions_user.id LIMIT 1"
+            ).fetchone()[0]
+        return listings, member
+
+    def free_port(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            return probe.getsockname()[1]
+
+    def start(self, server, port, env, query_delay_ms=0):
+        if server == "uvicorn":
+            command = ["uvicorn", "commerce.asgi:application", "--port", str(port), "--log-level", "warning", "--no-access-log"]
+        else:
+            command = ["manage.py", "runserver", "--noreload", f"127.0.0.1:{port}"]
+        if query_delay_ms:
+            command = [sys.executable, "-c", DELAYED_SERVER, str(query_delay_ms)] + command
+        elif server == "uvicorn":
+            command = [sys.executable, "-m"] + command
+        else:
+            command = [sys.executable] + command
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_until_ready(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with status {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError(f"Server did not start listening on port {port}")
+
+    def login(self, port, username):
+        # Signs in through the login form, returning the cookies for the member's requests
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", "/login")
+        response = connection.getresponse()
+        response.read()
+        token = response.getheader("Set-Cookie").split("csrftoken=")[1].split(";")[0]
+        connection.close()
+
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        body = urllib.parse.urlencode({"username": username, "password": "password", "csrfmiddlewaretoken": token})
+        connection.request("POST", "/login", body, {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Cookie": f"csrftoken={token}",
+            "Referer": f"http://127.0.0.1:{port}/login",
+        })
+        response = connection.getresponse()
+        response.read()
+        session = [cookie.split(";")[0] for cookie in response.headers.get_all("Set-Cookie", []) if cookie.startswith("sessionid=")]
+        connection.close()
+        if not session:
+            raise CommandError(f"Could not sign in as {username}")
+        return "; ".join([f"csrftoken={token}"] + session)
+
+    def format_report(self, results, views, concurrencies):
+        servers = list(results)
+        lines = [f"{'view':<12}{'clients':>8}" + "".join(f"{name + ' req/s':>18}{'p99 ms':>10}" for name in servers)]
+        for view in views:
+            for concurrency in concurrencies:
+                row = f"{view:<12}{concurrency:>8}"
+                for name in servers:
+                    result = results[name][concurrency][view]
+                    errors = f" ({result['errors']} errors)" if result["errors"] else ""
+                    row += f"{result['throughput']:>18.1f}{result['latency_ms']['p99']:>10.1f}{errors}"
+                lines.append(row)
+        return "\n".join(lines)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarking import (
+    SESSION_ENGINES, SESSION_VIEWS, dump, environment, format_session_report, seed, session_benchmark, test_database
+)
+
+
+class Command(BaseCommand):
+    help = "Counts the database round trips per request under each session engine against a freshly seeded test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--engines", nargs="+", choices=["db", "cached_db", "cache", "signed_cookies"], default=list(SESSION_ENGINES))
+        parser.add_argument("--views", nargs="+", choices=SESSION_VIEWS, default=list(SESSION_VIEWS))
+        parser.add_argument("--requests", type=int, default=50, help="Requests per view and visitor")
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        with test_database():
+            seed(users=50, categories=12, listings=200, bids=3, comments=3, watchers=2)
+            results = session_benchmark(options["engines"], options["views"], options["requests"])
+            report = {"environment": environment(), "sessions": results}
+
+        self.stdout.write(format_session_report(results))
+        if options["json"]:
+            dump(report, options["json"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json']}"))
@@ -0,0 +1,37 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarking import dump, environment, test_database, write_benchmark
+
+
+class Command(BaseCommand):
+    help = "Measures bid write throughput under concurrent bidders for the configured database profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16], help="Concurrent bidders per run")
+        parser.add_argument("--bids", type=int, default=100, help="Bids placed by each bidder")
+        parser.add_argument("--listings", type=int, default=4, help="Listings the bidders compete over")
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        # Compare profiles by running once per environment, e.g. with AUCTIONS_SQLITE_WAL=1 or AUCTIONS_SQLITE_TUNING=0
+        runs = []
+        with test_database():
+            profile = environment()
+            for threads in options["threads"]:
+                runs.append(write_benchmark(threads, options["bids"], options["listings"]))
+                # Each run starts from an empty database
+                call_command("flush", interactive=False, verbosity=0)
+
+        self.stdout.write(", ".join(f"{name}={value}" for name, value in profile.items()))
+        self.stdout.write(f"{'threads':>8}{'bids/s':>10}{'tries/s':>10}{'accepted':>10}{'outbid':>8}{'locked':>8}{'p50 ms':>9}{'p99 ms':>9}")
+        for run in runs:
+            self.stdout.write(
+                f"{run['threads']:>8}{run['accepted_per_second']:>10.1f}{run['attempts_per_second']:>10.1f}"
+                f"{run['accepted']:>10}{run['outbid']:>8}{run['locked']:>8}"
+                f"{run['latency_ms']['p50']:>9.2f}{run['latency_ms']['p99']:>9.2f}"
+            )
+        if options["json"]:
+            dump({"environment": profile, "runs": runs}, options["json"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json']}"))
+
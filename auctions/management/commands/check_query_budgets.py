@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.benchmarking import test_database
+from auctions.budgets import BUDGETS_PATH, check, format_table, load_budgets, measure_scales, write_budgets
+
+
+class Command(BaseCommand):
+    help = "Measures queries and time for every URL at several data scales, checking them against query_budgets.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--write",
+            action="store_true",
+            help="Record the measured query counts as the new budgets"
+        )
+        parser.add_argument(
+            "--timing",
+            action="store_true",
+            help="Also fail URLs slower than their time budget, only meaningful on an otherwise idle machine"
+        )
+
+    def handle(self, *args, **options):
+        with test_database():
+            measurements = measure_scales()
+        self.stdout.write(format_table(measurements))
+
+        if options["write"]:
+            write_budgets(measurements)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {BUDGETS_PATH}"))
+            return
+
+        failures = check(measurements, load_budgets(), timing=options["timing"])
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("All URLs within budget"))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from auctions import caching
+from auctions.services import close_expired_listings
+
+
+class Command(BaseCommand):
+    help = "Closes auctions whose end time has passed, recording each winner"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of listings closed per transaction"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, checking for expired auctions every interval"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10,
+            help="Seconds between checks when looping"
+        )
+
+    def handle(self, *args, **options):
+        # Closures invalidate cached pages through the cache, which must be shared with the web workers
+        if caching.process_local():
+            self.stderr.write(caching.process_local_warning())
+        while True:
+            closed = close_expired_listings(batch_size=options["batch_size"])
+            if closed or not options["loop"]:
+                self.stdout.write(f"Closed {closed} expired auction(s)")
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
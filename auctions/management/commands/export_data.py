@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from auctions.bulk import EXPORTS, FORMATS, export_rows
+
+
+class Command(BaseCommand):
+    help = "Streams listings, bids or comments to CSV or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", help="File to write, standard output when omitted")
+
+    def handle(self, *args, **options):
+        rows = export_rows(options["kind"], options["format"])
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as file:
+                file.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending="")
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bulk import FORMATS, detect_format, import_listings, read_rows
+from auctions.models import User
+
+
+class Command(BaseCommand):
+    help = "Imports listings from a CSV or JSON Lines file, reporting each rejected row"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for standard input")
+        parser.add_argument("--owner", required=True, help="Username that will own the listings")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="File format, detected from the file name when omitted"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Number of listings inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(username=options["owner"]).first()
+        if owner is None:
+            raise CommandError(f"User {options['owner']} does not exist")
+
+        def on_error(line, message):
+            self.stderr.write(f"Line {line}: {message}")
+
+        path = options["path"]
+        format = options["format"] or detect_format(path)
+        if path == "-":
+            report = import_listings(read_rows(sys.stdin, format), owner, on_error, options["chunk_size"])
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as file:
+                report = import_listings(read_rows(file, format), owner, on_error, options["chunk_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {report.created} listing(s), {report.failed} rejected"))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from auctions import caching
+from auctions.images import available, process_pending
+
+
+class Command(BaseCommand):
+    help = "Fetches queued listing images and writes their thumbnails"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Number of images claimed per pass"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, checking for queued images every interval"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between checks when looping"
+        )
+
+    def handle(self, *args, **options):
+        if not available():
+            raise CommandError("Pillow is required to process images, install it with pip install Pillow")
+        # Finished thumbnails reach cached pages through version bumps, which need a cache shared with the web workers
+        if caching.process_local():
+            self.stderr.write(caching.process_local_warning())
+        while True:
+            processed = process_pending(batch_size=options["batch_size"])
+            if processed or not options["loop"]:
+                self.stdout.write(f"Processed {processed} image(s)")
+            if not options["loop"]:
+                return
+            # A full batch suggests more are waiting
+            if processed < options["batch_size"]:
+                close_old_connections()
+                time.sleep(options["interval"])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.services import rebuild_bid_state
+
+
+class Command(BaseCommand):
+    help = "Rebuilds each listing's current price, leading bid and bid count from the Bid table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Report listings that are out of sync without repairing them"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of listings read per database round trip"
+        )
+
+    def handle(self, *args, **options):
+        stale = rebuild_bid_state(fix=not options["verify"], batch_size=options["batch_size"])
+
+        if not stale:
+            self.stdout.write(self.style.SUCCESS("All listings are in sync"))
+        elif options["verify"]:
+            raise CommandError(f"{len(stale)} listing(s) out of sync: {', '.join(map(str, stale))}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(stale)} listing(s)"))
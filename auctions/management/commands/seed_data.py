@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarking import SCALE, seed
+
+
+class Command(BaseCommand):
+    help = "Seeds synthetic users, categories, listings, bids, comments and watchers with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=SCALE["users"])
+        parser.add_argument("--categories", type=int, default=SCALE["categories"])
+        parser.add_argument("--listings", type=int, default=SCALE["listings"])
+        parser.add_argument("--bids", type=int, default=SCALE["bids"], help="Bids per listing")
+        parser.add_argument("--comments", type=int, default=SCALE["comments"], help="Comments per listing")
+        parser.add_argument("--watchers", type=int, default=SCALE["watchers"], help="Watchers per listing")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, equal seeds give equal data")
+
+    def handle(self, *args, **options):
+        created = seed(
+            users=options["users"],
+            categories=options["categories"],
+            listings=options["listings"],
+            bids=options["bids"],
+            comments=options["comments"],
+            watchers=options["watchers"],
+            seed=options["seed"]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {created['users']} user(s), {created['categories']} categories and {created['listings']} listing(s)"
+        ))
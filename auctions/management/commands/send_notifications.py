@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from auctions.notifications import drain
+
+
+class Command(BaseCommand):
+    help = "Sends watchlist notifications for bids and closures waiting in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of outbox events claimed per pass"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of watchers notified per delivery"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, checking the outbox every interval"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds between checks when looping"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent = drain(batch_size=options["batch_size"], chunk_size=options["chunk_size"])
+            if sent or not options["loop"]:
+                self.stdout.write(f"Sent notifications for {sent} event(s)")
+            if not options["loop"]:
+                return
+            # A full batch suggests more are waiting
+            if sent < options["batch_size"]:
+                close_old_connections()
+                time.sleep(options["interval"])
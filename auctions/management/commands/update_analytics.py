@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from auctions.analytics import rebuild_category_stats, update_category_stats
+
+
+class Command(BaseCommand):
+    help = "Folds auctions closed since the last run into the category analytics rollup"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of closed listings folded in per transaction"
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute the rollup from every closed listing"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, folding in new closures every interval"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60,
+            help="Seconds between runs when looping"
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            added = rebuild_category_stats(batch_size=options["batch_size"])
+            self.stdout.write(f"Rebuilt analytics from {added} closed auction(s)")
+            if not options["loop"]:
+                return
+        while True:
+            added = update_category_stats(batch_size=options["batch_size"])
+            if added or not options["loop"]:
+                self.stdout.write(f"Added {added} closed auction(s) to analytics")
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,102 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import instrumentation, routers
+
+
+class PerformanceMiddleware:
+    # Records time, SQL and template cost for each request, by URL name
+    # Note: keep first in MIDDLEWARE so the session and auth queries are counted too
+    # Works in both modes, so async views under ASGI are not pushed back onto a thread
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function, so Django calls it without a thread
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = instrumentation.RequestStats()
+        token = instrumentation.bind(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.unbind(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = instrumentation.RequestStats()
+        token = instrumentation.bind(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.unbind(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def finish(self, request, response, stats, duration):
+        # Unresolved URLs share one label so 404 scans cannot grow the metrics
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        # Streamed bodies are produced after this returns, so have no size here
+        size = None if response.streaming else len(response.content)
+        instrumentation.record(view, response.status_code, duration, stats, size)
+
+        if settings.AUCTIONS_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f"template;dur={stats.template_time * 1000:.1f}, "
+                f"total;dur={duration * 1000:.1f}"
+            )
+        return response
+
+class ReplicaPinningMiddleware:
+    # Read-your-writes for replicas: after a request writes, the client's reads use the primary
+    # Note: a cookie carries the pin, so it follows the client across workers for AUCTIONS_REPLICA_PIN_SECONDS
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state = routers.RequestState(pinned=settings.AUCTIONS_REPLICA_PIN_COOKIE in request.COOKIES)
+        token = routers.bind(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.unbind(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = routers.RequestState(pinned=settings.AUCTIONS_REPLICA_PIN_COOKIE in request.COOKIES)
+        token = routers.bind(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.unbind(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote and settings.AUCTIONS_DB_REPLICAS:
+            response.set_cookie(
+                settings.AUCTIONS_REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.AUCTIONS_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax"
+            )
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_bid_state(apps, schema_editor):
+    # Seeds the denormalised bid state from existing bids
+    Bid = apps.get_model('auctions', 'Bid')
+    Listing = apps.get_model('auctions', 'Listing')
+    for listing in Listing.objects.all().iterator():
+        bids = Bid.objects.filter(listing_id=listing.id)
+        leading_bid = bids.order_by('-bid_amount', 'timestamp').first()
+        listing.leading_bid = leading_bid
+        listing.current_price = leading_bid.bid_amount if leading_bid else listing.starting_bid
+        listing.bid_count = bids.count()
+        listing.save(update_fields=['leading_bid', 'current_price', 'bid_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0006_remove_bid_is_winner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='leading_bid',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.bid'),
+        ),
+        migrations.RunPython(populate_bid_state, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['active', 'current_price'], name='listing_active_price_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_watchlist(apps, schema_editor):
+    # Keeps the earliest entry for each user/listing pair ahead of the unique constraint
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    duplicates = (
+        Watchlist.objects.values('user_id', 'listing_id')
+        .annotate(keep=Min('id'), entries=Count('id'))
+        .filter(entries__gt=1)
+    )
+    for duplicate in duplicates:
+        Watchlist.objects.filter(
+            user_id=duplicate['user_id'],
+            listing_id=duplicate['listing_id'],
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_listing_current_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-bid_amount'], name='bid_listing_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', 'timestamp'], name='comment_listing_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['title'], name='listing_active_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['category', 'title'], name='listing_active_cat_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_watchlist, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='watchlist_user_listing_unique'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Builds the FTS5 index of active listings, SQLite only
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS auctions_listing_fts "
+        "USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO auctions_listing_fts (rowid, title, description) "
+        "SELECT id, title, description FROM auctions_listing WHERE active"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS auctions_listing_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_past_winners(apps, schema_editor):
+    # Listings closed before winners were recorded are won by their leading bidder
+    Listing = apps.get_model('auctions', 'Listing')
+    for listing in Listing.objects.filter(active=False, leading_bid__isnull=False).select_related('leading_bid'):
+        listing.winner_id = listing.leading_bid.user_id
+        listing.save(update_fields=['winner'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_listing_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='winner',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='won_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(record_past_winners, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(active=True), fields=['ends_at'], name='listing_active_ends_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listing_ends_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proxy_bids', to='auctions.listing')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='proxy_bids', to=settings.AUTH_USER_MODEL, verbose_name='Bidder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='proxybid',
+            index=models.Index(fields=['listing', '-max_amount', 'timestamp'], name='proxybid_listing_max_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='proxybid',
+            constraint=models.UniqueConstraint(fields=('listing', 'user'), name='proxybid_listing_user_unique'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def queue_existing_images(apps, schema_editor):
+    # Existing image URLs are fetched once by the process_images worker
+    Listing = apps.get_model('auctions', 'Listing')
+    ListingImage = apps.get_model('auctions', 'ListingImage')
+    ListingImage.objects.bulk_create(
+        ListingImage(listing_id=id, source=url)
+        for id, url in Listing.objects.exclude(image_URL='').values_list('id', 'image_URL')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_proxybid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.URLField(blank=True)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='image', to='auctions.listing')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listingimage',
+            index=models.Index(fields=['state', 'updated'], name='listingimage_state_idx'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_listingimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('closed', models.PositiveIntegerField(default=0)),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('bids', models.PositiveBigIntegerField(default=0)),
+                ('closing_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('seconds_open', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40, unique=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('listing_id', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(closed_at__isnull=False), fields=['closed_at', 'id'], name='listing_closed_idx'),
+        ),
+        migrations.AddField(
+            model_name='categorystats',
+            name='category',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='auctions.category'),
+        ),
+    ]
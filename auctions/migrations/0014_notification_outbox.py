@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_category_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bid', 'Bid'), ('closed', 'Closed')], max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('claim', models.CharField(blank=True, max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('cursor', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['listing', 'user'], name='watchlist_listing_user_idx'),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='bid',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.bid'),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.listing'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 
 
 class Bid(models.Model):
@@ -17,6 +21,11 @@ class Bid(models.Model):
     bid_amount = models.DecimalField(max_digits=8, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "-bid_amount"], name="bid_listing_amount_idx"),
+        ]
+
     def __str__(self):
         return(f"{self.user}: {self.bid_amount}")
 
@@ -26,6 +35,38 @@ class Category(models.Model):
     def __str__(self):
         return(self.category)
 
+class CategoryStats(models.Model):
+    # Closed auction totals per category, maintained by analytics.update_category_stats
+    # Note: one row has no category, for listings closed without one
+    category = models.OneToOneField(
+        'Category',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="stats"
+    )
+    closed = models.PositiveIntegerField(default=0)
+    sold = models.PositiveIntegerField(default=0)
+    bids = models.PositiveBigIntegerField(default=0)
+    closing_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    seconds_open = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return(f"{self.category or 'Uncategorised'}: {self.closed} closed")
+
+    @property
+    def average_closing_price(self):
+        # Over auctions that sold, unsold ones have no closing price
+        return self.closing_total / self.sold if self.sold else None
+
+    @property
+    def bids_per_auction(self):
+        return self.bids / self.closed if self.closed else None
+
+    @property
+    def average_time_to_close(self):
+        return timedelta(seconds=round(self.seconds_open / self.closed)) if self.closed else None
+
 class Comment(models.Model):
     listing = models.ForeignKey(
         'Listing',
@@ -40,9 +81,36 @@ class Comment(models.Model):
     comment = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "timestamp"], name="comment_listing_time_idx"),
+        ]
+
     def __str__(self):
         return(f"{self.user} on {self.listing}")
 
+class ListingQuerySet(models.QuerySet):
+    # Annotates each listing with its highest bid, leading bidder and current price
+    # Note: subqueries keep feeds to a single query regardless of listing count
+    def with_current_bid(self):
+        top_bid = Bid.objects.filter(listing=OuterRef("pk")).order_by("-bid_amount", "timestamp")
+        return self.annotate(
+            leading_bid_amount=Subquery(top_bid.values("bid_amount")[:1]),
+            leading_bidder_id=Subquery(top_bid.values("user_id")[:1]),
+        ).annotate(
+            current_bid=Coalesce(F("leading_bid_amount"), F("starting_bid"))
+        )
+
+    # Adds the leading bid id and bid count, used to verify denormalised bid state
+    def with_bid_state(self):
+        bids = Bid.objects.filter(listing=OuterRef("pk"))
+        top_bid = bids.order_by("-bid_amount", "timestamp")
+        bid_count = bids.order_by().values("listing").annotate(total=Count("id")).values("total")
+        return self.with_current_bid().annotate(
+            top_bid_id=Subquery(top_bid.values("id")[:1]),
+            total_bids=Coalesce(Subquery(bid_count), 0),
+        )
+
 class Listing(models.Model):
     owner = models.ForeignKey(
         'User',
@@ -63,9 +131,150 @@ class Listing(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     active = models.BooleanField(default=True)
 
+    # Timed auctions close once ends_at passes, see services.close_expired_listings
+    ends_at = models.DateTimeField(blank=True, null=True)
+    closed_at = models.DateTimeField(blank=True, null=True, editable=False)
+    winner = models.ForeignKey(
+        'User',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name="won_listings"
+    )
+
+    # Denormalised bid state, maintained by services.accept_bid
+    # Note: rebuild with the rebuild_listing_prices management command
+    current_price = models.DecimalField(max_digits=8, decimal_places=2, editable=False)
+    leading_bid = models.ForeignKey(
+        'Bid',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name="+"
+    )
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["active", "current_price"], name="listing_active_price_idx"),
+            # Partial indexes covering the active listing feeds
+            models.Index(fields=["title"], condition=Q(active=True), name="listing_active_title_idx"),
+            models.Index(fields=["category", "title"], condition=Q(active=True), name="listing_active_cat_idx"),
+            # Due-time scan for the expiry scheduler
+            models.Index(fields=["ends_at"], condition=Q(active=True), name="listing_active_ends_idx"),
+            # Closure order, read past the rollup high-water mark
+            models.Index(fields=["closed_at", "id"], condition=Q(closed_at__isnull=False), name="listing_closed_idx"),
+        ]
+
     def __str__(self):
         return(f"{self.owner}: {self.title}")
 
+    def save(self, *args, **kwargs):
+        # New listings start at the starting bid until a bid is accepted
+        if self.current_price is None:
+            self.current_price = self.starting_bid
+        super().save(*args, **kwargs)
+
+class ListingImage(models.Model):
+    # Thumbnails of a listing's image, generated by the process_images worker
+    # Note: files are named by the SHA-256 of the original, so a shared image is stored once
+    PENDING = "pending"
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+    STATES = [(PENDING, "Pending"), (PROCESSING, "Processing"), (READY, "Ready"), (FAILED, "Failed")]
+
+    listing = models.OneToOneField(
+        'Listing',
+        on_delete=models.CASCADE,
+        related_name="image"
+    )
+    # URL the original was fetched from, blank for uploads
+    source = models.URLField(blank=True)
+    digest = models.CharField(max_length=64, blank=True)
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=200, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "updated"], name="listingimage_state_idx"),
+        ]
+
+    def __str__(self):
+        return(f"{self.listing}: {self.state}")
+
+class OutboxEvent(models.Model):
+    # Bids and closures awaiting notification, drained by the send_notifications worker
+    # Note: written in the same transaction as the bid or closure, so none is lost or sent for a rollback
+    BID = "bid"
+    CLOSED = "closed"
+    KINDS = [(BID, "Bid"), (CLOSED, "Closed")]
+
+    listing = models.ForeignKey(
+        'Listing',
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    bid = models.ForeignKey(
+        'Bid',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="+"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    # Set by the worker that claimed the event, and the last watcher it has notified
+    claim = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    cursor = models.PositiveIntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return(f"{self.listing_id}: {self.kind}")
+
+class ProxyBid(models.Model):
+    # A bidder's maximum, bid on their behalf by services.place_proxy_bid
+    listing = models.ForeignKey(
+        'Listing',
+        on_delete=models.CASCADE,
+        related_name="proxy_bids"
+    )
+    user = models.ForeignKey(
+        'User',
+        on_delete=models.PROTECT,
+        verbose_name="Bidder",
+        related_name="proxy_bids"
+    )
+    max_amount = models.DecimalField(max_digits=8, decimal_places=2)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "user"], name="proxybid_listing_user_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["listing", "-max_amount", "timestamp"], name="proxybid_listing_max_idx"),
+        ]
+
+    def __str__(self):
+        return(f"{self.user}: up to {self.max_amount}")
+
+class RollupState(models.Model):
+    # High-water mark of a rollup, the (closed_at, id) of the last listing folded in
+    name = models.CharField(max_length=40, unique=True)
+    closed_at = models.DateTimeField(blank=True, null=True)
+    listing_id = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return(f"{self.name}: {self.closed_at}")
+
 class User(AbstractUser):
     pass
 
@@ -80,5 +289,14 @@ class Watchlist(models.Model):
         related_name="watchlist"
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "listing"], name="watchlist_user_listing_unique"),
+        ]
+        indexes = [
+            # Watchers of a listing in user order, for the notification fan-out
+            models.Index(fields=["listing", "user"], name="watchlist_listing_user_idx"),
+        ]
+
     def __str__(self):
         return(f"{self.user}: {self.listing}")
\ No newline at end of file
@@ -0,0 +1,182 @@
+import json
+import logging
+import sys
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Bid, Listing, OutboxEvent, Watchlist
+
+
+logger = logging.getLogger(__name__)
+
+# Notification kinds, per recipient
+OUTBID = "outbid"
+NEW_BID = "new_bid"
+WON = "won"
+CLOSED = "closed"
+
+# Claimed events not finished in this time are assumed abandoned by a crashed worker
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class Notification:
+    __slots__ = ("user_id", "kind", "listing_id", "title", "amount")
+
+    def __init__(self, user_id, kind, listing_id, title, amount=None):
+        self.user_id = user_id
+        self.kind = kind
+        self.listing_id = listing_id
+        self.title = title
+        self.amount = amount
+
+    def as_dict(self):
+        return {
+            "user": self.user_id,
+            "kind": self.kind,
+            "listing": self.listing_id,
+            "title": self.title,
+            "amount": None if self.amount is None else f"{self.amount:.2f}",
+        }
+
+class ConsoleBackend:
+    # Writes each notification to stdout as a line of JSON
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send_many(self, notifications):
+        for notification in notifications:
+            self.stream.write(json.dumps(notification.as_dict()) + "\n")
+        self.stream.flush()
+
+class FileBackend:
+    # Appends each notification to AUCTIONS_NOTIFICATION_FILE as a line of JSON
+
+    def __init__(self, path=None):
+        self.path = path or settings.AUCTIONS_NOTIFICATION_FILE
+
+    def send_many(self, notifications):
+        with open(self.path, "a") as file:
+            file.writelines(json.dumps(notification.as_dict()) + "\n" for notification in notifications)
+
+# Notifications sent through LocmemBackend, for tests
+outbox = []
+
+class LocmemBackend:
+    # Keeps notifications in the module's outbox list
+
+    def send_many(self, notifications):
+        outbox.extend(notifications)
+
+def get_backend():
+    # Created per drain, as mail connections are, so settings overrides take effect
+    return import_string(settings.AUCTIONS_NOTIFICATION_BACKEND)()
+
+def queue_bid(listing_id, bid):
+    OutboxEvent.objects.create(listing_id=listing_id, kind=OutboxEvent.BID, bid=bid)
+
+def queue_closed(listing_id):
+    OutboxEvent.objects.create(listing_id=listing_id, kind=OutboxEvent.CLOSED)
+
+def _claim(batch_size, now):
+    # Claims the oldest unclaimed events with a conditional update, so workers can run side by side
+    claimable = Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT)
+    ids = list(OutboxEvent.objects.filter(claimable).order_by("id").values_list("id", flat=True)[:batch_size])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    OutboxEvent.objects.filter(claimable, id__in=ids).update(claim=claim, claimed_at=now)
+    return list(OutboxEvent.objects.filter(claim=claim).select_related("bid").order_by("id"))
+
+def drain(batch_size=100, chunk_size=1000, backend=None, now=None):
+    # Fans claimed events out to their recipients, returning how many events were sent
+    # Note: delivery is at least once, an event whose worker dies resumes from its last chunk
+    events = _claim(batch_size, now or timezone.now())
+    if not events:
+        return 0
+    backend = backend or get_backend()
+
+    # Watchers hear about the newest bid on each listing in the batch, every outbid bidder still hears
+    newest_bids = {event.listing_id: event.id for event in events if event.kind == OutboxEvent.BID}
+    listings = {
+        listing["id"]: listing
+        for listing in Listing.objects.filter(id__in={event.listing_id for event in events}).values("id", "title", "winner_id", "current_price")
+    }
+
+    sent = 0
+    for event in events:
+        try:
+            watchers = event.kind == OutboxEvent.CLOSED or newest_bids[event.listing_id] == event.id
+            _fan_out(event, listings[event.listing_id], watchers, chunk_size, backend)
+        except Exception:
+            # Left claimed, the event is retried once the claim times out
+            logger.exception("Could not send notifications for outbox event %s", event.id)
+            continue
+        OutboxEvent.objects.filter(id=event.id, claim=event.claim).delete()
+        sent += 1
+    return sent
+
+def _fan_out(event, listing, watchers, chunk_size, backend):
+    # Sends the event's direct notification first, then its watchers in chunks of user ids
+    # Note: the cursor is saved after each chunk, so a watcher count in the hundreds of thousands
+    # never has to be redelivered from the start
+    direct = {}
+    if event.kind == OutboxEvent.BID:
+        amount = event.bid.bid_amount
+        previous = (
+            Bid.objects.filter(listing_id=event.listing_id, bid_amount__lt=amount)
+            .order_by("-bid_amount", "-id")
+            .values_list("user_id", flat=True)
+            .first()
+        )
+        if previous is not None and previous != event.bid.user_id:
+            direct[previous] = OUTBID
+        skip = {event.bid.user_id, *direct}
+        kind = NEW_BID
+    else:
+        amount = listing["current_price"]
+        if listing["winner_id"] is not None:
+            direct[listing["winner_id"]] = WON
+        skip = set(direct)
+        kind = CLOSED
+
+    def notify(user_ids, kind_for):
+        backend.send_many([
+            Notification(user_id, kind_for(user_id), listing["id"], listing["title"], amount) for user_id in user_ids
+        ])
+
+    cursor = event.cursor
+    if cursor is None:
+        if direct:
+            notify(direct, direct.get)
+        cursor = 0
+        if not _save_cursor(event, cursor):
+            return
+    if not watchers:
+        return
+
+    recipients = (
+        Watchlist.objects.filter(listing_id=event.listing_id)
+        .exclude(user_id__in=skip)
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+    )
+    while True:
+        chunk = list(recipients.filter(user_id__gt=cursor)[:chunk_size])
+        if not chunk:
+            return
+        notify(chunk, lambda user_id: kind)
+        cursor = chunk[-1]
+        if not _save_cursor(event, cursor):
+            return
+
+def _save_cursor(event, cursor):
+    # Also renews the claim, so a long fan-out is not taken over mid-way
+    # Note: returns False once another worker has taken the event over, which then finishes it
+    event.cursor = cursor
+    return OutboxEvent.objects.filter(id=event.id, claim=event.claim).update(cursor=cursor, claimed_at=timezone.now())
@@ -0,0 +1,134 @@
+import base64
+import datetime
+import decimal
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _encode_value(value):
+    # Keeps full precision, unlike DjangoJSONEncoder which truncates microseconds
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+def _in_range(value):
+    # Numbers the database can compare against, SQLite raises on integers beyond 64 bits
+    if isinstance(value, bool):
+        return True
+    if isinstance(value, int):
+        return -2 ** 63 <= value < 2 ** 63
+    if isinstance(value, (float, decimal.Decimal)):
+        return math.isfinite(value)
+    return True
+
+class KeysetPage:
+    # A single page of results plus the cursors either side of it
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+class KeysetPaginator:
+    # Pages through a queryset by seeking past the last seen key, never by OFFSET
+    # Note: the final key must be unique (normally "id") so every row has one position
+    # Keys prefixed with "-" page in descending order, as with order_by
+
+    def __init__(self, queryset, keys, per_page):
+        self.queryset = queryset
+        self.keys = keys
+        self.per_page = per_page
+        self.fields = [key.lstrip("-") for key in keys]
+
+    def page(self, after=None, before=None):
+        if before:
+            values = self.decode(before)
+            if values is not None:
+                return self._page_before(values)
+        if after:
+            values = self.decode(after)
+            if values is not None:
+                return self._page_after(values)
+        return self._page_after(None)
+
+    def _page_after(self, values):
+        queryset = self.queryset.order_by(*self.keys)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward=True))
+        items = list(queryset[:self.per_page + 1])
+
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode(items[-1])
+        previous_cursor = self.encode(items[0]) if values is not None and items else None
+        return KeysetPage(items, next_cursor, previous_cursor)
+
+    def _page_before(self, values):
+        # Walks backwards from the cursor, then restores display order
+        reverse_keys = [key[1:] if key.startswith("-") else f"-{key}" for key in self.keys]
+        queryset = self.queryset.order_by(*reverse_keys)
+        items = list(queryset.filter(self._seek(values, forward=False))[:self.per_page + 1])
+
+        previous_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            previous_cursor = self.encode(items[-1])
+        items.reverse()
+        next_cursor = self.encode(items[-1]) if items else None
+        return KeysetPage(items, next_cursor, previous_cursor)
+
+    def _seek(self, values, forward):
+        # Builds (k1, k2, ...) > (v1, v2, ...) as nested comparisons
+        # Note: the leading inclusive bound lets the database seek on the first key
+        lookups = [
+            "gt" if forward != key.startswith("-") else "lt"
+            for key in self.keys
+        ]
+        condition = Q(**{f"{self.fields[-1]}__{lookups[-1]}": values[-1]})
+        for field, lookup, value in reversed(list(zip(self.fields[:-1], lookups[:-1], values[:-1]))):
+            condition = Q(**{f"{field}__{lookup}": value}) | (Q(**{field: value}) & condition)
+        if len(self.keys) == 1:
+            return condition
+        return Q(**{f"{self.fields[0]}__{lookups[0]}e": values[0]}) & condition
+
+    def encode(self, item):
+        values = [getattr(item, field) for field in self.fields]
+        data = json.dumps(values, default=_encode_value).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode(self, cursor):
+        # Returns None for cursors that are malformed or do not match the keys
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                return None
+            model = self.queryset.model
+            values = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, OverflowError, ValidationError):
+            return None
+        if not all(_in_range(value) for value in values):
+            return None
+        return values
@@ -0,0 +1,52 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RequestState:
+    # Whether this request must read from the primary, and whether it has written
+
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+_state = ContextVar("auctions_replica_state", default=None)
+
+def bind(state):
+    return _state.set(state)
+
+def unbind(token):
+    _state.reset(token)
+
+class ReplicaRouter:
+    # Sends reads to a random replica in AUCTIONS_DB_REPLICAS and writes to the primary
+    # Note: once a request writes, its later reads stay on the primary, see ReplicaPinningMiddleware
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.AUCTIONS_DB_REPLICAS
+        if not replicas:
+            return None
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see its own writes and locks
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.AUCTIONS_DB_REPLICAS
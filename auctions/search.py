@@ -0,0 +1,126 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Listing
+
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+class DatabaseSearchBackend:
+    # Portable fallback, ranks title matches above description matches
+    # Note: relies on LIKE scans, so only suitable for small catalogues
+
+    def index(self, listing):
+        pass
+
+    def index_many(self, listing_ids):
+        pass
+
+    def remove(self, listing_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, limit):
+        terms = TOKEN.findall(query)
+        if not terms:
+            return []
+        listings = Listing.objects.filter(active=True)
+        for term in terms:
+            listings = listings.filter(Q(title__icontains=term) | Q(description__icontains=term))
+        title_matches = Q()
+        for term in terms:
+            title_matches &= Q(title__icontains=term)
+        listings = listings.annotate(
+            rank=Case(When(title_matches, then=Value(0)), default=Value(1), output_field=IntegerField())
+        ).order_by("rank", "title", "id")
+        return list(listings.values_list("id", flat=True)[:limit])
+
+class SQLiteFTSBackend:
+    # Inverted index over active listings in an FTS5 table, ranked by BM25
+    # Note: the table is created by migration 0009, keyed by listing id
+
+    table = "auctions_listing_fts"
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def index(self, listing):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [listing.id])
+            if listing.active:
+                cursor.execute(
+                    f"INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)",
+                    [listing.id, listing.title, listing.description]
+                )
+
+    def index_many(self, listing_ids):
+        # Indexes a batch of new listings, e.g. after a bulk import
+        rows = Listing.objects.filter(id__in=listing_ids, active=True).values_list("id", "title", "description")
+        with connection.cursor() as cursor:
+            self._insert(cursor, list(rows))
+
+    def remove(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [listing_id])
+
+    def rebuild(self):
+        listings = Listing.objects.filter(active=True).values_list("id", "title", "description")
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            batch = []
+            for row in listings.iterator(chunk_size=2000):
+                batch.append(row)
+                if len(batch) == 2000:
+                    self._insert(cursor, batch)
+                    batch = []
+            self._insert(cursor, batch)
+
+    def _insert(self, cursor, rows):
+        if rows:
+            cursor.executemany(f"INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)", rows)
+
+    def search(self, query, limit):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, %s, %s) LIMIT %s",
+                [match, self.title_weight, self.description_weight, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def match_expression(self, query):
+        # Quotes each term so user input can never be read as FTS syntax
+        # Note: the final term matches as a prefix to support search-as-you-type
+        terms = [f'"{term}"' for term in TOKEN.findall(query)]
+        if terms:
+            terms[-1] += "*"
+        return " ".join(terms)
+
+_backend = None
+
+def get_backend():
+    # Returns AUCTIONS_SEARCH_BACKEND, or the best backend for the default database
+    global _backend
+    if _backend is None:
+        if settings.AUCTIONS_SEARCH_BACKEND:
+            _backend = import_string(settings.AUCTIONS_SEARCH_BACKEND)()
+        elif connection.vendor == "sqlite":
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = DatabaseSearchBackend()
+    return _backend
+
+def search_listings(query, limit):
+    # Returns active listings matching the query, best match first
+    ids = get_backend().search(query, limit)
+    listings = Listing.objects.filter(active=True).in_bulk(ids)
+    return [listings[id] for id in ids if id in listings]
@@ -0,0 +1,185 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .models import Bid, Listing, ProxyBid
+from .signals import bid_placed, listing_closed
+
+
+class BidRejected(ValidationError):
+    pass
+
+@transaction.atomic
+def accept_bid(listing_id, user_id, bid_amount):
+    # Claims the listing with a conditional update so only a higher bid can win
+    # Note: the database decides the race, the price shown to the bidder is never trusted
+    claimed = Listing.objects.filter(
+        Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()),
+        id=listing_id,
+        active=True,
+        current_price__lt=bid_amount
+    ).exclude(owner_id=user_id).update(
+        current_price=bid_amount,
+        bid_count=F("bid_count") + 1
+    )
+    if not claimed:
+        raise _rejection(listing_id, user_id)
+
+    bid = Bid.objects.create(
+        listing_id=listing_id,
+        user_id=user_id,
+        bid_amount=bid_amount
+    )
+    Listing.objects.filter(id=listing_id).update(leading_bid=bid)
+    bid_placed.send(sender=Bid, listing_id=listing_id, bid=bid)
+
+    # Standing maxima answer the new bid straight away
+    _resolve_proxies(listing_id, bid_amount, user_id)
+    return bid
+
+def bid_increment(price):
+    # Returns the minimum raise over a price, from AUCTIONS_BID_INCREMENTS
+    increment = None
+    for floor, step in settings.AUCTIONS_BID_INCREMENTS:
+        if price >= Decimal(floor):
+            increment = Decimal(step)
+    return increment
+
+@transaction.atomic
+def place_proxy_bid(listing_id, user_id, max_amount):
+    # Stores a bidder's maximum and resolves every competing maximum at once
+    # Returns True if the bidder leads afterwards
+    # Note: the proxy row is written first so SQLite takes its write lock before any read
+    # A changed maximum takes a new timestamp, so a raise to match a rival ranks behind them on the tie
+    stored = ProxyBid.objects.filter(listing_id=listing_id, user_id=user_id).update(
+        max_amount=max_amount,
+        timestamp=Case(When(max_amount=max_amount, then=F("timestamp")), default=Value(timezone.now()))
+    )
+    if not stored:
+        ProxyBid.objects.create(listing_id=listing_id, user_id=user_id, max_amount=max_amount)
+
+    listing = Listing.objects.select_for_update(of=("self",)).select_related("leading_bid").filter(id=listing_id).first()
+    leader_id = listing.leading_bid.user_id if listing and listing.leading_bid else None
+    if (listing is None
+            or not listing.active
+            or (listing.ends_at and listing.ends_at <= timezone.now())
+            or listing.owner_id == user_id
+            or max_amount < listing.current_price
+            or (max_amount == listing.current_price and leader_id != user_id)):
+        raise _rejection(listing_id, user_id)
+
+    bid = _resolve_proxies(listing.id, listing.current_price, leader_id)
+    if bid is not None:
+        leader_id = bid.user_id
+    return leader_id == user_id
+
+def _resolve_proxies(listing_id, price, leader_id):
+    # Settles competing maxima with a single bid at the lowest winning price
+    # Note: a bidding war of any length costs one Bid row and one listing update
+    proxies = list(ProxyBid.objects.filter(listing_id=listing_id).order_by("-max_amount", "timestamp", "id")[:2])
+    if not proxies:
+        return None
+    top = proxies[0]
+    runner = proxies[1] if len(proxies) > 1 else None
+
+    if top.user_id == leader_id:
+        # Leader only rises to stay ahead of a runner who can beat the current price
+        if runner is None or runner.max_amount <= price:
+            return None
+        target = min(top.max_amount, runner.max_amount + bid_increment(runner.max_amount))
+    else:
+        # Earliest of equal maxima wins, so the runner's maximum is the floor to beat
+        if top.max_amount <= price:
+            return None
+        floor = max(price, runner.max_amount) if runner else price
+        target = min(top.max_amount, floor + bid_increment(floor))
+
+    bid = Bid.objects.create(
+        listing_id=listing_id,
+        user_id=top.user_id,
+        bid_amount=target
+    )
+    Listing.objects.filter(id=listing_id).update(
+        current_price=target,
+        leading_bid=bid,
+        bid_count=F("bid_count") + 1
+    )
+    bid_placed.send(sender=Bid, listing_id=listing_id, bid=bid)
+    return bid
+
+def _rejection(listing_id, user_id):
+    # Builds the error explaining why a bid lost the conditional update
+    listing = Listing.objects.filter(id=listing_id).values("active", "ends_at", "owner_id", "current_price").first()
+    if listing is None:
+        return BidRejected(_("Error: Listing does not exist"), code="missing")
+    if not listing["active"] or (listing["ends_at"] and listing["ends_at"] <= timezone.now()):
+        return BidRejected(_("Error: The auction has ended"), code="closed")
+    if listing["owner_id"] == user_id:
+        return BidRejected(_("Error: You cannot bid on your own listing"), code="owner")
+    return BidRejected(
+        _("Error: New bid must be greater than the previous bid of £%(bid)s"),
+        code="invalid",
+        params={"bid": listing["current_price"]})
+
+def _closing_fields(closed_at):
+    # Update fields that close a listing and record its leading bidder as winner
+    return {
+        "active": False,
+        "closed_at": closed_at,
+        "winner_id": Subquery(Bid.objects.filter(id=OuterRef("leading_bid_id")).values("user_id")[:1]),
+    }
+
+@transaction.atomic
+def close_listing(listing_id):
+    # Closes an active listing, returns False if it was already closed
+    closed = Listing.objects.filter(id=listing_id, active=True).update(**_closing_fields(timezone.now()))
+    if closed:
+        listing_closed.send(sender=Listing, listing_id=listing_id)
+    return bool(closed)
+
+def close_expired_listings(now=None, batch_size=500):
+    # Closes listings whose end time has passed, one indexed batch per transaction
+    # Returns the number closed; safe to rerun as only active listings are touched
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            due = list(
+                Listing.objects.filter(active=True, ends_at__lte=now)
+                .order_by("ends_at")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not due:
+                return total
+
+            # Stamps the batch so listings closed concurrently elsewhere are not announced twice
+            closed_at = timezone.now()
+            Listing.objects.filter(id__in=due, active=True).update(**_closing_fields(closed_at))
+            closed = Listing.objects.filter(id__in=due, closed_at=closed_at).values_list("id", flat=True)
+            for listing_id in closed:
+                listing_closed.send(sender=Listing, listing_id=listing_id)
+                total += 1
+
+def rebuild_bid_state(fix=True, batch_size=1000):
+    # Compares stored bid state against the Bid table
+    # Returns ids of listings that were out of sync, repairing them if fix is set
+    stale = []
+    listings = Listing.objects.with_bid_state().order_by("id")
+    for listing in listings.iterator(chunk_size=batch_size):
+        if (listing.current_price != listing.current_bid
+                or listing.leading_bid_id != listing.top_bid_id
+                or listing.bid_count != listing.total_bids):
+            stale.append(listing.id)
+            if fix:
+                with transaction.atomic():
+                    Listing.objects.filter(id=listing.id).update(
+                        current_price=listing.current_bid,
+                        leading_bid_id=listing.top_bid_id,
+                        bid_count=listing.total_bids
+                    )
+    return stale
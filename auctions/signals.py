@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import caching, events, images, instrumentation, notifications, search
+from .models import Category, Comment, Listing
+
+
+# Sent once a listing has been closed, queryset updates bypass post_save
+# Arguments: listing_id
+listing_closed = Signal()
+
+# Sent once a bid has been accepted
+# Arguments: listing_id, bid
+bid_placed = Signal()
+
+# Sent after a bulk insert of listings, bulk_create bypasses post_save
+# Arguments: listing_ids
+listings_created = Signal()
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_counts(sender, **kwargs):
+    # Clears now and again on commit, so counts read mid-transaction are not cached afterwards
+    caching.invalidate_category_counts()
+    transaction.on_commit(caching.invalidate_category_counts)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_choices(sender, **kwargs):
+    caching.invalidate_category_choices()
+
+@receiver(listings_created)
+@receiver(listing_closed)
+def listing_closed_category_counts(sender, **kwargs):
+    invalidate_category_counts(sender)
+
+@receiver(bid_placed)
+@receiver(listing_closed)
+def invalidate_listing_cache(sender, listing_id, **kwargs):
+    # Bumps now and again on commit, so a page cached mid-transaction is also dropped
+    caching.bump_listing_version(listing_id)
+    transaction.on_commit(lambda: caching.bump_listing_version(listing_id))
+
+@receiver(post_save, sender=Listing)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_listing_cache_on_save(sender, instance, **kwargs):
+    listing_id = instance.id if sender is Listing else instance.listing_id
+    invalidate_listing_cache(sender, listing_id)
+
+@receiver(bid_placed)
+@receiver(listing_closed)
+@receiver(listings_created)
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_feed(sender, **kwargs):
+    caching.bump_feed_state()
+    transaction.on_commit(caching.bump_feed_state)
+
+@receiver(bid_placed)
+def publish_bid(sender, listing_id, bid, **kwargs):
+    data = {"listing": listing_id, "amount": f"{bid.bid_amount:.2f}", "bidder": bid.user_id}
+    transaction.on_commit(lambda: events.publish(listing_id, "bid", data))
+
+@receiver(post_save, sender=Comment)
+def publish_comment(sender, instance, created, **kwargs):
+    if created:
+        data = {"listing": instance.listing_id, "comment": instance.comment}
+        transaction.on_commit(lambda: events.publish(instance.listing_id, "comment", data))
+
+@receiver(listing_closed)
+def publish_closed(sender, listing_id, **kwargs):
+    transaction.on_commit(lambda: events.publish(listing_id, "closed", {"listing": listing_id}))
+
+@receiver(bid_placed)
+def queue_bid_notifications(sender, listing_id, bid, **kwargs):
+    # Only an outbox row on the request path, the send_notifications worker fans it out
+    notifications.queue_bid(listing_id, bid)
+
+@receiver(listing_closed)
+def queue_closed_notifications(sender, listing_id, **kwargs):
+    notifications.queue_closed(listing_id)
+
+@receiver(post_save, sender=Listing)
+def index_listing(sender, instance, **kwargs):
+    search.get_backend().index(instance)
+
+@receiver(listings_created)
+def index_created_listings(sender, listing_ids, **kwargs):
+    search.get_backend().index_many(listing_ids)
+
+@receiver(post_save, sender=Listing)
+def queue_listing_image(sender, instance, **kwargs):
+    images.queue_image(instance)
+
+@receiver(listings_created)
+def queue_created_listing_images(sender, listing_ids, **kwargs):
+    images.queue_created(listing_ids)
+
+@receiver(post_delete, sender=Listing)
+def unindex_deleted_listing(sender, instance, **kwargs):
+    search.get_backend().remove(instance.id)
+
+@receiver(listing_closed)
+def unindex_closed_listing(sender, listing_id, **kwargs):
+    search.get_backend().remove(listing_id)
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Counts the connection's queries toward whichever request is running them
+    # Note: inserted first, as execute_wrapper blocks pop the most recent wrapper when they exit
+    if instrumentation.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, instrumentation.record_query)
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # Applies AUCTIONS_SQLITE_PRAGMAS to each new SQLite connection
+    # Note: run on the raw connection so they are not logged or counted as request queries
+    if connection.vendor == "sqlite":
+        for pragma, value in settings.AUCTIONS_SQLITE_PRAGMAS.items():
+            connection.connection.execute(f"PRAGMA {pragma} = {value}")
@@ -0,0 +1,26 @@
+from django import template
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+
+from ..models import ListingImage
+
+
+register = template.Library()
+
+
+@register.inclusion_tag("auctions/thumbnail.html")
+def thumbnail(listing, size, css_class=""):
+    # Renders the listing's thumbnail, or the placeholder until the worker has made one
+    # Note: fetch listings with select_related("image"), or each thumbnail costs a query
+    try:
+        image = listing.image
+    except ObjectDoesNotExist:
+        image = None
+    width, height = settings.AUCTIONS_THUMBNAIL_SIZES[size]
+    return {
+        "digest": image.digest if image is not None and image.state == ListingImage.READY else None,
+        "size": size,
+        "css_class": css_class,
+        "width": width,
+        "height": height,
+    }
@@ -0,0 +1,35 @@
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import instrumentation
+
+
+class TimedTemplate(Template):
+    # Adds render time to the current request's stats
+    # Note: lazy querysets evaluated while rendering count as template time too
+
+    def render(self, context=None, request=None):
+        stats = instrumentation.current_stats()
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+            stats.rendering = False
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # The standard Django backend, returning templates that record their render time
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -1,3 +1,1927 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from unittest import mock, skipUnless
+
+from . import urls as auction_urls
+from . import analytics, benchmarking, budgets, bulk, caching, events, images, instrumentation, notifications, search
+from .caching import cache_stats, get_category_choices, invalidate_category_choices
+from .models import User, Bid, Category, CategoryStats, Comment, Listing, ListingImage, OutboxEvent, Watchlist
+from .middleware import PerformanceMiddleware, ReplicaPinningMiddleware
+from .pagination import KeysetPaginator
+from .routers import ReplicaRouter
+from .services import BidRejected, accept_bid, bid_increment, close_expired_listings, close_listing, place_proxy_bid, rebuild_bid_state
+from .signals import listing_closed
+from .views import CreateListing
+
+# Pillow is optional, tests that need it are skipped without it
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class AuctionFixtures:
+    # Shared fixtures for creating users, listings and bids
+
+    def setUp(self):
+        # Cached pages, counts and sessions must not leak between tests
+        cache.clear()
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        invalidate_category_choices()
+
+    def create_user(self, username):
+        return User.objects.create_user(username, f"{username}@example.com", "password")
+
+    def create_listing(self, owner, title="Item", starting_bid="1.00", **kwargs):
+        return Listing.objects.create(
+            owner=owner,
+            title=title,
+            description=f"Description of {title}",
+            starting_bid=Decimal(starting_bid),
+            **kwargs
+        )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class AuctionTestCase(AuctionFixtures, TestCase):
+    pass
+
+
+class ListingFeedTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.rival = self.create_user("rival")
+        self.category = Category.objects.create(category="Books")
+
+    def add_listings(self, count):
+        for i in range(count):
+            listing = self.create_listing(self.owner, title=f"Item {i}", category=self.category)
+            accept_bid(listing.id, self.bidder.id, Decimal("2.00"))
+            accept_bid(listing.id, self.rival.id, Decimal("3.00"))
+            Watchlist.objects.create(listing=listing, user=self.bidder)
+
+    def test_with_current_bid_annotates_leading_bid(self):
+        listing = self.create_listing(self.owner, starting_bid="5.00")
+        unbid = self.create_listing(self.owner, title="Unbid", starting_bid="7.50")
+        Bid.objects.create(listing=listing, user=self.bidder, bid_amount=Decimal("6.00"))
+        Bid.objects.create(listing=listing, user=self.rival, bid_amount=Decimal("8.00"))
+
+        annotated = Listing.objects.with_current_bid().get(id=listing.id)
+        self.assertEqual(annotated.current_bid, Decimal("8.00"))
+        self.assertEqual(annotated.leading_bid_amount, Decimal("8.00"))
+        self.assertEqual(annotated.leading_bidder_id, self.rival.id)
+
+        annotated = Listing.objects.with_current_bid().get(id=unbid.id)
+        self.assertEqual(annotated.current_bid, Decimal("7.50"))
+        self.assertIsNone(annotated.leading_bidder_id)
+
+    def test_index_renders_current_bid(self):
+        self.add_listings(1)
+        response = self.client.get(reverse("auctions:index"))
+        self.assertContains(response, "£3.00")
+
+    def test_feeds_use_constant_queries(self):
+        self.client.force_login(self.bidder)
+        urls = [
+            reverse("auctions:index"),
+            reverse("auctions:watchlist"),
+            reverse("auctions:user"),
+        ]
+
+        self.add_listings(2)
+        small = [self.count_queries(url) for url in urls]
+        self.add_listings(20)
+        large = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, large)
+
+    def test_category_feed_uses_constant_queries(self):
+        url = reverse("auctions:index")
+
+        self.add_listings(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, {"category": self.category.id})
+        self.add_listings(20)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, {"category": self.category.id})
+        self.assertEqual(len(small), len(large))
+        self.assertContains(response, "Item 19")
+
+    def test_unknown_category_is_not_found(self):
+        url = reverse("auctions:index")
+        for category in [self.category.id + 1, "abc", "9" * 30]:
+            self.assertEqual(self.client.get(url, {"category": category}).status_code, 404)
+        self.assertEqual(self.client.get(url, {"category": self.category.id}).status_code, 200)
+
+
+class BidStateTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.listing = self.create_listing(self.owner, starting_bid="5.00")
+
+    def test_new_listing_starts_at_starting_bid(self):
+        self.assertEqual(self.listing.current_price, Decimal("5.00"))
+        self.assertEqual(self.listing.bid_count, 0)
+        self.assertIsNone(self.listing.leading_bid)
+
+    def test_accept_bid_updates_bid_state(self):
+        accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        bid = accept_bid(self.listing.id, self.bidder.id, Decimal("7.00"))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, Decimal("7.00"))
+        self.assertEqual(self.listing.leading_bid, bid)
+        self.assertEqual(self.listing.bid_count, 2)
+
+    def test_rebuild_command_repairs_drift(self):
+        accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        bid = Bid.objects.create(listing=self.listing, user=self.bidder, bid_amount=Decimal("9.00"))
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_listing_prices", "--verify", stdout=StringIO())
+
+        call_command("rebuild_listing_prices", stdout=StringIO())
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, Decimal("9.00"))
+        self.assertEqual(self.listing.leading_bid, bid)
+        self.assertEqual(self.listing.bid_count, 2)
+
+        out = StringIO()
+        call_command("rebuild_listing_prices", "--verify", stdout=out)
+        self.assertIn("in sync", out.getvalue())
+
+    def test_accept_bid_rejects_lower_bid(self):
+        accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        with self.assertRaises(BidRejected) as raised:
+            accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        self.assertEqual(raised.exception.code, "invalid")
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 1)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_accept_bid_rejects_owner_and_closed_listing(self):
+        with self.assertRaises(BidRejected) as raised:
+            accept_bid(self.listing.id, self.owner.id, Decimal("10.00"))
+        self.assertEqual(raised.exception.code, "owner")
+
+        Listing.objects.filter(id=self.listing.id).update(active=False)
+        with self.assertRaises(BidRejected) as raised:
+            accept_bid(self.listing.id, self.bidder.id, Decimal("10.00"))
+        self.assertEqual(raised.exception.code, "closed")
+
+    def test_bid_view_ignores_posted_price(self):
+        accept_bid(self.listing.id, self.bidder.id, Decimal("8.00"))
+        rival = self.create_user("rival")
+        self.client.force_login(rival)
+
+        url = reverse("auctions:listing", args=[self.listing.id])
+        response = self.client.post(url, {"submit_bid": "", "bid_amount": "7.00", "current_bid": "1.00"})
+        self.assertContains(response, "previous bid of £8.00")
+
+        response = self.client.post(url, {"submit_bid": "", "bid_amount": "9.00"})
+        self.assertRedirects(response, url)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.leading_bid.user, rival)
+
+
+class ConcurrentBidTests(AuctionFixtures, TransactionTestCase):
+
+    BIDDERS = 16
+    BIDS = 2000
+
+    def test_concurrent_bids_have_single_winner(self):
+        owner = self.create_user("owner")
+        bidders = [self.create_user(f"bidder{i}") for i in range(self.BIDDERS)]
+        listing = self.create_listing(owner, starting_bid="1.00")
+
+        # Distinct amounts dealt out to threads in random order
+        amounts = [Decimal(i) / 100 + 1 for i in range(1, self.BIDS + 1)]
+        random.Random(0).shuffle(amounts)
+        accepted = []
+        errors = []
+        barrier = threading.Barrier(self.BIDDERS)
+
+        def bid(bidder, share):
+            barrier.wait()
+            try:
+                for amount in share:
+                    try:
+                        accepted.append(accept_bid(listing.id, bidder.id, amount))
+                    except BidRejected:
+                        pass
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=bid, args=(bidder, amounts[i::self.BIDDERS]))
+            for i, bidder in enumerate(bidders)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        listing.refresh_from_db()
+        bids = list(Bid.objects.filter(listing=listing).order_by("id"))
+        highest = max(amounts)
+
+        # Every accepted bid beat its predecessor, and the stored state matches the Bid table
+        self.assertEqual(len(bids), len(accepted))
+        self.assertTrue(all(a.bid_amount < b.bid_amount for a, b in zip(bids, bids[1:])))
+        self.assertEqual(listing.current_price, highest)
+        self.assertEqual(listing.leading_bid.bid_amount, highest)
+        self.assertEqual(listing.bid_count, len(bids))
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked against SQLite")
+class QueryPlanTests(TestCase):
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotRegex(plan, r"(?m)SCAN (TABLE )?auctions_\w+$")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_active_feed_uses_partial_index(self):
+        self.assertUsesIndex(
+            Listing.objects.filter(active=True).order_by("title"),
+            "listing_active_title_idx")
+
+    def test_category_feed_uses_partial_index(self):
+        self.assertUsesIndex(
+            Listing.objects.filter(active=True, category_id=1).order_by("title"),
+            "listing_active_cat_idx")
+
+    def test_bids_by_amount_use_composite_index(self):
+        self.assertUsesIndex(
+            Bid.objects.filter(listing=1).order_by("-bid_amount"),
+            "bid_listing_amount_idx")
+
+    def test_watchlist_lookup_uses_unique_index(self):
+        # Note: SQLite backs the unique constraint with an automatic index
+        self.assertUsesIndex(
+            Watchlist.objects.filter(user_id=1, listing_id=1),
+            "INDEX sqlite_autoindex_auctions_watchlist_1 (user_id=? AND listing_id=?)")
+
+    def test_comments_use_composite_index(self):
+        self.assertUsesIndex(
+            Comment.objects.filter(listing_id=1).order_by("timestamp"),
+            "comment_listing_time_idx")
+
+
+class KeysetPaginationTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        # Duplicate titles check the id tiebreaker
+        for title in ["Alpha", "Bravo", "Bravo", "Charlie", "Delta"]:
+            self.create_listing(self.owner, title=title)
+        self.paginator = KeysetPaginator(Listing.objects.all(), ("title", "id"), 2)
+
+    def titles(self, page):
+        return [listing.title for listing in page]
+
+    def test_pages_forward_and_back(self):
+        first = self.paginator.page()
+        self.assertEqual(self.titles(first), ["Alpha", "Bravo"])
+        self.assertFalse(first.has_previous)
+
+        second = self.paginator.page(after=first.next_cursor)
+        self.assertEqual(self.titles(second), ["Bravo", "Charlie"])
+
+        third = self.paginator.page(after=second.next_cursor)
+        self.assertEqual(self.titles(third), ["Delta"])
+        self.assertFalse(third.has_next)
+
+        back = self.paginator.page(before=third.previous_cursor)
+        self.assertEqual([l.id for l in back], [l.id for l in second])
+        back = self.paginator.page(before=back.previous_cursor)
+        self.assertEqual([l.id for l in back], [l.id for l in first])
+        self.assertFalse(back.has_previous)
+
+    def test_pages_do_not_use_offset(self):
+        first = self.paginator.page()
+        with CaptureQueriesContext(connection) as queries:
+            self.paginator.page(after=first.next_cursor)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("OFFSET", queries[0]["sql"])
+
+    def test_invalid_cursor_returns_first_page(self):
+        self.assertEqual(self.titles(self.paginator.page(after="not-a-cursor")), ["Alpha", "Bravo"])
+
+    def test_out_of_range_cursor_returns_first_page(self):
+        for values in ['["Bravo", 9223372036854775808]', '["Bravo", -9223372036854775809]', '["Bravo", Infinity]', '["Bravo", 1e999]', '["Bravo", NaN]']:
+            cursor = base64.urlsafe_b64encode(values.encode()).decode()
+            with self.subTest(values=values):
+                for url in [reverse("auctions:index"), reverse("auctions:api_listings")]:
+                    response = self.client.get(url, {"after": cursor})
+                    self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.titles(self.paginator.page(after=cursor)), ["Alpha", "Bravo"])
+
+    def test_comment_cursor_keeps_timestamp_precision(self):
+        listing = Listing.objects.first()
+        for i in range(3):
+            Comment.objects.create(listing=listing, user=self.owner, comment=f"Comment {i}")
+        paginator = KeysetPaginator(Comment.objects.all(), ("timestamp", "id"), 1)
+
+        seen = []
+        page = paginator.page()
+        while True:
+            seen.extend(comment.comment for comment in page)
+            if not page.has_next:
+                break
+            page = paginator.page(after=page.next_cursor)
+        self.assertEqual(seen, ["Comment 0", "Comment 1", "Comment 2"])
+
+    @override_settings(AUCTIONS_LISTINGS_PER_PAGE=2)
+    def test_index_links_to_next_page(self):
+        response = self.client.get(reverse("auctions:index"))
+        page = response.context["listings"]
+        self.assertTrue(page.has_next)
+        self.assertContains(response, "?after=")
+
+        response = self.client.get(reverse("auctions:index"), {"after": page.next_cursor})
+        self.assertEqual(self.titles(response.context["listings"]), ["Bravo", "Charlie"])
+
+
+class CategoryCountTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.books = Category.objects.create(category="Books")
+        self.games = Category.objects.create(category="Games")
+        self.listing = self.create_listing(self.owner, category=self.books)
+        self.create_listing(self.owner, title="Closed", category=self.books, active=False)
+
+    def counts(self):
+        response = self.client.get(reverse("auctions:categories"))
+        return {category.category: category.active_count for category in response.context["categories"]}
+
+    def test_counts_use_single_query_then_cache(self):
+        url = reverse("auctions:categories")
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Books (1)")
+        self.assertContains(response, "Games (0)")
+
+    def test_counts_invalidated_by_listing_changes(self):
+        self.assertEqual(self.counts(), {"Books": 1, "Games": 0})
+
+        self.create_listing(self.owner, title="New", category=self.games)
+        self.assertEqual(self.counts(), {"Books": 1, "Games": 1})
+
+        close_listing(self.listing.id)
+        self.assertEqual(self.counts(), {"Books": 0, "Games": 1})
+
+        listing = Listing.objects.get(title="New")
+        listing.category = self.books
+        listing.save()
+        self.assertEqual(self.counts(), {"Books": 1, "Games": 0})
+
+    def test_counts_expire_without_invalidation(self):
+        with self.settings(AUCTIONS_CATEGORY_COUNTS_TTL=0):
+            self.counts()
+            with self.assertNumQueries(1):
+                self.counts()
+
+
+class CategoryCountCommitTests(AuctionFixtures, TransactionTestCase):
+
+    def test_counts_cached_before_commit_are_dropped(self):
+        owner = self.create_user("owner")
+        books = Category.objects.create(category="Books")
+        with transaction.atomic():
+            self.create_listing(owner, category=books)
+            # A concurrent reader caching the counts it saw before this commit
+            cache.set(caching.CATEGORY_COUNTS_KEY, [], None)
+        self.assertIsNone(cache.get(caching.CATEGORY_COUNTS_KEY))
+
+
+class CategoryChoiceTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        Category.objects.create(category="Books")
+
+    def choice_names(self, form):
+        return [name for value, name in form.fields["category"].choices]
+
+    def test_choices_cached_between_forms(self):
+        self.assertEqual(self.choice_names(CreateListing()), ["Please select...", "Books"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.choice_names(CreateListing()), ["Please select...", "Books"])
+
+    def test_new_category_invalidates_choices(self):
+        get_category_choices()
+        Category.objects.create(category="Art")
+        self.assertEqual(self.choice_names(CreateListing()), ["Please select...", "Art", "Books"])
+
+    @override_settings(AUCTIONS_CATEGORY_CHOICES_TTL=0)
+    def test_choices_expire_after_ttl(self):
+        get_category_choices()
+        with self.assertNumQueries(1):
+            get_category_choices()
+
+    def test_create_accepts_cached_category(self):
+        category = Category.objects.get(category="Books")
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse("auctions:create"), {
+            "title": "Novel",
+            "description": "A novel",
+            "starting_bid": "3.00",
+            "category": category.id,
+            "owner": self.owner.id
+        })
+        listing = Listing.objects.get(title="Novel")
+        self.assertRedirects(response, reverse("auctions:listing", args=[listing.id]))
+        self.assertEqual(listing.category, category)
+
+
+class ListingPageCacheTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.listing = self.create_listing(self.owner, title="Lamp", starting_bid="5.00")
+        self.url = reverse("auctions:listing", args=[self.listing.id])
+
+    def test_anonymous_page_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Current bid: £<span id="current-bid">5.00')
+        self.assertEqual(cache_stats("listing_page"), {"hits": 1, "misses": 1})
+
+    def test_unrelated_query_strings_share_the_cached_page(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {"utm_source": "mail", "junk": "1"})
+        self.assertEqual(caching.listing_page_query({"junk": "1", "comments_after": "abc"}), "comments_after=abc")
+        self.assertEqual(cache_stats("listing_page"), {"hits": 1, "misses": 1})
+
+    def test_pages_expire_after_the_configured_timeout(self):
+        with self.settings(AUCTIONS_LISTING_CACHE_TIMEOUT=0):
+            self.client.get(self.url)
+            self.client.get(self.url)
+        self.assertEqual(cache_stats("listing_page"), {"hits": 0, "misses": 2})
+
+    def test_bid_comment_and_close_invalidate_page(self):
+        self.client.get(self.url)
+        accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        self.assertContains(self.client.get(self.url), 'Current bid: £<span id="current-bid">6.00')
+
+        Comment.objects.create(listing=self.listing, user=self.bidder, comment="Nice lamp")
+        self.assertContains(self.client.get(self.url), "Nice lamp")
+
+        close_listing(self.listing.id)
+        self.assertContains(self.client.get(self.url), "The auction has now ended")
+
+    def test_evicted_version_does_not_revive_stale_pages(self):
+        self.client.get(self.url)
+        accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        self.client.get(self.url)
+        cache.delete(f"auctions:listing:{self.listing.id}:version")
+
+        accept_bid(self.listing.id, self.bidder.id, Decimal("7.00"))
+        self.assertContains(self.client.get(self.url), 'Current bid: £<span id="current-bid">7.00')
+        cache.delete(f"auctions:listing:{self.listing.id}:version")
+        self.assertContains(self.client.get(self.url), 'Current bid: £<span id="current-bid">7.00')
+
+    def test_authenticated_page_reuses_fragments(self):
+        Comment.objects.create(listing=self.listing, user=self.bidder, comment="Nice lamp")
+        Watchlist.objects.create(listing=self.listing, user=self.bidder)
+        self.client.force_login(self.bidder)
+        self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertFalse(any("auctions_comment" in query["sql"] for query in queries))
+        self.assertContains(response, "Nice lamp")
+        self.assertContains(response, "watchlist-selected")
+        self.assertEqual(cache_stats("listing_fragment")["hits"], 2)
+
+    def test_invalid_comment_renders_page(self):
+        self.client.force_login(self.bidder)
+        response = self.client.post(self.url, {
+            "submit_comment": "",
+            "listing_id": self.listing.id,
+            "user_id": self.bidder.id,
+            "comment": ""
+        })
+        self.assertContains(response, "Lamp")
+
+
+class SimulatedSubscriber:
+    # Plays the client side of an ASGI connection to an event stream
+
+    def __init__(self):
+        self.messages = []
+        self.received = asyncio.Event()
+        self.disconnected = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        self.messages.append(message)
+        if b"event:" in message.get("body", b""):
+            self.received.set()
+
+    def body(self):
+        return b"".join(message.get("body", b"") for message in self.messages)
+
+
+class EventStreamTests(SimpleTestCase):
+
+    SUBSCRIBERS = 1000
+
+    def scope(self, path):
+        return {"type": "http", "method": "GET", "path": path, "headers": []}
+
+    def test_many_subscribers_receive_published_events(self):
+        asyncio.run(self.stream_to_subscribers())
+
+    async def stream_to_subscribers(self):
+        async def django_application(scope, receive, send):
+            raise AssertionError("Event streams must not reach Django")
+
+        application = events.event_stream_router(django_application)
+        backend = events.get_backend()
+        channel = events.listing_channel(42)
+        subscribers = [SimulatedSubscriber() for _ in range(self.SUBSCRIBERS)]
+        streams = [
+            asyncio.ensure_future(application(self.scope("/listing/42/events"), s.receive, s.send))
+            for s in subscribers
+        ]
+        while backend.subscriber_count(channel) < self.SUBSCRIBERS:
+            await asyncio.sleep(0.01)
+
+        # Publish from a worker thread, as a sync view would
+        loop = asyncio.get_running_loop()
+        delivered = await loop.run_in_executor(None, events.publish, 42, "bid", {"amount": "6.00"})
+        self.assertEqual(delivered, self.SUBSCRIBERS)
+        await asyncio.wait_for(asyncio.gather(*(s.received.wait() for s in subscribers)), 10)
+
+        for subscriber in subscribers:
+            subscriber.disconnected.set()
+        await asyncio.wait_for(asyncio.gather(*streams), 10)
+
+        self.assertEqual(backend.subscriber_count(channel), 0)
+        for subscriber in subscribers:
+            self.assertEqual(subscriber.messages[0]["status"], 200)
+            self.assertIn(b'event: bid\ndata: {"amount": "6.00"}\n\n', subscriber.body())
+            self.assertFalse(subscriber.messages[-1].get("more_body", False))
+
+    def test_other_paths_reach_django(self):
+        calls = []
+
+        async def django_application(scope, receive, send):
+            calls.append(scope["path"])
+
+        application = events.event_stream_router(django_application)
+        asyncio.run(application(self.scope("/listing/42"), None, None))
+        self.assertEqual(calls, ["/listing/42"])
+
+
+class EventPublishingTests(AuctionFixtures, TransactionTestCase):
+
+    def test_bids_comments_and_closure_are_published(self):
+        owner = self.create_user("owner")
+        bidder = self.create_user("bidder")
+        listing = self.create_listing(owner)
+        published = []
+
+        backend = events.get_backend()
+        publish = backend.publish
+        backend.publish = lambda channel, message: published.append((channel, message))
+        try:
+            accept_bid(listing.id, bidder.id, Decimal("6"))
+            Comment.objects.create(listing=listing, user=bidder, comment="Hello")
+            close_listing(listing.id)
+        finally:
+            backend.publish = publish
+
+        channel = events.listing_channel(listing.id)
+        self.assertEqual([c for c, m in published], [channel] * 3)
+        self.assertIn('"amount": "6.00"', published[0][1])
+        self.assertTrue(published[1][1].startswith("event: comment"))
+        self.assertTrue(published[2][1].startswith("event: closed"))
+
+
+class SearchTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.lamp = self.create_listing(self.owner, title="Brass lamp")
+        self.desk = Listing.objects.create(
+            owner=self.owner,
+            title="Oak desk",
+            description="Comes with a matching lamp",
+            starting_bid=Decimal("20.00")
+        )
+
+    def titles(self, query):
+        return [listing.title for listing in search.search_listings(query, 10)]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.titles("lamp"), ["Brass lamp", "Oak desk"])
+
+    def test_index_follows_create_and_close(self):
+        self.create_listing(self.owner, title="Floor lamp")
+        self.assertIn("Floor lamp", self.titles("floor"))
+
+        close_listing(self.lamp.id)
+        self.assertEqual(self.titles("brass"), [])
+
+    def test_prefix_and_syntax_characters(self):
+        self.assertEqual(self.titles("bra"), ["Brass lamp"])
+        self.assertEqual(self.titles('lamp" OR (desk'), [])
+        self.assertEqual(self.titles("***"), [])
+
+    def test_database_backend_ranks_titles_first(self):
+        backend = search.DatabaseSearchBackend()
+        self.assertEqual(backend.search("lamp", 10), [self.lamp.id, self.desk.id])
+
+    def test_search_view(self):
+        response = self.client.get(reverse("auctions:search"), {"q": "desk"})
+        self.assertContains(response, "Oak desk")
+        self.assertNotContains(response, "Brass lamp")
+
+
+class AuctionExpiryTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.past = timezone.now() - timedelta(minutes=1)
+
+    def test_expired_listings_close_in_batches_with_winner(self):
+        expired = [self.create_listing(self.owner, title=f"Item {i}", ends_at=self.past) for i in range(5)]
+        running = self.create_listing(self.owner, title="Running", ends_at=timezone.now() + timedelta(days=1))
+        untimed = self.create_listing(self.owner, title="Untimed")
+        Listing.objects.filter(id=expired[0].id).update(ends_at=timezone.now() + timedelta(days=1))
+        accept_bid(expired[0].id, self.bidder.id, Decimal("5.00"))
+        Listing.objects.filter(id=expired[0].id).update(ends_at=self.past)
+
+        announced = []
+        def receiver(sender, listing_id, **kwargs):
+            announced.append(listing_id)
+        listing_closed.connect(receiver)
+        try:
+            self.assertEqual(close_expired_listings(batch_size=2), 5)
+            self.assertEqual(close_expired_listings(batch_size=2), 0)
+        finally:
+            listing_closed.disconnect(receiver)
+
+        self.assertEqual(sorted(announced), sorted(listing.id for listing in expired))
+        won = Listing.objects.get(id=expired[0].id)
+        self.assertFalse(won.active)
+        self.assertIsNotNone(won.closed_at)
+        self.assertEqual(won.winner, self.bidder)
+        self.assertIsNone(Listing.objects.get(id=expired[1].id).winner)
+        self.assertTrue(Listing.objects.get(id=running.id).active)
+        self.assertTrue(Listing.objects.get(id=untimed.id).active)
+
+    def test_bids_rejected_after_end_time(self):
+        listing = self.create_listing(self.owner, ends_at=self.past)
+        with self.assertRaises(BidRejected) as raised:
+            accept_bid(listing.id, self.bidder.id, Decimal("5.00"))
+        self.assertEqual(raised.exception.code, "closed")
+
+    def test_owner_close_records_winner(self):
+        listing = self.create_listing(self.owner)
+        accept_bid(listing.id, self.bidder.id, Decimal("5.00"))
+        self.assertTrue(close_listing(listing.id))
+        self.assertFalse(close_listing(listing.id))
+
+        listing.refresh_from_db()
+        self.assertEqual(listing.winner, self.bidder)
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse("auctions:listing", args=[listing.id]))
+        self.assertContains(response, "Congratulations!")
+
+    def test_due_scan_uses_index(self):
+        plan = Listing.objects.filter(active=True, ends_at__lte=self.past).order_by("ends_at").explain()
+        if connection.vendor == "sqlite":
+            self.assertIn("listing_active_ends_idx", plan)
+
+    def test_command_closes_expired(self):
+        self.create_listing(self.owner, ends_at=self.past)
+        out, err = StringIO(), StringIO()
+        call_command("close_expired_auctions", stdout=out, stderr=err)
+        self.assertIn("Closed 1 expired auction(s)", out.getvalue())
+        # The test cache is per process, as web workers would see it
+        self.assertIn("AUCTIONS_CACHE_BACKEND", err.getvalue())
+
+
+class ProxyBidTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.alice = self.create_user("alice")
+        self.bob = self.create_user("bob")
+        self.carol = self.create_user("carol")
+        self.listing = self.create_listing(self.owner, starting_bid="1.00")
+
+    def state(self):
+        self.listing.refresh_from_db()
+        return self.listing.leading_bid.user, self.listing.current_price
+
+    def test_increment_rules(self):
+        self.assertEqual(bid_increment(Decimal("0.50")), Decimal("0.05"))
+        self.assertEqual(bid_increment(Decimal("1.00")), Decimal("0.25"))
+        self.assertEqual(bid_increment(Decimal("99.99")), Decimal("1.00"))
+
+    def test_competing_maxima_resolve_in_one_write(self):
+        self.assertTrue(place_proxy_bid(self.listing.id, self.alice.id, Decimal("10.00")))
+        self.assertEqual(self.state(), (self.alice, Decimal("1.25")))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(place_proxy_bid(self.listing.id, self.bob.id, Decimal("5.00")))
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "auctions_bid"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.state(), (self.alice, Decimal("5.50")))
+
+        self.assertTrue(place_proxy_bid(self.listing.id, self.bob.id, Decimal("20.00")))
+        self.assertEqual(self.state(), (self.bob, Decimal("10.50")))
+        self.assertEqual(Bid.objects.count(), 3)
+
+    def test_manual_bid_answered_by_proxy(self):
+        place_proxy_bid(self.listing.id, self.alice.id, Decimal("20.00"))
+        accept_bid(self.listing.id, self.bob.id, Decimal("15.00"))
+        self.assertEqual(self.state(), (self.alice, Decimal("15.50")))
+
+        accept_bid(self.listing.id, self.bob.id, Decimal("25.00"))
+        self.assertEqual(self.state(), (self.bob, Decimal("25.00")))
+
+    def test_equal_maxima_go_to_earliest(self):
+        place_proxy_bid(self.listing.id, self.alice.id, Decimal("20.00"))
+        self.assertFalse(place_proxy_bid(self.listing.id, self.bob.id, Decimal("20.00")))
+        self.assertEqual(self.state(), (self.alice, Decimal("20.00")))
+
+    def test_raising_to_match_goes_behind_the_earlier_maximum(self):
+        # Bob's proxy is older, but alice reached 20.00 before he raised to it
+        place_proxy_bid(self.listing.id, self.bob.id, Decimal("5.00"))
+        place_proxy_bid(self.listing.id, self.alice.id, Decimal("20.00"))
+        self.assertFalse(place_proxy_bid(self.listing.id, self.bob.id, Decimal("20.00")))
+        self.assertEqual(self.state(), (self.alice, Decimal("20.00")))
+
+    def test_maximum_must_beat_current_price(self):
+        place_proxy_bid(self.listing.id, self.alice.id, Decimal("10.00"))
+        place_proxy_bid(self.listing.id, self.bob.id, Decimal("5.00"))
+        with self.assertRaises(BidRejected):
+            place_proxy_bid(self.listing.id, self.carol.id, Decimal("5.50"))
+        self.assertFalse(self.listing.proxy_bids.filter(user=self.carol).exists())
+        with self.assertRaises(BidRejected):
+            place_proxy_bid(self.listing.id, self.owner.id, Decimal("50.00"))
+
+    def test_simulated_bidding_wars_match_reference(self):
+        # Replays seeded wars and checks the outcome against the closed-form result
+        bidders = [self.alice, self.bob, self.carol]
+        for seed in range(20):
+            listing = self.create_listing(self.owner, title=f"War {seed}", starting_bid="1.00")
+            rng = random.Random(seed)
+            maxima = {}
+            for _ in range(30):
+                bidder = rng.choice(bidders)
+                amount = Decimal(rng.randint(21, 1200)) * Decimal("0.05")
+                try:
+                    place_proxy_bid(listing.id, bidder.id, amount)
+                except BidRejected:
+                    continue
+                if bidder.id not in maxima:
+                    maxima[bidder.id] = [amount, len(maxima)]
+                maxima[bidder.id][0] = amount
+
+            ranked = sorted(maxima.items(), key=lambda item: (-item[1][0], item[1][1]))
+            winner, (top, _) = ranked[0]
+            if len(ranked) > 1:
+                second = ranked[1][1][0]
+                price = min(top, second + bid_increment(second))
+            else:
+                price = min(top, listing.starting_bid + bid_increment(listing.starting_bid))
+
+            listing.refresh_from_db()
+            self.assertEqual(listing.leading_bid.user_id, winner, f"seed {seed}")
+            self.assertEqual(listing.current_price, price, f"seed {seed}")
+            self.assertEqual(listing.bid_count, listing.bids.count())
+
+    def test_proxy_view(self):
+        self.client.force_login(self.alice)
+        url = reverse("auctions:listing", args=[self.listing.id])
+        response = self.client.post(url, {"submit_proxy": "", "max_amount": "10.00"})
+        self.assertRedirects(response, url)
+        self.assertEqual(self.state(), (self.alice, Decimal("1.25")))
+
+
+class ApiTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.category = Category.objects.create(category="Books")
+        self.listing = self.create_listing(self.owner, title="Atlas", starting_bid="5.00", category=self.category)
+        self.detail = reverse("auctions:api_listing", args=[self.listing.id])
+
+    def test_invalid_category_filter_is_rejected(self):
+        url = reverse("auctions:api_listings")
+        for category in ["abc", "-1", "9" * 30]:
+            response = self.client.get(url, {"category": category})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"error": "category must be a category id"})
+        self.assertEqual(self.client.get(url, {"category": "999"}).json()["results"], [])
+
+    def test_listing_detail_is_compact_json(self):
+        response = self.client.get(self.detail)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertNotIn(b": ", response.content)
+        self.assertEqual(response.json()["current_price"], "5.00")
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+    def test_unchanged_listing_answers_not_modified(self):
+        etag = self.client.get(self.detail)["ETag"]
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        accept_bid(self.listing.id, self.bidder.id, Decimal("6.00"))
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["current_price"], "6.00")
+
+    def test_comment_moves_last_modified(self):
+        first = self.client.get(self.detail)
+        comment = Comment.objects.create(listing=self.listing, user=self.bidder, comment="Hi")
+        Comment.objects.filter(id=comment.id).update(timestamp=timezone.now() + timedelta(hours=1))
+        response = self.client.get(self.detail, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["Last-Modified"], first["Last-Modified"])
+
+    def test_feed_revalidates_until_listings_change(self):
+        url = reverse("auctions:api_listings")
+        response = self.client.get(url)
+        self.assertEqual([l["title"] for l in response.json()["results"]], ["Atlas"])
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.create_listing(self.owner, title="Bestiary")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    @override_settings(AUCTIONS_LISTINGS_PER_PAGE=2)
+    def test_bid_history_pages_newest_first(self):
+        for amount in ["6.00", "7.00", "8.00"]:
+            accept_bid(self.listing.id, self.bidder.id, Decimal(amount))
+        url = reverse("auctions:api_bids", args=[self.listing.id])
+
+        response = self.client.get(url).json()
+        self.assertEqual([bid["amount"] for bid in response["results"]], ["8.00", "7.00"])
+        response = self.client.get(response["links"]["next"]).json()
+        self.assertEqual([bid["amount"] for bid in response["results"]], ["6.00"])
+        self.assertIsNone(response["links"]["next"])
+
+    def test_categories_and_missing_listing(self):
+        url = reverse("auctions:api_categories")
+        response = self.client.get(url)
+        self.assertEqual(response.json()["results"], [{"id": self.category.id, "name": "Books", "active_listings": 1}])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        self.assertEqual(self.client.get(reverse("auctions:api_listing", args=[999])).status_code, 404)
+
+
+class BulkImportExportTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.category = Category.objects.create(category="Books")
+
+    def import_csv(self, content, chunk_size=None):
+        errors = []
+        rows = bulk.read_rows(StringIO(content), "csv")
+        report = bulk.import_listings(rows, self.owner, lambda line, message: errors.append((line, message)), chunk_size)
+        return report, errors
+
+    def test_import_in_chunks_sets_price_and_category(self):
+        lines = ["title,description,starting_bid,category"]
+        lines += [f"Novel {i},A book,{i + 1}.50,books" for i in range(7)]
+        report, errors = self.import_csv("\n".join(lines), chunk_size=3)
+
+        self.assertEqual((report.created, report.failed, errors), (7, 0, []))
+        listing = Listing.objects.get(title="Novel 2")
+        self.assertEqual(listing.current_price, Decimal("3.50"))
+        self.assertEqual(listing.category_id, self.category.id)
+
+    def test_import_reports_rejected_rows(self):
+        content = "\n".join([
+            "title,description,starting_bid,category",
+            "Good,Fine,1.00,",
+            "Bad price,Fine,free,",
+            "Unknown,Fine,1.00,Garden",
+        ])
+        report, errors = self.import_csv(content)
+
+        self.assertEqual((report.created, report.failed), (1, 2))
+        self.assertEqual([line for line, message in errors], [3, 4])
+        self.assertIn("starting_bid", errors[0][1])
+        self.assertIn("Unknown category", errors[1][1])
+
+    def test_import_uses_a_query_per_chunk(self):
+        lines = ["title,description,starting_bid"] + [f"Item {i},Thing,1.00" for i in range(200)]
+        with CaptureQueriesContext(connection) as queries:
+            self.import_csv("\n".join(lines), chunk_size=50)
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "auctions_listing"')]
+        self.assertEqual(len(inserts), 4)
+
+    def test_import_updates_search_counts_and_feed(self):
+        self.client.get(reverse("auctions:categories"))
+        feed = caching.feed_state()
+        self.import_csv("title,description,starting_bid,category\nAtlas,Maps,2.00,Books")
+
+        self.assertEqual([l.title for l in search.search_listings("atlas", 10)], ["Atlas"])
+        self.assertNotEqual(caching.feed_state(), feed)
+        response = self.client.get(reverse("auctions:categories"))
+        self.assertEqual(response.context["categories"][0].active_count, 1)
+
+    def test_jsonl_round_trip(self):
+        self.create_listing(self.owner, title="Lamp", starting_bid="4.00", category=self.category)
+        exported = "".join(bulk.export_rows("listings", "jsonl"))
+        Listing.objects.all().delete()
+
+        errors = []
+        rows = bulk.read_rows(StringIO(exported + "not json\n"), "jsonl")
+        report = bulk.import_listings(rows, self.owner, lambda line, message: errors.append(line))
+        self.assertEqual((report.created, errors), (1, [2]))
+        listing = Listing.objects.get()
+        self.assertEqual((listing.title, listing.current_price, listing.category_id), ("Lamp", Decimal("4.00"), self.category.id))
+
+    def test_upload_view(self):
+        self.client.force_login(self.owner)
+        upload = SimpleUploadedFile("listings.csv", b"title,description,starting_bid\nChair,Oak,9.99\nStool,Pine,\n")
+        response = self.client.post(reverse("auctions:import"), {"file": upload})
+
+        self.assertEqual(response.context["report"].created, 1)
+        self.assertEqual(response.context["errors"][0][0], 3)
+        self.assertEqual(Listing.objects.get().owner_id, self.owner.id)
+
+    def test_export_streams_for_staff_only(self):
+        listing = self.create_listing(self.owner, title="Clock")
+        accept_bid(listing.id, self.create_user("bidder").id, Decimal("2.00"))
+        bid = Bid.objects.get()
+        url = reverse("auctions:export", args=["bids"])
+
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.owner.is_staff = True
+        self.owner.save()
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,listing,bidder,bid_amount,timestamp")
+        self.assertTrue(lines[1].startswith(f"{bid.id},{listing.id},bidder,2.00,"))
+        self.assertEqual(self.client.get(url + "?format=xml").status_code, 404)
+
+    def test_commands(self):
+        path = os.path.join(tempfile.mkdtemp(), "listings.csv")
+        with open(path, "w") as file:
+            file.write("title,description,starting_bid\nDesk,Walnut,20.00\n,Missing title,1.00\n")
+        out, err = StringIO(), StringIO()
+        call_command("import_listings", path, owner="owner", stdout=out, stderr=err)
+        self.assertIn("Imported 1 listing(s), 1 rejected", out.getvalue())
+        self.assertIn("Line 3: title", err.getvalue())
+
+        out = StringIO()
+        call_command("export_data", "listings", format="jsonl", stdout=out)
+        self.assertIn('"title":"Desk"', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("import_listings", path, owner="nobody")
+
+
+class BenchmarkTests(AuctionTestCase):
+
+    def test_seed_writes_consistent_data(self):
+        created = benchmarking.seed(users=10, categories=3, listings=40, bids=4, comments=2, watchers=3)
+
+        self.assertEqual(created, {"users": 10, "categories": 3, "listings": 40})
+        self.assertEqual(Bid.objects.count(), 160)
+        self.assertEqual(Comment.objects.count(), 80)
+        self.assertEqual(Watchlist.objects.count(), 120)
+        self.assertEqual(rebuild_bid_state(fix=False), [])
+        self.assertFalse(Bid.objects.filter(user_id=F("listing__owner_id")).exists())
+        listing = Listing.objects.first()
+        self.assertIn(listing, search.search_listings(listing.title, 100))
+
+    def test_seed_is_repeatable_and_additive(self):
+        benchmarking.seed(users=5, categories=2, listings=5, bids=1, comments=0, watchers=1)
+        benchmarking.seed(users=5, categories=2, listings=5, bids=1, comments=0, watchers=1)
+        self.assertEqual((User.objects.count(), Listing.objects.count()), (10, 10))
+
+    def test_benchmark_reports_every_view(self):
+        benchmarking.seed(users=10, categories=3, listings=20, bids=2, comments=2, watchers=2)
+        results = benchmarking.benchmark(requests=5, warmup=1)
+
+        self.assertEqual(list(results), list(benchmarking.VIEWS))
+        for result in results.values():
+            self.assertEqual(result["errors"], 0)
+            self.assertGreater(result["throughput"], 0)
+            self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["max"])
+        self.assertEqual(Bid.objects.count(), 40 + 6)
+        self.assertIn("watchlist", benchmarking.format_report(results))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmarking.percentile(values, 0.5), 50)
+        self.assertEqual(benchmarking.percentile(values, 0.99), 99)
+        self.assertEqual(benchmarking.percentile([7], 0.9), 7)
+
+    def test_render_benchmark_reports_each_size(self):
+        benchmarking.seed(users=3, categories=1, listings=20, bids=1, comments=0, watchers=0)
+        with self.assertNumQueries(1):
+            results = benchmarking.render_benchmark(sizes=(10, 20), repeat=1)
+
+        self.assertEqual(list(results), [10, 20])
+        for modes in results.values():
+            self.assertEqual(list(modes), ["parse", "cold", "warm"])
+        self.assertIn("us/listing", benchmarking.format_render_report(results))
+        with self.assertRaises(ValueError):
+            benchmarking.render_benchmark(sizes=(30,))
+
+    def test_session_benchmark_reports_round_trips_saved(self):
+        benchmarking.seed(users=3, categories=1, listings=5, bids=1, comments=0, watchers=0)
+        results = benchmarking.session_benchmark(requests=2)
+
+        self.assertEqual(list(results), list(benchmarking.SESSION_ENGINES))
+        for engine, visitors in results.items():
+            self.assertEqual(visitors["anonymous"]["index"]["session_queries"], 0)
+        self.assertEqual(results["db"]["member"]["listing"]["session_queries"], 1)
+        self.assertEqual(results["cached_db"]["member"]["listing"]["session_queries"], 0)
+        self.assertEqual(results["signed_cookies"]["expired"]["listing"]["session_queries"], 0)
+        self.assertIn("signed_cookies queries", benchmarking.format_session_report(results))
+
+    def test_http_benchmark_counts_errors(self):
+        with StubImageServer({"/": (200, "text/html", b"ok")}) as server:
+            port = server.httpd.server_address[1]
+            results = benchmarking.http_benchmark(
+                "127.0.0.1", port, {"ok": lambda generator: "/", "missing": lambda generator: "/missing"}, requests=12, concurrency=3
+            )
+        self.assertEqual((results["ok"]["errors"], results["missing"]["errors"]), (0, 12))
+        self.assertEqual(len(server.hits), 24)
+        self.assertGreater(results["ok"]["throughput"], 0)
+
+    def test_seed_command(self):
+        out = StringIO()
+        call_command("seed_data", users=3, categories=1, listings=2, stdout=out)
+        self.assertIn("Seeded 3 user(s), 1 categories and 2 listing(s)", out.getvalue())
+
+
+class ListingCardTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.listing = self.create_listing(self.owner, title="Lamp")
+
+    def card_key(self, listing):
+        listing = Listing.objects.select_related("image").get(id=listing.id)
+        try:
+            digest, state = listing.image.digest, listing.image.state
+        except ListingImage.DoesNotExist:
+            digest, state = "", ""
+        return make_template_fragment_key(
+            "listing_card", [listing.id, listing.title, listing.description, listing.current_price, digest, state]
+        )
+
+    def test_feeds_share_cached_cards(self):
+        Watchlist.objects.create(listing=self.listing, user=self.bidder)
+        self.client.get(reverse("auctions:index"))
+        key = self.card_key(self.listing)
+        self.assertIn("Lamp", cache.get(key))
+
+        # The watchlist renders the card the index stored
+        cache.set(key, "<li>Cached card</li>")
+        self.client.force_login(self.bidder)
+        self.assertContains(self.client.get(reverse("auctions:watchlist")), "<li>Cached card</li>", html=True)
+
+    def test_cards_change_with_the_listing(self):
+        self.client.get(reverse("auctions:index"))
+
+        accept_bid(self.listing.id, self.bidder.id, Decimal("5.00"))
+        self.assertContains(self.client.get(reverse("auctions:index")), "£5.00")
+
+        Listing.objects.filter(id=self.listing.id).update(title="Brass lamp")
+        self.assertContains(self.client.get(reverse("auctions:index")), "Brass lamp")
+
+        ListingImage.objects.create(listing=self.listing, digest="c" * 64, state=ListingImage.READY)
+        self.assertContains(self.client.get(reverse("auctions:index")), reverse("auctions:thumbnail", args=["c" * 64, "card", "jpg"]))
+
+
+class AsyncViewTests(AuctionFixtures, TransactionTestCase):
+    # Async views read on pool threads with their own connections, so test data must be committed
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.listing = self.create_listing(self.owner, title="Lamp")
+        Comment.objects.create(listing=self.listing, user=self.bidder, comment="Does it work?")
+        Watchlist.objects.create(listing=self.listing, user=self.bidder)
+
+    def route_async(self):
+        # auctions.urls picks its read views when imported
+        override = self.settings(AUCTIONS_ASYNC_VIEWS=True)
+        override.enable()
+        self.addCleanup(self.reload_urls)
+        self.addCleanup(override.disable)
+        self.reload_urls()
+
+    def reload_urls(self):
+        importlib.reload(auction_urls)
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def pages(self):
+        anonymous = Client()
+        member = Client()
+        member.force_login(self.bidder)
+        return {
+            "index": anonymous.get(reverse("auctions:index")),
+            "categories": anonymous.get(reverse("auctions:categories")),
+            "listing": anonymous.get(reverse("auctions:listing", args=[self.listing.id])),
+            "listing:member": member.get(reverse("auctions:listing", args=[self.listing.id])),
+            "watchlist": member.get(reverse("auctions:watchlist")),
+        }
+
+    def query_count(self, response):
+        return int(re.search(r'desc="(\d+) queries"', response["Server-Timing"]).group(1))
+
+    def test_async_views_serve_the_same_pages(self):
+        expected = self.pages()
+        self.route_async()
+        cache.clear()
+        self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse("auctions:index")).func))
+        pages = self.pages()
+
+        for name, response in pages.items():
+            self.assertEqual(response.status_code, 200, name)
+            # Queries run on pool threads still count toward the request
+            self.assertEqual(self.query_count(response), self.query_count(expected[name]), name)
+        self.assertContains(pages["listing"], "Does it work?")
+        self.assertContains(pages["listing:member"], "watchlist-selected")
+        self.assertContains(pages["watchlist"], "Lamp")
+
+        for category in ["999", "abc"]:
+            self.assertEqual(Client().get(reverse("auctions:index"), {"category": category}).status_code, 404)
+
+    def test_middleware_matches_the_mode_it_wraps(self):
+        async def async_view(request):
+            pass
+
+        for middleware in [PerformanceMiddleware, ReplicaPinningMiddleware]:
+            self.assertTrue(asyncio.iscoroutinefunction(middleware(async_view)))
+            self.assertFalse(asyncio.iscoroutinefunction(middleware(lambda request: None)))
+
+    def test_listing_fragments_are_read_concurrently(self):
+        self.route_async()
+        # Each fragment waits for the other, so reading them one after another would break the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        get_listing_fragment = caching.get_listing_fragment
+
+        def meet(*args):
+            barrier.wait()
+            return get_listing_fragment(*args)
+
+        with mock.patch("auctions.caching.get_listing_fragment", side_effect=meet):
+            response = self.client.get(reverse("auctions:listing", args=[self.listing.id]))
+        self.assertContains(response, "Does it work?")
+
+    def test_other_methods_and_anonymous_watchlists_use_sync_rules(self):
+        self.route_async()
+        self.assertRedirects(self.client.get(reverse("auctions:watchlist")), "/login?next=/watchlist", fetch_redirect_response=False)
+        self.assertRedirects(
+            self.client.get(reverse("auctions:listing", args=[self.listing.id + 1])),
+            reverse("auctions:index"),
+            fetch_redirect_response=False
+        )
+
+        self.client.force_login(self.bidder)
+        response = self.client.post(reverse("auctions:listing", args=[self.listing.id]), {"bid_amount": "5.00", "submit_bid": ""})
+        self.assertRedirects(response, reverse("auctions:listing", args=[self.listing.id]), fetch_redirect_response=False)
+        self.assertEqual(Listing.objects.get(id=self.listing.id).current_price, Decimal("5.00"))
+        self.assertContains(self.client.get(reverse("auctions:listing", args=[self.listing.id])), "Your bid is currently winning!")
+
+    def test_asgi_requests_are_instrumented(self):
+        self.route_async()
+        response = asyncio.run(AsyncClient().get(reverse("auctions:index")))
+        self.assertContains(response, "Lamp")
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+
+
+class AnalyticsTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.rival = self.create_user("rival")
+        self.books = Category.objects.create(category="Books")
+        self.lamps = Category.objects.create(category="Lamps")
+        self.now = timezone.now()
+
+    def closed_listing(self, category, prices, opened_hours=10, closed_minutes_ago=5):
+        # A listing with the given bids, closed a while ago so it is past the rollup lag
+        listing = self.create_listing(self.owner, category=category)
+        for i, price in enumerate(prices):
+            accept_bid(listing.id, (self.bidder, self.rival)[i % 2].id, Decimal(price))
+        closed_at = self.now - timedelta(minutes=closed_minutes_ago)
+        Listing.objects.filter(id=listing.id).update(
+            active=False, closed_at=closed_at, timestamp=closed_at - timedelta(hours=opened_hours)
+        )
+        return listing
+
+    def stats(self, category):
+        return CategoryStats.objects.get(category=category)
+
+    def test_bid_history_pages_newest_first(self):
+        listing = self.create_listing(self.owner)
+        for amount in range(2, 7):
+            accept_bid(listing.id, (self.bidder, self.rival)[amount % 2].id, Decimal(amount))
+
+        with self.settings(AUCTIONS_BIDS_PER_PAGE=3):
+            response = self.client.get(reverse("auctions:bid_history", args=[listing.id]))
+            amounts = [bid.bid_amount for bid in response.context["bids"]]
+            self.assertEqual(amounts, [Decimal(6), Decimal(5), Decimal(4)])
+            self.assertContains(response, "5 bids")
+            self.assertContains(response, "rival")
+
+            after = response.context["bids"].next_cursor
+            response = self.client.get(reverse("auctions:bid_history", args=[listing.id]), {"after": after})
+            self.assertEqual([bid.bid_amount for bid in response.context["bids"]], [Decimal(3), Decimal(2)])
+        self.assertEqual(self.client.get(reverse("auctions:bid_history", args=[listing.id + 1])).status_code, 404)
+
+    def test_rollup_folds_in_closed_auctions(self):
+        self.closed_listing(self.books, ["5.00", "8.00"], opened_hours=10)
+        self.closed_listing(self.books, [], opened_hours=2)
+        self.closed_listing(self.lamps, ["20.00"], opened_hours=24)
+        self.closed_listing(None, ["3.00"])
+        self.create_listing(self.owner, category=self.books)
+
+        self.assertEqual(analytics.update_category_stats(), 4)
+        books = self.stats(self.books)
+        self.assertEqual((books.closed, books.sold, books.bids), (2, 1, 2))
+        self.assertEqual(books.average_closing_price, Decimal("8.00"))
+        self.assertEqual(books.bids_per_auction, 1)
+        self.assertEqual(books.average_time_to_close, timedelta(hours=6))
+        self.assertEqual(self.stats(self.lamps).average_closing_price, Decimal("20.00"))
+        self.assertEqual(self.stats(None).closed, 1)
+
+    def test_rollup_is_incremental(self):
+        self.closed_listing(self.books, ["5.00"])
+        self.assertEqual(analytics.update_category_stats(), 1)
+        self.assertEqual(analytics.update_category_stats(), 0)
+
+        # Closures share a timestamp when closed in one batch, the mark breaks ties by id
+        for listing in [self.closed_listing(self.books, ["7.00"]) for i in range(3)]:
+            Listing.objects.filter(id=listing.id).update(closed_at=self.now - timedelta(minutes=2))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(analytics.update_category_stats(batch_size=2), 3)
+        self.assertFalse([query for query in queries if "auctions_bid" in query["sql"]])
+        self.assertEqual(self.stats(self.books).closing_total, Decimal("26.00"))
+
+        totals = list(CategoryStats.objects.order_by("id").values_list("closed", "sold", "bids", "closing_total", "seconds_open"))
+        analytics.rebuild_category_stats()
+        self.assertEqual(list(CategoryStats.objects.order_by("id").values_list("closed", "sold", "bids", "closing_total", "seconds_open")), totals)
+
+    def test_recent_closures_wait_for_the_lag(self):
+        self.closed_listing(self.books, ["5.00"], closed_minutes_ago=0)
+        self.assertEqual(analytics.update_category_stats(), 0)
+        self.assertEqual(analytics.update_category_stats(now=self.now + timedelta(seconds=settings.AUCTIONS_ROLLUP_LAG)), 1)
+
+    def test_analytics_page_reads_the_rollup(self):
+        self.closed_listing(self.books, ["5.00", "9.50"])
+        call_command("update_analytics", stdout=StringIO())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("auctions:analytics"))
+        self.assertContains(response, "£9.50")
+        self.assertContains(response, "10:00:00")
+        self.assertFalse([query for query in queries if "auctions_bid" in query["sql"] or "auctions_listing" in query["sql"]])
+
+    def test_command_output(self):
+        self.closed_listing(self.books, ["5.00"])
+        out = StringIO()
+        call_command("update_analytics", stdout=out)
+        call_command("update_analytics", rebuild=True, stdout=out)
+        self.assertIn("Added 1 closed auction(s) to analytics", out.getvalue())
+        self.assertIn("Rebuilt analytics from 1 closed auction(s)", out.getvalue())
+
+
+class NotificationTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.alice = self.create_user("alice")
+        self.bob = self.create_user("bob")
+        self.listing = self.create_listing(self.owner, title="Lamp")
+        notifications.outbox.clear()
+
+    def watch(self, count):
+        # Watchers beyond alice and bob, who may also watch
+        User.objects.bulk_create(User(username=f"watcher{i}") for i in range(count))
+        users = set(User.objects.filter(username__startswith="watcher").values_list("id", flat=True))
+        Watchlist.objects.bulk_create(Watchlist(listing=self.listing, user_id=id) for id in users)
+        return users
+
+    def sent(self):
+        return [(notification.user_id, notification.kind) for notification in notifications.outbox]
+
+    def drain(self, **kwargs):
+        return notifications.drain(backend=notifications.LocmemBackend(), **kwargs)
+
+    def test_outbox_row_is_written_with_the_bid(self):
+        with self.assertRaises(BidRejected), transaction.atomic():
+            accept_bid(self.listing.id, self.alice.id, Decimal("0.50"))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        bid = accept_bid(self.listing.id, self.alice.id, Decimal("2.00"))
+        close_listing(self.listing.id)
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by("id").values_list("kind", "bid")),
+            [(OutboxEvent.BID, bid.id), (OutboxEvent.CLOSED, None)]
+        )
+
+    def test_request_path_does_not_grow_with_watchers(self):
+        def bid_queries(amount):
+            with CaptureQueriesContext(connection) as queries:
+                accept_bid(self.listing.id, self.alice.id, Decimal(amount))
+            return len(queries)
+
+        few = bid_queries("2.00")
+        self.watch(300)
+        self.assertEqual(bid_queries("3.00"), few)
+        self.assertFalse(notifications.outbox)
+
+    def test_fan_out_reaches_watchers_and_previous_leader(self):
+        watchers = self.watch(25)
+        Watchlist.objects.create(listing=self.listing, user=self.bob)
+        accept_bid(self.listing.id, self.alice.id, Decimal("2.00"))
+        accept_bid(self.listing.id, self.bob.id, Decimal("3.00"))
+        Listing.objects.filter(id=self.listing.id).update(active=True)
+
+        # The batch is coalesced, watchers hear of bob's bid once and alice is told she was outbid
+        self.assertEqual(self.drain(chunk_size=10), 2)
+        sent = self.sent()
+        self.assertEqual(sent[0], (self.alice.id, notifications.OUTBID))
+        self.assertEqual({user for user, kind in sent if kind == notifications.NEW_BID}, watchers)
+        self.assertEqual(len(sent), len(watchers) + 1)
+        self.assertEqual(notifications.outbox[0].amount, Decimal("3.00"))
+        self.assertEqual(notifications.outbox[0].title, "Lamp")
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(self.drain(), 0)
+
+        # Closing tells the winner they won and every other watcher it closed
+        Watchlist.objects.create(listing=self.listing, user=self.alice)
+        notifications.outbox.clear()
+        close_listing(self.listing.id)
+        self.drain()
+        self.assertIn((self.bob.id, notifications.WON), self.sent())
+        self.assertEqual({user for user, kind in self.sent() if kind == notifications.CLOSED}, watchers | {self.alice.id})
+
+    def test_interrupted_fan_out_resumes_from_its_cursor(self):
+        watchers = self.watch(30)
+        accept_bid(self.listing.id, self.alice.id, Decimal("2.00"))
+
+        class FailingBackend(notifications.LocmemBackend):
+            calls = 0
+
+            def send_many(self, batch):
+                FailingBackend.calls += 1
+                if FailingBackend.calls == 3:
+                    raise OSError("delivery failed")
+                super().send_many(batch)
+
+        with self.assertLogs("auctions.notifications", "ERROR"):
+            self.assertEqual(notifications.drain(chunk_size=10, backend=FailingBackend()), 0)
+        self.assertEqual(len(notifications.outbox), 20)
+
+        # Still claimed until the claim times out, then picked up where it stopped
+        self.assertEqual(self.drain(), 0)
+        later = timezone.now() + notifications.CLAIM_TIMEOUT + timedelta(seconds=1)
+        self.assertEqual(self.drain(chunk_size=10, now=later), 1)
+        self.assertEqual(sorted(user for user, kind in self.sent()), sorted(watchers))
+
+    def test_file_backend_writes_json_lines(self):
+        path = os.path.join(tempfile.mkdtemp(), "notifications.log")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        Watchlist.objects.create(listing=self.listing, user=self.bob)
+        accept_bid(self.listing.id, self.alice.id, Decimal("2.50"))
+
+        out = StringIO()
+        with self.settings(AUCTIONS_NOTIFICATION_BACKEND="auctions.notifications.FileBackend", AUCTIONS_NOTIFICATION_FILE=path):
+            call_command("send_notifications", stdout=out)
+        self.assertIn("Sent notifications for 1 event(s)", out.getvalue())
+        with open(path) as file:
+            self.assertEqual(
+                file.read(),
+                f'{{"user": {self.bob.id}, "kind": "new_bid", "listing": {self.listing.id}, "title": "Lamp", "amount": "2.50"}}\n'
+            )
+
+
+class SessionTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.listing = self.create_listing(self.owner)
+        self.paths = [
+            reverse("auctions:index"),
+            reverse("auctions:categories"),
+            reverse("auctions:listing", args=[self.listing.id]),
+        ]
+
+    def session_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries if "django_session" in query["sql"]]
+
+    def test_anonymous_reads_never_touch_sessions(self):
+        for engine in ["db", "cached_db", "signed_cookies"]:
+            with self.subTest(engine=engine), self.settings(SESSION_ENGINE=f"django.contrib.sessions.backends.{engine}"):
+                self.client = Client()
+                for path in self.paths:
+                    self.assertEqual(self.session_queries(path), [])
+                self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_flash_messages_do_not_create_sessions(self):
+        response = self.client.get(reverse("auctions:listing", args=[self.listing.id + 1]), follow=True)
+        self.assertContains(response, "Listing does not exist")
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_cached_sessions_are_the_default_only_with_a_shared_cache(self):
+        module = importlib.import_module(os.environ["DJANGO_SETTINGS_MODULE"])
+        self.addCleanup(importlib.reload, module)
+        engines = {}
+        for backend in ["django.core.cache.backends.locmem.LocMemCache", "django.core.cache.backends.memcached.PyLibMCCache"]:
+            environ = {key: value for key, value in os.environ.items() if key != "AUCTIONS_SESSION_ENGINE"}
+            with mock.patch.dict(os.environ, dict(environ, AUCTIONS_SESSION_CACHE_BACKEND=backend), clear=True):
+                engines[backend.rsplit(".", 1)[1]] = importlib.reload(module).SESSION_ENGINE
+        self.assertEqual(engines, {
+            "LocMemCache": "django.contrib.sessions.backends.db",
+            "PyLibMCCache": "django.contrib.sessions.backends.cached_db",
+        })
+
+    def test_cached_sessions_skip_the_table_until_logout(self):
+        with self.settings(SESSION_ENGINE="django.contrib.sessions.backends.cached_db"):
+            self.client.post(reverse("auctions:login"), {"username": "owner", "password": "password"})
+            self.assertTrue(Session.objects.exists())
+            for path in self.paths:
+                self.assertEqual(self.session_queries(path), [])
+            self.assertContains(self.client.get(self.paths[0]), "Signed in as")
+
+            self.client.get(reverse("auctions:logout"))
+            self.assertFalse(Session.objects.exists())
+            self.assertNotContains(self.client.get(self.paths[0]), "Signed in as")
+
+    def test_signed_cookie_sessions_never_use_the_table(self):
+        with self.settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies"):
+            self.client.post(reverse("auctions:login"), {"username": "owner", "password": "password"})
+            for path in self.paths:
+                self.assertEqual(self.session_queries(path), [])
+            self.assertContains(self.client.get(self.paths[0]), "Signed in as")
+        self.assertFalse(Session.objects.exists())
+
+
+class QueryBudgetTests(AuctionTestCase):
+
+    def test_every_url_is_covered(self):
+        self.assertEqual(budgets.uncovered_urls(), [])
+
+    def test_urls_stay_within_budget_at_every_scale(self):
+        failures = budgets.check(budgets.measure_scales(), budgets.load_budgets())
+        self.assertFalse(failures, "\n\n".join(failures))
+
+    def test_query_growth_is_reported_with_sql(self):
+        def result(sql):
+            return {"url": "/", "status": 200, "queries": len(sql), "ms": 1.0, "sql": sql}
+        small = {"index": result(["SELECT listings"])}
+        large = {"index": result(["SELECT listings", "SELECT bid 1", "SELECT bid 2"])}
+
+        failures = budgets.check([small, large], {"index": {"queries": 1, "ms": 500}})
+        self.assertEqual(len(failures), 1)
+        self.assertIn("queries grew with data from 1 to 3", failures[0])
+        self.assertIn("ran 3 queries, budget is 1", failures[0])
+        self.assertIn("SELECT bid 2", failures[0])
+
+    def test_time_budgets_are_opt_in(self):
+        slow = {"index": {"url": "/", "status": 200, "queries": 1, "ms": 900.0, "sql": ["SELECT listings"]}}
+        self.assertEqual(budgets.check([slow, slow], {"index": {"queries": 1, "ms": 500}}), [])
+        failures = budgets.check([slow, slow], {"index": {"queries": 1, "ms": 500}}, timing=True)
+        self.assertIn("took 900ms, budget is 500ms", failures[0])
+
+
+class InstrumentationTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        instrumentation.reset()
+        self.owner = self.create_user("owner")
+        self.listing = self.create_listing(self.owner)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("auctions:listing", args=[self.listing.id]))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertRegex(timing, r"^db;dur=[\d.]+;desc=\"\d+ queries\", template;dur=[\d.]+, total;dur=[\d.]+$")
+
+    @override_settings(AUCTIONS_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        self.assertFalse(self.client.get(reverse("auctions:index")).has_header("Server-Timing"))
+
+    def test_metrics_histograms_per_url_name(self):
+        self.client.get(reverse("auctions:index"))
+        self.client.get(reverse("auctions:index"))
+        self.client.get("/no-such-page")
+        body = self.client.get(reverse("auctions:metrics")).content.decode()
+
+        self.assertIn('auctions_requests_total{view="auctions:index",status="200"} 2', body)
+        self.assertIn('auctions_requests_total{view="unmatched",status="404"} 1', body)
+        self.assertIn('auctions_request_duration_seconds_bucket{view="auctions:index",le="+Inf"} 2', body)
+        self.assertIn('auctions_db_queries_count{view="auctions:index"} 2', body)
+        self.assertRegex(body, r'auctions_template_duration_seconds_sum\{view="auctions:index"\} 0\.0*[1-9]')
+        self.assertIn('auctions_response_size_bytes_count{view="auctions:index"} 2', body)
+
+    def test_metrics_restricted_to_allowed_addresses(self):
+        url = reverse("auctions:metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="203.0.113.9").status_code, 404)
+        self.owner.is_staff = True
+        self.owner.save()
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="203.0.113.9").status_code, 200)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = instrumentation.Histogram("test_seconds", "Test", (0.1, 1.0))
+        for amount in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('say "hi"',), amount)
+        lines = histogram.render().splitlines()
+
+        self.assertEqual(lines[2:], [
+            'test_seconds_bucket{view="say \\"hi\\"",le="0.1"} 2',
+            'test_seconds_bucket{view="say \\"hi\\"",le="1.0"} 3',
+            'test_seconds_bucket{view="say \\"hi\\"",le="+Inf"} 4',
+            'test_seconds_sum{view="say \\"hi\\""} 3.65',
+            'test_seconds_count{view="say \\"hi\\""} 4',
+        ])
+
+
+class DatabaseProfileTests(AuctionFixtures, TransactionTestCase):
+
+    @skipUnless(connection.vendor == "sqlite", "Pragmas apply to SQLite only")
+    def test_sqlite_connections_are_tuned(self):
+        connection.close()
+        with connection.cursor() as cursor:
+            # WAL is stored in the file, so it is only switched on when asked for
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "delete")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_pragmas_are_not_counted_as_queries(self):
+        connection.close()
+        with CaptureQueriesContext(connection) as queries:
+            connection.ensure_connection()
+        self.assertEqual(len(queries), 0)
+
+    def test_write_benchmark(self):
+        result = benchmarking.write_benchmark(threads=4, bids=10, listings=2)
+        self.assertEqual(result["attempted"], 40)
+        self.assertEqual(result["accepted"] + result["outbid"] + result["locked"], 40)
+        self.assertEqual(result["locked"], 0)
+        self.assertEqual(Bid.objects.count(), result["accepted"])
+        self.assertEqual(rebuild_bid_state(fix=False), [])
+
+
+@skipUnless(connection.vendor == "sqlite", "The replica is a copy of the SQLite test database")
+@override_settings(AUCTIONS_DB_REPLICAS=["replica"])
+class ReplicaRouterTests(AuctionFixtures, TransactionTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite file, refreshed from the primary by replicate()
+        # Note: added after the test case guards its databases, and removed before they are restored
+        super().setUpClass()
+        cls.replica_path = os.path.join(tempfile.mkdtemp(), "replica.sqlite3")
+        connections.databases["replica"] = dict(connections.databases["default"], NAME=cls.replica_path)
+        cls.replicate()
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica"].close()
+        del connections.databases["replica"]
+        del connections["replica"]
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user("owner")
+        self.bidder = self.create_user("bidder")
+        self.listing = self.create_listing(self.owner, starting_bid="1.00")
+        self.bidder_client = Client()
+        self.bidder_client.force_login(self.bidder)
+        self.replicate()
+
+    @classmethod
+    def replicate(cls):
+        # Copies the primary over the replica, standing in for replication
+        connections["replica"].close()
+        source = sqlite3.connect(connections["default"].settings_dict["NAME"])
+        target = sqlite3.connect(cls.replica_path)
+        with target:
+            source.backup(target)
+        source.close()
+        target.close()
+
+    def test_reads_use_the_replica(self):
+        with CaptureQueriesContext(connections["replica"]) as replica, CaptureQueriesContext(connection) as primary:
+            response = self.client.get(reverse("auctions:listing", args=[self.listing.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(replica), 0)
+        self.assertEqual(len(primary), 0)
+
+    def test_bidder_reads_their_own_bid_from_the_primary(self):
+        url = reverse("auctions:listing", args=[self.listing.id])
+        response = self.bidder_client.post(url, {"bid_amount": "2.00", "submit_bid": ""})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.AUCTIONS_REPLICA_PIN_COOKIE, response.cookies)
+
+        # The replica has not caught up, so only the pinned bidder sees the new price
+        self.assertIn('<span id="current-bid">2.00</span>', self.bidder_client.get(url).content.decode())
+        self.assertIn('<span id="current-bid">1.00</span>', Client().get(url).content.decode())
+
+        # Pages read while the replica may lag are not cached, so replication shows through
+        self.replicate()
+        self.assertIn('<span id="current-bid">2.00</span>', Client().get(url).content.decode())
+
+    def test_reads_without_writes_do_not_pin(self):
+        response = self.bidder_client.get(reverse("auctions:index"))
+        self.assertNotIn(settings.AUCTIONS_REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_transactions_read_from_the_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Listing), "replica")
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Listing), "default")
+        self.assertEqual(router.db_for_write(Listing), "default")
+        self.assertFalse(router.allow_migrate("replica", "auctions"))
+
+    @override_settings(AUCTIONS_DB_REPLICAS=[])
+    def test_no_replicas_leaves_routing_alone(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(Listing))
+        response = self.bidder_client.post(
+            reverse("auctions:listing", args=[self.listing.id]), {"bid_amount": "2.00", "submit_bid": ""}
+        )
+        self.assertNotIn(settings.AUCTIONS_REPLICA_PIN_COOKIE, response.cookies)
+
+
+class StubImageServer:
+    # Serves fixed responses from a local thread, standing in for remote image hosts
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.hits = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits.append(self.path)
+                status, content_type, body = server.routes.get(self.path, (404, "text/plain", b"Not found"))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+
+class ListingImageTests(AuctionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media, AUCTIONS_IMAGE_ALLOW_PRIVATE_HOSTS=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = self.create_user("owner")
+
+    def photo(self, width=2000, height=1500, format="JPEG"):
+        # Noise compresses badly, much like a real photograph
+        buffer = BytesIO()
+        Image.effect_noise((width, height), 64).convert("RGB").save(buffer, format, quality=95)
+        return buffer.getvalue()
+
+    def test_saving_a_listing_queues_its_image(self):
+        listing = self.create_listing(self.owner, image_URL="https://example.com/a.jpg")
+        image = ListingImage.objects.get(listing=listing)
+        self.assertEqual((image.source, image.state), ("https://example.com/a.jpg", ListingImage.PENDING))
+
+        ListingImage.objects.filter(id=image.id).update(state=ListingImage.READY, digest="a" * 64)
+        listing.save()
+        self.assertEqual(ListingImage.objects.get(id=image.id).state, ListingImage.READY)
+
+        listing.image_URL = "https://example.com/b.jpg"
+        listing.save()
+        image = ListingImage.objects.get(id=image.id)
+        self.assertEqual((image.source, image.state, image.digest), ("https://example.com/b.jpg", ListingImage.PENDING, ""))
+
+    @override_settings(AUCTIONS_IMAGE_ALLOW_PRIVATE_HOSTS=False)
+    def test_private_and_non_http_urls_are_refused(self):
+        with self.assertRaisesMessage(images.ImageError, "is not public"):
+            images.fetch("http://127.0.0.1:8000/image.jpg")
+        with self.assertRaisesMessage(images.ImageError, "Unsupported image URL"):
+            images.fetch("file:///etc/passwd")
+
+    def test_thumbnails_are_served_with_long_cache_headers(self):
+        digest = "b" * 64
+        images.store_thumbnail(digest, "card", "webp", b"webp bytes")
+
+        response = self.client.get(reverse("auctions:thumbnail", args=[digest, "card", "webp"]))
+        self.assertEqual(b"".join(response.streaming_content), b"webp bytes")
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(self.client.get(reverse("auctions:thumbnail", args=[digest, "card", "jpg"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("auctions:thumbnail", args=[digest, "huge", "webp"])).status_code, 404)
+
+    def test_pending_images_show_the_placeholder(self):
+        self.create_listing(self.owner, image_URL="https://example.com/a.jpg")
+        content = self.client.get(reverse("auctions:index")).content.decode()
+        self.assertIn("/static/auctions/noimage.png", content)
+        self.assertNotIn("https://example.com/a.jpg", content)
+
+    @skipUnless(images.available(), "Pillow is not installed")
+    def test_worker_fetches_each_url_once(self):
+        with StubImageServer({"/photo.jpg": (200, "image/jpeg", self.photo())}) as server:
+            first = self.create_listing(self.owner, title="First", image_URL=server.url("/photo.jpg"))
+            second = self.create_listing(self.owner, title="Second", image_URL=server.url("/photo.jpg"))
+            self.assertEqual(images.process_pending(), 2)
+
+        self.assertEqual(server.hits, ["/photo.jpg"])
+        digests = set(ListingImage.objects.filter(state=ListingImage.READY).values_list("digest", flat=True))
+        self.assertEqual(len(digests), 1)
+        digest = digests.pop()
+        for size, bounds in settings.AUCTIONS_THUMBNAIL_SIZES.items():
+            for format in images.FORMATS:
+                with Image.open(images.thumbnail_path(digest, size, format)) as thumbnail:
+                    self.assertLessEqual(thumbnail.size, bounds)
+
+    @skipUnless(images.available(), "Pillow is not installed")
+    def test_feed_page_weight_drops_tenfold(self):
+        photo = self.photo()
+        with StubImageServer({"/photo.jpg": (200, "image/jpeg", photo)}) as server:
+            for i in range(5):
+                self.create_listing(self.owner, title=f"Item {i}", image_URL=server.url("/photo.jpg"))
+            images.process_pending()
+
+        for name in ("auctions:index", "auctions:watchlist"):
+            self.client.force_login(self.owner)
+            Watchlist.objects.bulk_create(
+                Watchlist(listing=listing, user=self.owner) for listing in Listing.objects.exclude(watchlist__user=self.owner)
+            )
+            content = self.client.get(reverse(name)).content.decode()
+            sources = re.findall(r'<img[^>]* src="([^"]+)"', content)
+            self.assertEqual(len(sources), 5)
+            weight = sum(len(b"".join(self.client.get(source).streaming_content)) for source in sources)
+            self.assertLess(weight * 10, len(photo) * 5)
+
+    @skipUnless(images.available(), "Pillow is not installed")
+    def test_failed_fetches_retry_then_give_up(self):
+        with StubImageServer({}) as server:
+            listing = self.create_listing(self.owner, image_URL=server.url("/missing.jpg"))
+            for attempt in range(settings.AUCTIONS_IMAGE_MAX_ATTEMPTS):
+                images.process_pending()
+        image = ListingImage.objects.get(listing=listing)
+        self.assertEqual((image.state, image.attempts), (ListingImage.FAILED, settings.AUCTIONS_IMAGE_MAX_ATTEMPTS))
+        self.assertIn("404", image.error)
+        self.assertEqual(len(server.hits), settings.AUCTIONS_IMAGE_MAX_ATTEMPTS)
+
+    @skipUnless(images.available(), "Pillow is not installed")
+    def test_processed_uploads_replace_cached_placeholder_cards(self):
+        listing = self.create_listing(self.owner, title="Lamp")
+        images.queue_upload(listing, self.photo(400, 300))
+        self.assertIn("/static/auctions/noimage.png", self.client.get(reverse("auctions:index")).content.decode())
+
+        images.process_pending()
+        digest = ListingImage.objects.get(listing=listing).digest
+        content = self.client.get(reverse("auctions:index")).content.decode()
+        self.assertIn(reverse("auctions:thumbnail", args=[digest, "card", "webp"]), content)
+        self.assertNotIn("/static/auctions/noimage.png", content)
+
+    @skipUnless(images.available(), "Pillow is not installed")
+    def test_unexpected_errors_fail_only_their_image(self):
+        broken = self.create_listing(self.owner, title="Broken")
+        working = self.create_listing(self.owner, title="Working")
+        images.queue_upload(broken, b"broken")
+        images.queue_upload(working, self.photo(400, 300))
+        broken_digest = ListingImage.objects.get(listing=broken).digest
+        make_thumbnails = images.make_thumbnails
+
+        def explode(digest):
+            if digest == broken_digest:
+                raise ValueError("Unexpected decoder state")
+            make_thumbnails(digest)
+
+        with mock.patch.object(images, "make_thumbnails", explode), self.assertLogs("auctions.images", "ERROR"):
+            self.assertEqual(images.process_pending(), 2)
+        image = ListingImage.objects.get(listing=broken)
+        self.assertEqual((image.state, image.attempts, image.error), (ListingImage.PENDING, 1, "Unexpected decoder state"))
+        self.assertEqual(ListingImage.objects.get(listing=working).state, ListingImage.READY)
+
+    @skipUnless(images.available(), "Pillow is not installed")
+    def test_uploads_are_thumbnailed(self):
+        self.client.force_login(self.owner)
+        upload = SimpleUploadedFile("photo.png", self.photo(800, 600, "PNG"), content_type="image/png")
+        response = self.client.post(reverse("auctions:create"), {
+            "title": "Lamp", "description": "Brass", "starting_bid": "5.00", "owner": self.owner.id, "image_file": upload
+        })
+        listing = Listing.objects.get(title="Lamp")
+        self.assertRedirects(response, reverse("auctions:listing", args=[listing.id]))
+        self.assertEqual(ListingImage.objects.get(listing=listing).source, "")
+
+        out, err = StringIO(), StringIO()
+        call_command("process_images", stdout=out, stderr=err)
+        self.assertIn("Processed 1 image(s)", out.getvalue())
+        self.assertIn("AUCTIONS_CACHE_BACKEND", err.getvalue())
+        digest = ListingImage.objects.get(listing=listing).digest
+        content = self.client.get(reverse("auctions:listing", args=[listing.id])).content.decode()
+        self.assertIn(reverse("auctions:thumbnail", args=[digest, "detail", "webp"]), content)
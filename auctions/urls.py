@@ -1,17 +1,32 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 
-from . import views
+from . import api, async_views, views
 
 app_name = "auctions"
 
+# Async read paths for ASGI deployments, the sync views suit WSGI workers better
+read_views = async_views if settings.AUCTIONS_ASYNC_VIEWS else views
+
 urlpatterns = [
-    path("", views.index, name="index"),
+    path("", read_views.index, name="index"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("user", views.user, name="user"),
-    path("categories", views.categories, name="categories"),
+    path("categories", read_views.categories, name="categories"),
+    path("analytics", views.analytics_view, name="analytics"),
+    path("search", views.search, name="search"),
+    path("metrics", views.metrics, name="metrics"),
     path("create", views.create, name="create"),
-    path("watchlist", views.watchlist, name="watchlist"),
-    path("listing/<int:listing_id>", views.listing, name="listing")
+    path("import", views.import_listings, name="import"),
+    path("export/<str:kind>", views.export, name="export"),
+    path("watchlist", read_views.watchlist, name="watchlist"),
+    path("listing/<int:listing_id>", read_views.listing, name="listing"),
+    path("listing/<int:listing_id>/bids", views.bid_history, name="bid_history"),
+    re_path(r"^media/thumbnails/(?P<digest>[0-9a-f]{64})-(?P<size>[a-z]+)\.(?P<format>webp|jpg)$", views.thumbnail, name="thumbnail"),
+    path("api/v1/listings", api.listings, name="api_listings"),
+    path("api/v1/listings/<int:listing_id>", api.listing, name="api_listing"),
+    path("api/v1/listings/<int:listing_id>/bids", api.bids, name="api_bids"),
+    path("api/v1/categories", api.categories, name="api_categories")
 ]
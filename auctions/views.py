@@ -1,16 +1,31 @@
+import codecs
+import csv
+import os
+from datetime import timedelta
+
 from django import forms
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render, redirect
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _
 
 from .models import User, Bid, Category, Comment, Listing, Watchlist
-from .utils import get_bid
+from . import analytics, bulk, caching, images, instrumentation
+from .caching import get_category_choices, get_category_counts
+from .pagination import KeysetPaginator
+from .search import search_listings
+from .services import BidRejected, accept_bid, close_listing, place_proxy_bid
 
 
 class CreateListing(forms.Form):
@@ -36,56 +51,68 @@ class CreateListing(forms.Form):
         help_text="Provide a link to your image", 
         widget=forms.URLInput(attrs={"class":"form-control"})
         )
+    image_file = forms.FileField(
+        label="Image upload",
+        required=False,
+        help_text="Or upload an image from your device",
+        widget=forms.ClearableFileInput(attrs={"class":"form-control-file"})
+        )
 
-    # Generates tuple list of categories
-    # Note: tuple required as choice field defines name and value
-    options = Category.objects.all().order_by("category")
-    categories = [(None, "Please select...")]
-    for option in options:
-        categories.append((option.id, option.category))
-    
+    # Category choices are loaded lazily from a per-process cache
+    # Note: callable choices are evaluated when the form is used, never at import
     category = forms.ChoiceField(
-        choices=categories, 
+        choices=get_category_choices, 
         required=False,
         help_text="Select the most appropriate category for your listing",
         widget=forms.Select(attrs={"class":"form-control"})
         )
+    duration = forms.TypedChoiceField(
+        label="Auction length",
+        choices=[("", "Until closed"), (1, "1 day"), (3, "3 days"), (7, "7 days"), (14, "14 days")],
+        coerce=int,
+        empty_value=None,
+        required=False,
+        help_text="The auction closes automatically once this time has passed",
+        widget=forms.Select(attrs={"class":"form-control"})
+        )
     owner = forms.IntegerField(
         widget=forms.HiddenInput
         )
 
+    def clean_image_file(self):
+        upload = self.cleaned_data["image_file"]
+        if upload and upload.size > settings.AUCTIONS_IMAGE_MAX_BYTES:
+            raise ValidationError(f"Images must be under {settings.AUCTIONS_IMAGE_MAX_BYTES // (1024 * 1024)}MB")
+        return upload
+
 class BidForm(forms.Form):
-    current_bid = forms.DecimalField(
-        widget=forms.HiddenInput
-    )
-    listing_id = forms.IntegerField(
-        widget=forms.HiddenInput
-    )
-    user_id = forms.IntegerField(
-        widget=forms.HiddenInput
-    )
     bid_amount = forms.DecimalField(
         label="Place bid",
+        min_value=0.01,
         max_digits=8,
         decimal_places=2
     )
 
-    # Validates new bid is greater than current bid
-    def clean_bid_amount(self):
-        bid_amount = self.cleaned_data["bid_amount"]
-        current_bid = self.cleaned_data["current_bid"]
-
-        if bid_amount <= current_bid:
-            error = ValidationError(
-                _("Error: New bid must be greater than the previous bid of £%(bid)s"),
-                code="invalid",
-                params={"bid":current_bid})
-            self.add_error("bid_amount", error)
-        
-        return bid_amount
+class ProxyBidForm(forms.Form):
+    max_amount = forms.DecimalField(
+        label="Maximum bid",
+        min_value=0.01,
+        max_digits=8,
+        decimal_places=2,
+        help_text="We bid for you, only as much as needed to keep you in the lead"
+    )
 
-    # Validation for current_bid owner vs current user
-    ## TO DO
+class ImportForm(forms.Form):
+    file = forms.FileField(
+        label="Listings file",
+        help_text="CSV with a header row, or JSON Lines with one listing per line",
+        widget=forms.ClearableFileInput(attrs={"class":"form-control-file"})
+    )
+    format = forms.ChoiceField(
+        choices=[("", "Detect from file name"), ("csv", "CSV"), ("jsonl", "JSON Lines")],
+        required=False,
+        widget=forms.Select(attrs={"class":"form-control"})
+    )
 
 class CommentForm(forms.Form):
     listing_id = forms.IntegerField(
@@ -101,28 +128,63 @@ class CommentForm(forms.Form):
         widget=forms.Textarea(attrs={"class":"comments"})
     )
 
+def _category_id(value):
+    # Category ids arrive from forms and query strings, anything but a database id is a 404
+    try:
+        category_id = int(value)
+    except ValueError:
+        raise Http404("Category does not exist")
+    if not 0 < category_id < 2 ** 63:
+        raise Http404("Category does not exist")
+    return category_id
+
 def index(request):
 
-    # Gets all listings, POST method provides additional filters
-    if request.method == "POST":
-        category_id = request.POST['category']
-        category = Category.objects.filter(id=category_id).get()
-        listings = Listing.objects.filter(active=True, category_id=category_id).order_by('title')
+    # Gets all listings, category filter arrives by POST or with GET page links
+    category_id = request.POST.get('category') or request.GET.get('category')
+    if category_id:
+        category_id = _category_id(category_id)
+        category = get_object_or_404(Category, id=category_id)
+        listings = Listing.objects.filter(active=True, category_id=category_id).select_related('image')
     else:
-        listings = Listing.objects.filter(active=True).order_by('title')
+        listings = Listing.objects.filter(active=True).select_related('image')
         category = None
 
-    # Creates dict of highest bid for each listing
-    bids = {}
-    for listing in listings:
-        bids.update(get_bid(listing))
+    # Pages by (title, id) so each page seeks straight to its first row
+    paginator = KeysetPaginator(listings, ("title", "id"), settings.AUCTIONS_LISTINGS_PER_PAGE)
+    page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
 
     return render(request, "auctions/index.html", {
-        "listings": listings,
-        "bids": bids,
+        "listings": page,
         "category": category
     })
 
+def metrics(request):
+    # Prometheus text format, for this process only
+    # Note: the address is checked first so scrapes never load a session
+    if request.META.get("REMOTE_ADDR") not in settings.AUCTIONS_METRICS_IPS and not request.user.is_staff:
+        raise Http404("Not found")
+    return HttpResponse(instrumentation.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def thumbnail(request, digest, size, format):
+    # Serves a generated thumbnail, cacheable for good as its name changes with its content
+    path = images.thumbnail_path(digest, size, format)
+    if size not in settings.AUCTIONS_THUMBNAIL_SIZES or not os.path.exists(path):
+        raise Http404("Thumbnail does not exist")
+    response = FileResponse(open(path, "rb"), content_type=images.FORMATS[format][1])
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+def search(request):
+    # Ranked full-text search over active listings
+    query = request.GET.get('q', '').strip()
+    listings = search_listings(query, settings.AUCTIONS_SEARCH_RESULTS) if query else []
+
+    return render(request, "auctions/search.html", {
+        "listings": listings,
+        "query": query
+    })
+
 def login_view(request):
     if request.method == "POST":
 
@@ -180,25 +242,52 @@ def register(request):
 
 @login_required(login_url="/login")
 def user(request):
-    return render(request, "auctions/user.html")
+    # Retrieves all listings owned by the user, including closed listings
+    listings = Listing.objects.filter(owner_id=request.user.id).order_by('-active', 'title')
+
+    return render(request, "auctions/user.html", {
+        "listings": listings
+    })
 
 def categories(request):
-    # Retrieves category list and counts entries for each
-    categories = Category.objects.all().order_by("category")
-    counts = {}
-    for category in categories:
-        count = Listing.objects.filter(category_id=category.id, active=True).count()
-        counts.update({ category.id : count })
+    # Retrieves category list with active listing counts, cached between changes
+    categories = get_category_counts()
 
     return render(request, "auctions/categories.html", {
-        "categories": categories,
-        "counts": counts
+        "categories": categories
+    })
+
+def analytics_view(request):
+    # Closed auction figures per category, read from the rollup kept by the update_analytics command
+    stats, updated = analytics.category_report()
+
+    return render(request, "auctions/analytics.html", {
+        "stats": stats,
+        "updated": updated
+    })
+
+def bid_history(request, listing_id):
+    # Pages through a listing's bids, newest first
+    # Note: accepted bids only ever rise, so the (listing, -bid_amount) index is already newest first
+    listing = Listing.objects.filter(id=listing_id).only('id', 'title', 'current_price', 'bid_count', 'active').first()
+    if listing is None:
+        raise Http404("Listing does not exist")
+    paginator = KeysetPaginator(
+        Bid.objects.filter(listing_id=listing_id).select_related('user').only('id', 'bid_amount', 'timestamp', 'user__username'),
+        ("-bid_amount", "-id"),
+        settings.AUCTIONS_BIDS_PER_PAGE
+    )
+    bids = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+
+    return render(request, "auctions/bid_history.html", {
+        "listing": listing,
+        "bids": bids
     })
 
 @login_required(login_url="/login")
 def create(request):
     if request.method == "POST":
-        form = CreateListing(request.POST)
+        form = CreateListing(request.POST, request.FILES)
 
         if form.is_valid():
 
@@ -206,6 +295,11 @@ def create(request):
             category = None
             if form.cleaned_data["category"]:
                 category = form.cleaned_data["category"]
+
+            # Timed auctions record when they end
+            ends_at = None
+            if form.cleaned_data["duration"]:
+                ends_at = timezone.now() + timedelta(days=form.cleaned_data["duration"])
             
             listing = Listing.objects.create(
                 title=form.cleaned_data["title"], 
@@ -213,7 +307,12 @@ def create(request):
                 description=form.cleaned_data["description"], 
                 starting_bid=form.cleaned_data["starting_bid"], 
                 image_URL=form.cleaned_data["image_URL"], 
-                category_id=category)
+                category_id=category,
+                ends_at=ends_at)
+
+            # Uploads are stored now and thumbnailed by the process_images worker
+            if form.cleaned_data["image_file"]:
+                images.queue_upload(listing, form.cleaned_data["image_file"].read())
 
             return HttpResponseRedirect(reverse("auctions:listing", args=[listing.id]))
         else:
@@ -227,6 +326,57 @@ def create(request):
             "form": form
         })
 
+@login_required(login_url="/login")
+def import_listings(request):
+    if request.method == "POST":
+        form = ImportForm(request.POST, request.FILES)
+
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            format = form.cleaned_data["format"] or bulk.detect_format(upload.name)
+
+            # Rows are decoded and inserted as the upload is read, errors are listed up to a limit
+            errors = []
+            def on_error(line, message):
+                if len(errors) < settings.AUCTIONS_IMPORT_MAX_ERRORS:
+                    errors.append((line, message))
+
+            try:
+                rows = bulk.read_rows(codecs.iterdecode(upload, "utf-8-sig"), format)
+                report = bulk.import_listings(rows, request.user, on_error)
+            except (UnicodeDecodeError, csv.Error) as error:
+                messages.error(request, f"Error: Unreadable file ({error})", extra_tags="alert alert-danger")
+                return render(request, "auctions/import.html", {
+                    "form": form
+                })
+
+            return render(request, "auctions/import.html", {
+                "form": ImportForm(),
+                "report": report,
+                "errors": errors
+            })
+        else:
+            messages.error(request, "Error: Invalid submission", extra_tags="alert alert-danger")
+            return render(request, "auctions/import.html", {
+                "form": form
+            })
+    else:
+        return render(request, "auctions/import.html", {
+            "form": ImportForm()
+        })
+
+@user_passes_test(lambda user: user.is_staff, login_url="/login")
+def export(request, kind):
+    # Streams a whole table as CSV or JSON Lines without holding it in memory
+    format = request.GET.get("format", "csv")
+    if kind not in bulk.EXPORTS or format not in bulk.FORMATS:
+        raise Http404("Unknown export")
+
+    content_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(bulk.export_rows(kind, format), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{format}"'
+    return response
+
 @login_required(login_url="/login")
 def watchlist(request):
     user = request.user.id
@@ -249,63 +399,124 @@ def watchlist(request):
         return HttpResponseRedirect(reverse("auctions:listing", args=[request.POST["watchlist"]]))
 
     else:
-        user_object = User.objects.filter(id=user).get()
-        watchlist = user_object.watchlist.all()
+        # Retrieves watched listings, current bids are stored on each listing
+        watchlist = Listing.objects.filter(watchlist__user_id=user).select_related('image').order_by('title')
 
-        # Retrieve bids
-        bids = {}
-        for entry in watchlist:
-            bids.update(get_bid(entry.listing))
-        
         return render(request, "auctions/watchlist.html", {
-            "watchlist": watchlist,
-            "bids": bids
+            "watchlist": watchlist
         })
 
 def listing(request, listing_id):
 
+    # Anonymous GETs are served whole from the page cache when possible
+    # Note: pages with pending messages are personal, so are never cached
+    page_key = None
+    if request.method == "GET" and not request.user.is_authenticated and not messages.get_messages(request):
+        page_key = caching.listing_cache_key(listing_id, "page", caching.listing_page_query(request.GET))
+        content = caching.get_listing_page(page_key)
+        if content is not None:
+            return HttpResponse(content)
+
     # Initialises variables and forms for use in all routes
     # Initialised in order of requirement
     user = request.user.id
-    listing = Listing.objects.filter(id=listing_id).first()
+    listing = Listing.objects.select_related('leading_bid', 'image').filter(id=listing_id).first()
     if listing == None:
         messages.error(request, "Error: Listing does not exist", extra_tags="alert alert-danger")
         return HttpResponseRedirect(reverse("auctions:index"))
-    bid_item = Bid.objects.filter(listing=listing.id).order_by('-bid_amount').first()
-    if bid_item == None:
-        bid = listing.starting_bid
-    else:
-        bid = bid_item.bid_amount
-    watchlist = Watchlist.objects.filter(user_id=user, listing_id=listing).exists()
-    comments = Comment.objects.filter(listing_id=listing.id)
-    form_bid = BidForm(initial={"current_bid": bid, "listing_id": listing.id, "user_id": user})
+    bid_item = listing.leading_bid
+    bid = listing.current_price
+    watchlist = request.user.is_authenticated and Watchlist.objects.filter(user_id=user, listing_id=listing).exists()
+
+    # Shared page fragments are cached per listing version, user specific parts are not
+    listing_detail = caching.get_listing_fragment(
+        listing.id,
+        caching.listing_cache_key(listing.id, "detail"),
+        lambda: render_to_string("auctions/listing_detail.html", {"listing": listing})
+    )
+    comments_query = urlencode({
+        "after": request.GET.get('comments_after', ''),
+        "before": request.GET.get('comments_before', '')
+    })
+    listing_comments = caching.get_listing_fragment(
+        listing.id,
+        caching.listing_cache_key(listing.id, "comments", comments_query),
+        lambda: _render_comments(request, listing)
+    )
+    listing_detail = mark_safe(listing_detail)
+    listing_comments = mark_safe(listing_comments)
+    form_bid = BidForm()
+    form_proxy = ProxyBidForm()
     form_comment = CommentForm(initial={"listing_id": listing.id, "user_id": user})
 
     if request.method == "POST":
 
         # New bid path
         if "submit_bid" in request.POST:
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path(), login_url="/login")
             form = BidForm(request.POST)
 
+            # Bid is validated against the stored price within the update itself
             if form.is_valid():
-                Bid.objects.create(
-                    listing_id=form.cleaned_data["listing_id"],
-                    user_id=form.cleaned_data["user_id"],
-                    bid_amount=form.cleaned_data["bid_amount"]
-                )
-                return HttpResponseRedirect(reverse("auctions:listing", args=[listing.id]))
-            else:
-                form_bid = BidForm(request.POST)
-                return render(request, "auctions/listing.html", {
-                    "bid": bid,
-                    "bid_item": bid_item,
-                    "comments": comments,
-                    "listing": listing,
-                    "watchlist": watchlist,
-                    "form_bid": form_bid,
-                    "form_comment": form_comment
-                })
+                try:
+                    accept_bid(
+                        listing_id=listing.id,
+                        user_id=user,
+                        bid_amount=form.cleaned_data["bid_amount"]
+                    )
+                    return HttpResponseRedirect(reverse("auctions:listing", args=[listing.id]))
+                except BidRejected as error:
+                    form.add_error("bid_amount", error)
+                    listing.refresh_from_db()
+                    bid_item = listing.leading_bid
+                    bid = listing.current_price
+
+            form_bid = form
+            return render(request, "auctions/listing.html", {
+                "bid": bid,
+                "bid_item": bid_item,
+                "listing": listing,
+                "listing_detail": listing_detail,
+                "listing_comments": listing_comments,
+                "watchlist": watchlist,
+                "form_bid": form_bid,
+                "form_proxy": form_proxy,
+                "form_comment": form_comment
+            })
         
+        # New maximum bid path
+        elif "submit_proxy" in request.POST:
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path(), login_url="/login")
+            form = ProxyBidForm(request.POST)
+
+            if form.is_valid():
+                try:
+                    leading = place_proxy_bid(
+                        listing_id=listing.id,
+                        user_id=user,
+                        max_amount=form.cleaned_data["max_amount"]
+                    )
+                    if not leading:
+                        messages.warning(request, "Your maximum has been outbid", extra_tags="alert alert-warning")
+                    return HttpResponseRedirect(reverse("auctions:listing", args=[listing.id]))
+                except BidRejected as error:
+                    form.add_error("max_amount", error)
+
+            form_proxy = form
+            return render(request, "auctions/listing.html", {
+                "bid": bid,
+                "bid_item": bid_item,
+                "listing": listing,
+                "listing_detail": listing_detail,
+                "listing_comments": listing_comments,
+                "watchlist": watchlist,
+                "form_bid": form_bid,
+                "form_proxy": form_proxy,
+                "form_comment": form_comment
+            })
+
         # New comment path
         elif "submit_comment" in request.POST:
             form = CommentForm(request.POST)
@@ -321,10 +532,12 @@ def listing(request, listing_id):
                 return render(request, "auctions/listing.html", {
                     "bid": bid,
                     "bid_item": bid_item,
-                    "comments": comments,
                     "listing": listing,
+                    "listing_detail": listing_detail,
+                    "listing_comments": listing_comments,
                     "watchlist": watchlist,
                     "form_bid": form_bid,
+                    "form_proxy": form_proxy,
                     "form_comment": form_comment
                 })
         
@@ -334,17 +547,32 @@ def listing(request, listing_id):
                 messages.error(request, "Error: Unauthorised action", extra_tags="alert alert-danger")
                 return HttpResponseRedirect(reverse("auctions:listing", args=[listing.id]))
 
-            Listing.objects.filter(id=listing_id).update(active=False)
+            close_listing(listing.id)
             return HttpResponseRedirect(reverse("auctions:index"))
 
     # Get method
     else:
-        return render(request, "auctions/listing.html", {
+        response = render(request, "auctions/listing.html", {
             "bid": bid,
             "bid_item": bid_item,
-            "comments": comments,
             "listing": listing,
+            "listing_detail": listing_detail,
+            "listing_comments": listing_comments,
             "watchlist": watchlist,
             "form_bid": form_bid,
+            "form_proxy": form_proxy,
             "form_comment": form_comment
-        })
\ No newline at end of file
+        })
+        if page_key:
+            caching.set_listing_page(listing.id, page_key, response.content)
+        return response
+
+def _render_comments(request, listing):
+    # Renders one page of the listing's comments
+    paginator = KeysetPaginator(
+        Comment.objects.filter(listing_id=listing.id),
+        ("timestamp", "id"),
+        settings.AUCTIONS_COMMENTS_PER_PAGE
+    )
+    comments = paginator.page(after=request.GET.get('comments_after'), before=request.GET.get('comments_before'))
+    return render_to_string("auctions/listing_comments.html", {"comments": comments})
\ No newline at end of file
@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_handler = get_asgi_application()
+
+async def django_application(scope, receive, send):
+    # Gives each request its own thread for sync middleware, sessions and rendering
+    # Note: without this Django 3.1 runs that work for every request on one shared thread
+    async with ThreadSensitiveContext():
+        await django_handler(scope, receive, send)
+
+# Imported once Django is configured
+from auctions.events import event_stream_router
+
+application = event_stream_router(django_application)
@@ -23,15 +23,17 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = '6ps8j!crjgrxt34cqbqn7x&b3y%(fny8k8nh21+qa)%ws3fh!q'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Note: set AUCTIONS_DEBUG=0 in production, which also caches compiled templates
+DEBUG = os.environ.get('AUCTIONS_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+# Comma separated, needed once AUCTIONS_DEBUG=0
+ALLOWED_HOSTS = list(filter(None, os.environ.get('AUCTIONS_ALLOWED_HOSTS', '').split(',')))
 
 
 # Application definition
 
 INSTALLED_APPS = [
-    'auctions',
+    'auctions.apps.AuctionsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.middleware.PerformanceMiddleware',
+    'auctions.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,12 +56,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'commerce.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Standard Django templates, timed for the performance middleware
+        'BACKEND': 'auctions.templating.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are parsed once per process unless debugging, when edits must show up straight away
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -74,14 +85,113 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment, AUCTIONS_DB_ENGINE selects sqlite (default) or postgresql
+DATABASE_ENGINE = os.environ.get('AUCTIONS_DB_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('AUCTIONS_DB_NAME', 'commerce'),
+            'USER': os.environ.get('AUCTIONS_DB_USER', ''),
+            'PASSWORD': os.environ.get('AUCTIONS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('AUCTIONS_DB_HOST', ''),
+            'PORT': os.environ.get('AUCTIONS_DB_PORT', ''),
+            # Persistent connections, Django closes them once older than this or after an unrecoverable error
+            'CONN_MAX_AGE': int(os.environ.get('AUCTIONS_DB_CONN_MAX_AGE', 300)),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('AUCTIONS_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            # Connections are kept for a minute rather than opened per request, sparing the pragmas each time
+            'CONN_MAX_AGE': int(os.environ.get('AUCTIONS_DB_CONN_MAX_AGE', 60)),
+            # Seconds a writer waits for the lock before "database is locked"
+            'OPTIONS': {
+                'timeout': int(os.environ.get('AUCTIONS_DB_TIMEOUT', 20)),
+            },
+            # File-backed test database so concurrency tests can open one connection per thread
+            'TEST': {
+                'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+            },
+        }
+    }
+
+# Read replicas, AUCTIONS_DB_REPLICAS lists one SQLite file or PostgreSQL host per replica
+# Note: replicas mirror the primary in tests, and replication itself is left to the database
+AUCTIONS_DB_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('AUCTIONS_DB_REPLICAS', '').split(',')), 1):
+    location = {'NAME': replica} if DATABASE_ENGINE == 'sqlite' else {'HOST': replica}
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'}, **location)
+    AUCTIONS_DB_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['auctions.routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it writes
+AUCTIONS_REPLICA_PIN_SECONDS = 10
+AUCTIONS_REPLICA_PIN_COOKIE = 'auctions_primary'
+
+# Pragmas run on every new SQLite connection, AUCTIONS_SQLITE_TUNING=0 keeps SQLite's defaults
+AUCTIONS_SQLITE_PRAGMAS = {
+    'busy_timeout': 20000,
+    'mmap_size': 134217728,
+    'cache_size': -20000,
+    'temp_store': 'memory',
+} if os.environ.get('AUCTIONS_SQLITE_TUNING', '1') == '1' else {}
+
+# AUCTIONS_SQLITE_WAL=1 lets readers continue during a write, and NORMAL sync is still safe with WAL
+# Note: opt in, as the journal mode is stored in the database file and outlasts this process
+if os.environ.get('AUCTIONS_SQLITE_WAL', '0') == '1':
+    AUCTIONS_SQLITE_PRAGMAS = {'journal_mode': 'wal', 'synchronous': 'normal', **AUCTIONS_SQLITE_PRAGMAS}
+
+AUTH_USER_MODEL = 'auctions.User'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# AUCTIONS_CACHE_BACKEND and AUCTIONS_CACHE_LOCATION select a shared cache, e.g.
+# django.core.cache.backends.memcached.PyLibMCCache and 127.0.0.1:11211
+# Note: needed once there is more than one process, web workers or the close_expired_auctions,
+# process_images and import_listings commands, as listing version bumps only reach processes sharing the cache
+CACHE_BACKEND = os.environ.get('AUCTIONS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+SHARED_CACHE = CACHE_BACKEND != 'django.core.cache.backends.locmem.LocMemCache'
+
+# AUCTIONS_SESSION_CACHE_BACKEND and AUCTIONS_SESSION_CACHE_LOCATION do the same for sessions
+SESSION_CACHE_BACKEND = os.environ.get('AUCTIONS_SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+SHARED_SESSION_CACHE = SESSION_CACHE_BACKEND != 'django.core.cache.backends.locmem.LocMemCache'
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('AUCTIONS_CACHE_LOCATION', 'commerce'),
+        # Room for a card fragment per active listing alongside pages, the default of 300 churns
+        'OPTIONS': {} if SHARED_CACHE else {'MAX_ENTRIES': 20000},
+    },
+    # Session data for the cached_db and cache session engines
+    'sessions': {
+        'BACKEND': SESSION_CACHE_BACKEND,
+        'LOCATION': os.environ.get('AUCTIONS_SESSION_CACHE_LOCATION', 'sessions'),
     }
 }
 
-AUTH_USER_MODEL = 'auctions.User'
+# Sessions
+# https://docs.djangoproject.com/en/3.0/topics/http/sessions/
+
+# AUCTIONS_SESSION_ENGINE picks db, cached_db, cache or signed_cookies
+# Note: cached_db reads sessions from the cache and writes through to django_session,
+# signed_cookies keeps them in the client's cookie and never touches the database
+# Note: cached_db is the default only with a shared session cache, with a per-process locmem cache
+# other workers would keep serving a session as logged in after logout
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'AUCTIONS_SESSION_ENGINE', 'cached_db' if SHARED_SESSION_CACHE else 'db'
+)
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Flash messages travel in a cookie, so showing or storing one never loads or creates a session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -120,3 +230,81 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded originals and generated thumbnails, stored by content hash
+MEDIA_ROOT = os.environ.get('AUCTIONS_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+
+# Auctions
+
+# Page sizes for the keyset-paginated listing feeds and comment threads
+AUCTIONS_LISTINGS_PER_PAGE = 25
+AUCTIONS_COMMENTS_PER_PAGE = 20
+AUCTIONS_BIDS_PER_PAGE = 50
+
+# Seconds a closure must age before update_analytics folds it in, longer than any closing transaction
+AUCTIONS_ROLLUP_LAG = 60
+
+# Seconds cached listing pages and fragments live unless their version moves on
+# Note: kept short with the per-process default cache, where another process's bump is never seen
+AUCTIONS_LISTING_CACHE_TIMEOUT = int(os.environ.get('AUCTIONS_LISTING_CACHE_TIMEOUT', 60 * 60 * 24 if SHARED_CACHE else 60))
+
+# Longest the cached category counts live, changes invalidate them sooner
+AUCTIONS_CATEGORY_COUNTS_TTL = 60
+
+# Seconds each worker may reuse its category choices before reloading them
+AUCTIONS_CATEGORY_CHOICES_TTL = 300
+
+# Pub/sub backend for live listing events, and seconds between keepalives on idle streams
+# Note: InProcessBackend only reaches streams held by the process that published, so it suits a single
+# server process; with several workers set AUCTIONS_EVENT_BACKEND to a shared backend (subscribe, unsubscribe,
+# publish), or SSE clients on one worker miss bids placed on another
+AUCTIONS_EVENT_BACKEND = os.environ.get('AUCTIONS_EVENT_BACKEND', 'auctions.events.InProcessBackend')
+AUCTIONS_EVENT_KEEPALIVE = 15
+
+# Delivery backend for watchlist notifications, sent by the send_notifications worker
+# Note: FileBackend appends JSON lines to AUCTIONS_NOTIFICATION_FILE
+AUCTIONS_NOTIFICATION_BACKEND = 'auctions.notifications.ConsoleBackend'
+AUCTIONS_NOTIFICATION_FILE = os.environ.get('AUCTIONS_NOTIFICATION_FILE', os.path.join(BASE_DIR, 'notifications.log'))
+
+# Listing search backend, None picks SQLite FTS5 on SQLite and a LIKE fallback elsewhere
+AUCTIONS_SEARCH_BACKEND = None
+AUCTIONS_SEARCH_RESULTS = 50
+
+# Rows per bulk insert when importing listings, and rejected rows listed on the upload page
+AUCTIONS_IMPORT_CHUNK_SIZE = 500
+AUCTIONS_IMPORT_MAX_ERRORS = 100
+
+# Routes index, categories, listing and watchlist GETs to the async views in auctions/async_views.py
+# Note: only worth enabling under an ASGI server, WSGI runs each async view in its own event loop
+AUCTIONS_ASYNC_VIEWS = os.environ.get('AUCTIONS_ASYNC_VIEWS', '0') == '1'
+
+# Server-Timing headers on every response, and addresses allowed to scrape /metrics
+AUCTIONS_SERVER_TIMING = True
+AUCTIONS_METRICS_IPS = ['127.0.0.1', '::1']
+
+# Listing image thumbnails as (width, height) bounds, generated by the process_images worker
+# Note: thumbnails are cached for good, so rename a size when changing its bounds
+AUCTIONS_THUMBNAIL_SIZES = {
+    'card': (320, 240),
+    'detail': (960, 720),
+}
+AUCTIONS_THUMBNAIL_QUALITY = 80
+# Limits on fetched and uploaded originals, private hosts are only for local testing
+AUCTIONS_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+AUCTIONS_IMAGE_MAX_PIXELS = 40000000
+AUCTIONS_IMAGE_FETCH_TIMEOUT = 10
+AUCTIONS_IMAGE_MAX_ATTEMPTS = 3
+AUCTIONS_IMAGE_ALLOW_PRIVATE_HOSTS = False
+
+# Proxy bidding steps, as (from price, minimum increment) in ascending order
+AUCTIONS_BID_INCREMENTS = [
+    ('0.00', '0.05'),
+    ('1.00', '0.25'),
+    ('5.00', '0.50'),
+    ('25.00', '1.00'),
+    ('100.00', '2.50'),
+    ('250.00', '5.00'),
+    ('500.00', '10.00'),
+    ('1000.00', '25.00'),
+]